@@ -9,6 +9,10 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'filehost.settings_prod')
 
 app = Celery('filehost')
 
+# Как EXPIRY_WHEEL['interval'] и DELETION_QUEUE['interval'] в настройках
+EXPIRY_WHEEL_INTERVAL = float(os.environ.get('EXPIRY_WHEEL_INTERVAL', 10))
+DELETION_QUEUE_INTERVAL = float(os.environ.get('DELETION_QUEUE_INTERVAL', 30))
+
 # Using a string here means the worker doesn't have to serialize
 # the configuration object to child processes.
 app.config_from_object('django.conf:settings', namespace='CELERY')
@@ -38,6 +42,11 @@ app.conf.update(
     task_routes={
         'files.tasks.*': {'queue': 'files'},
         'files.tasks.cleanup_expired_files': {'queue': 'maintenance'},
+        'files.tasks.cleanup_expired_range': {'queue': 'maintenance'},
+        'files.tasks.maintain_file_partitions': {'queue': 'maintenance'},
+        'files.tasks.drain_expiry_wheel': {'queue': 'maintenance'},
+        'files.tasks.process_deletion_queue': {'queue': 'maintenance'},
+        'files.tasks.gc_media': {'queue': 'maintenance'},
     },
     
     # Queue configuration
@@ -59,14 +68,33 @@ app.conf.update(
     
     # Beat schedule (replaces cron)
     beat_schedule={
+        'drain-expiry-wheel': {
+            'task': 'files.tasks.drain_expiry_wheel',
+            'schedule': EXPIRY_WHEEL_INTERVAL,
+            # Пропущенный проход не нужен: его файлы заберет следующий
+            'options': {'expires': EXPIRY_WHEEL_INTERVAL},
+        },
+        'process-deletion-queue': {
+            'task': 'files.tasks.process_deletion_queue',
+            'schedule': DELETION_QUEUE_INTERVAL,
+            'options': {'expires': DELETION_QUEUE_INTERVAL},
+        },
         'cleanup-expired-files': {
             'task': 'files.tasks.cleanup_expired_files',
+            'schedule': 3600.0,  # Каждый час - страховка для файлов вне расписания
+        },
+        'maintain-file-partitions': {
+            'task': 'files.tasks.maintain_file_partitions',
             'schedule': 3600.0,  # Каждый час
         },
         'generate-sitemap': {
             'task': 'files.tasks.generate_sitemap',
             'schedule': 86400.0,  # Каждый день
         },
+        'gc-media': {
+            'task': 'files.tasks.gc_media',
+            'schedule': 86400.0,  # Каждый день
+        },
         'cleanup-old-logs': {
             'task': 'files.tasks.cleanup_old_logs',
             'schedule': 604800.0,  # Каждую неделю
@@ -54,19 +54,24 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'files.middleware.TracingMiddleware',  # Первым: корневой спан трейса запроса
+    'files.middleware.MetricsMiddleware',  # Учитывает время всех остальных
+    'files.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
+    # Наши middleware для безопасности
+    'files.middleware.AnonymousSessionMiddleware',  # Должен быть первым из наших
+    'files.middleware.SecurityHeadersMiddleware',
+    # Проверки до чтения тела запроса: должны стоять до CsrfViewMiddleware
+    'files.middleware.RateLimitMiddleware',
+    'files.middleware.UploadAdmissionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    # Наши middleware для безопасности
-    'files.middleware.AnonymousSessionMiddleware',  # Должен быть первым из наших
     'files.middleware.SecurityMonitoringMiddleware',
-    'files.middleware.RateLimitMiddleware',
-    'files.middleware.SecurityHeadersMiddleware',
 ]
 
 ROOT_URLCONF = 'filehost.urls'
@@ -166,6 +171,31 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 # Настройки для файлового хостинга
 MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', 25 * 1024 * 1024))  # 25 МБ в байтах
 FILE_EXPIRY_HOURS = int(os.getenv('FILE_EXPIRY_HOURS', 24))  # Время жизни файлов в часах
+DOWNLOAD_TOKEN_TTL = int(os.getenv('DOWNLOAD_TOKEN_TTL', 3600))  # Время жизни токена доступа к защищенному файлу (сек)
+
+# Допуск загрузок до чтения тела запроса (files.middleware.UploadAdmissionMiddleware)
+UPLOAD_BODY_OVERHEAD = int(os.getenv('UPLOAD_BODY_OVERHEAD', 64 * 1024))  # Запас на поля формы и границы multipart
+UPLOAD_MAX_CONCURRENT_PER_SESSION = int(os.getenv('UPLOAD_MAX_CONCURRENT_PER_SESSION', 2))
+UPLOAD_MAX_CONCURRENT_PER_IP = int(os.getenv('UPLOAD_MAX_CONCURRENT_PER_IP', 8))  # Общий лимит адреса (сессии за NAT, клиенты без cookie)
+UPLOAD_MIN_FREE_SPACE = int(os.getenv('UPLOAD_MIN_FREE_SPACE', 512 * 1024 * 1024))  # Свободное место, которое должно остаться после загрузки
+UPLOAD_SLOT_TIMEOUT = int(os.getenv('UPLOAD_SLOT_TIMEOUT', 600))  # Сек, страховка от зависших слотов загрузки
+
+# Хеширование паролей защищенных файлов (см. files/passwords.py)
+# Параметры подобраны командой benchmark_password_hashing: ~50 мс на хеш на одном ядре
+FILE_PASSWORD_HASHING = {
+    'algorithm': os.getenv('FILE_PASSWORD_ALGORITHM', 'auto'),  # auto | argon2 | scrypt
+    'workers': int(os.getenv('FILE_PASSWORD_WORKERS', 4)),  # Потоков хеширования на процесс
+    'argon2': {
+        'time_cost': int(os.getenv('FILE_PASSWORD_ARGON2_TIME_COST', 2)),
+        'memory_cost': int(os.getenv('FILE_PASSWORD_ARGON2_MEMORY_COST', 19456)),  # КиБ
+        'parallelism': int(os.getenv('FILE_PASSWORD_ARGON2_PARALLELISM', 1)),
+    },
+    'scrypt': {
+        'work_factor': int(os.getenv('FILE_PASSWORD_SCRYPT_N', 2 ** 14)),
+        'block_size': int(os.getenv('FILE_PASSWORD_SCRYPT_R', 8)),
+        'parallelism': int(os.getenv('FILE_PASSWORD_SCRYPT_P', 1)),
+    },
+}
 
 # Настройки для QR кодов
 QR_CODE_SIZE = int(os.getenv('QR_CODE_SIZE', 10))
@@ -173,8 +203,112 @@ QR_CODE_SIZE = int(os.getenv('QR_CODE_SIZE', 10))
 # Настройки безопасности и rate limiting
 RATE_LIMIT_UPLOAD = int(os.getenv('RATE_LIMIT_UPLOAD', 5))  # Максимум 5 загрузок в минуту
 RATE_LIMIT_API = int(os.getenv('RATE_LIMIT_API', 10))    # Максимум 10 API запросов в минуту
+RATE_LIMIT_DOWNLOAD = int(os.getenv('RATE_LIMIT_DOWNLOAD', 20))  # Максимум 20 скачиваний/просмотров в минуту
 RATE_LIMIT_WINDOW = int(os.getenv('RATE_LIMIT_WINDOW', 60)) # Окно времени в секундах
 
+# Переопределение политик RateLimitMiddleware по имени маршрута, например:
+# {'files:search_files': {'bucket': 'search', 'limit': 30, 'period': 60, 'methods': ['GET']}}
+RATE_LIMIT_POLICIES = {}
+
+# Доступ к /metrics (Prometheus): токен в заголовке Authorization: Bearer <METRICS_TOKEN>.
+# Без токена - по адресам METRICS_ALLOWED_IPS (только при доступе к приложению без прокси)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+
+# Профилирование запросов (files/profiling.py): доля выборки или заголовок X-Profile
+# с токеном из команды profile_token; результаты в админке (Файлы -> Профили запросов)
+PROFILING = {
+    'sample_rate': float(os.getenv('PROFILING_SAMPLE_RATE', 0)),  # Например, 0.001 = 0.1% запросов
+    'buffer_size': int(os.getenv('PROFILING_BUFFER_SIZE', 50)),  # Размер кольцевого буфера профилей
+    'ttl': 24 * 3600,  # Сколько хранится профиль (сек)
+    'token_ttl': 3600,  # Время жизни токена X-Profile (сек)
+    'max_queries': 200,  # Сохраняемых SQL запросов на профиль
+    'max_cache_calls': 200,  # Сохраняемых обращений к кешу на профиль
+    'top_functions': 40,  # Строк отчета cProfile
+}
+
+# Агрегация SQL запросов по отпечаткам и поиск N+1 (files/sqlstats.py, команда sql_report)
+SQL_STATS = {
+    'enabled': os.getenv('SQL_STATS_ENABLED', 'True').lower() == 'true',
+    'n_plus_one_threshold': int(os.getenv('SQL_STATS_N_PLUS_ONE', 5)),  # Повторов отпечатка за запрос
+    'flush_interval': 30,  # Как часто процесс сохраняет агрегаты в кеш (сек)
+    'ttl': 7 * 24 * 3600,  # Сколько хранятся агрегаты завершившихся процессов (сек)
+    'max_fingerprints': 500,  # Остальные отпечатки учитываются как 'other'
+}
+
+# Трассировка (files/tracing.py): спаны в формате OTLP/JSON в logs/traces.jsonl, команда trace_report
+TRACING = {
+    'enabled': os.getenv('TRACING_ENABLED', 'False').lower() == 'true',
+    'sample_rate': float(os.getenv('TRACING_SAMPLE_RATE', 1.0)),  # Доля трассируемых запросов
+    'service_name': os.getenv('TRACING_SERVICE_NAME', 'filehost'),
+    # Продолжать трейс из входящего заголовка traceparent (только за доверенным прокси)
+    'trust_incoming': os.getenv('TRACING_TRUST_INCOMING', 'False').lower() == 'true',
+}
+
+# Хранилище загруженных файлов: запись в хранилище попадает в трейс
+STORAGES = {
+    'default': {'BACKEND': 'files.storage.TracedFileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Отдача файлов при скачивании и просмотре (files/delivery.py, команда benchmark_delivery)
+FILE_DELIVERY = {
+    'strategy': os.getenv('FILE_DELIVERY', 'sendfile'),  # sendfile, iterate, memory или accel (nginx)
+    'accel_prefix': os.getenv('FILE_DELIVERY_ACCEL_PREFIX', '/protected-media/'),  # internal location nginx
+    'memory_max_file_size': int(os.getenv('FILE_DELIVERY_MEMORY_MAX_FILE', 1024 * 1024)),
+    'memory_max_bytes': int(os.getenv('FILE_DELIVERY_MEMORY_MAX_BYTES', 64 * 1024 * 1024)),  # На процесс
+    # Выбор стратегии заголовком X-Delivery-Strategy - только для бенчмарка
+    'benchmark': os.getenv('FILE_DELIVERY_BENCHMARK', 'False').lower() == 'true',
+}
+
+# Сборка мусора в MEDIA_ROOT: файлы без неудаленной записи File (files.media_gc, команда gc_media)
+MEDIA_GC = {
+    'min_age': int(os.getenv('MEDIA_GC_MIN_AGE', 3600)),  # Сек, более новые файлы не трогаются
+    'chunk_size': int(os.getenv('MEDIA_GC_CHUNK_SIZE', 500)),  # Имен на один запрос к БД
+    'workers': int(os.getenv('MEDIA_GC_WORKERS', 8)),  # Потоков удаления
+    'lease_ttl': 900,  # Сек, продлевается после каждой пачки
+}
+
+# Очередь физического удаления файлов, удаленных пользователем (files.deletion)
+DELETION_QUEUE = {
+    'interval': float(os.getenv('DELETION_QUEUE_INTERVAL', 30)),  # Сек между проходами
+    'batch_size': int(os.getenv('DELETION_QUEUE_BATCH_SIZE', 200)),
+    'max_batches': int(os.getenv('DELETION_QUEUE_MAX_BATCHES', 10)),  # Пачек за проход
+    'max_attempts': int(os.getenv('DELETION_QUEUE_MAX_ATTEMPTS', 10)),
+    'retry_delay': 30,  # Сек до первого повтора, далее вдвое больше
+    'max_retry_delay': 3600,
+}
+
+# Почасовая очистка истекших файлов: один координатор (аренда) и диапазоны id для воркеров (files.cleanup)
+CLEANUP = {
+    'lease_ttl': int(os.getenv('CLEANUP_LEASE_TTL', 300)),  # Сек, продлевается после каждой пачки
+    'range_size': int(os.getenv('CLEANUP_RANGE_SIZE', 10000)),  # id в одном диапазоне (задаче)
+    'batch_size': int(os.getenv('CLEANUP_BATCH_SIZE', 500)),  # Строк между контрольными точками
+    'state_ttl': 86400,  # Сек хранения прохода и контрольных точек в кеше
+}
+
+# Колесо истечения: удаление файлов в течение секунд после истечения (files.expiry)
+EXPIRY_WHEEL = {
+    'backend': os.getenv('EXPIRY_WHEEL_BACKEND', 'auto'),  # auto (Redis, если кеш Redis), redis или db
+    'interval': float(os.getenv('EXPIRY_WHEEL_INTERVAL', 10)),  # Сек между проходами
+    'batch_size': int(os.getenv('EXPIRY_WHEEL_BATCH_SIZE', 100)),
+    'max_batches': int(os.getenv('EXPIRY_WHEEL_MAX_BATCHES', 10)),  # Пачек за проход - ограничение всплеска I/O
+    'retry_delay': int(os.getenv('EXPIRY_WHEEL_RETRY_DELAY', 60)),  # Сек до повтора после ошибки удаления
+}
+
+# Секционирование files_file по дням expires_at (только PostgreSQL, см. files.partitions)
+FILE_PARTITIONING = {
+    'premake_days': int(os.getenv('FILE_PARTITION_PREMAKE_DAYS', 7)),  # На сколько дней вперед создавать секции
+    'grace_hours': float(os.getenv('FILE_PARTITION_GRACE_HOURS', 1)),  # Сколько ждать после истечения всех строк
+    'retention': os.getenv('FILE_PARTITION_RETENTION', 'detach'),  # detach - оставить таблицу для архива, drop - удалить
+    'lock_timeout_ms': int(os.getenv('FILE_PARTITION_LOCK_TIMEOUT_MS', 5000)),
+}
+
+# Доля записываемых событий безопасности для частых событий (files.security_events.log_event)
+SECURITY_EVENT_SAMPLING = {
+    'download_attempt': float(os.getenv('SECURITY_SAMPLE_DOWNLOAD_ATTEMPT', 0.1)),
+}
+
 # Настройки логирования безопасности
 LOGGING = {
     'version': 1,
@@ -185,11 +319,23 @@ LOGGING = {
             'style': '{',
             'datefmt': '%Y-%m-%d %H:%M:%S'
         },
+        'trace': {
+            'format': '{message}',
+            'style': '{',
+        },
     },
     'handlers': {
+        'traces_file': {
+            'level': 'INFO',
+            # Спаны OTLP/JSON, по одному на строку (files/tracing.py)
+            'class': 'files.security_events.BackgroundFileHandler',
+            'filename': 'logs/traces.jsonl',
+            'formatter': 'trace',
+        },
         'security_file': {
             'level': 'WARNING',
-            'class': 'logging.FileHandler',
+            # Запись в фоновом потоке пачками (files/security_events.py)
+            'class': 'files.security_events.BackgroundFileHandler',
             'filename': 'logs/security.log',
             'formatter': 'security',
         },
@@ -200,6 +346,11 @@ LOGGING = {
         },
     },
     'loggers': {
+        'tracing': {
+            'handlers': ['traces_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
         'security': {
             'handlers': ['security_file', 'security_console'],
             'level': 'WARNING',
@@ -210,9 +361,18 @@ LOGGING = {
 
 # Настройки для автоматического выполнения задач (cron)
 CRONJOBS = [
-    # Запускать очистку истекших файлов каждый час
+    # Удалять истекшие файлы по расписанию (колесо истечения) каждую минуту
+    ('* * * * *', 'django.core.management.call_command', ['drain_expiry_wheel']),
+
+    # Физически удалять файлы, удаленные пользователями (очередь удаления)
+    ('* * * * *', 'django.core.management.call_command', ['process_deletion_queue']),
+
+    # Почасовая очистка - страховка для файлов, не попавших в расписание
     ('0 * * * *', 'files.cron.cleanup_expired_files'),
     
+    # Сборка мусора в MEDIA_ROOT каждый день в 3:30
+    ('30 3 * * *', 'django.core.management.call_command', ['gc_media']),
+
     # Генерировать sitemap каждый день в 2:00 утра
     ('0 2 * * *', 'django.core.management.call_command', ['generate_sitemap']),
     
@@ -125,6 +125,15 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'security': {
+            'format': '[{asctime}] {levelname} {message}',
+            'style': '{',
+            'datefmt': '%Y-%m-%d %H:%M:%S'
+        },
+        'trace': {
+            'format': '{message}',
+            'style': '{',
+        },
     },
     'handlers': {
         'file': {
@@ -138,6 +147,18 @@ LOGGING = {
             'class': 'logging.StreamHandler',
             'formatter': 'simple',
         },
+        'security_file': {
+            'level': 'INFO',
+            'class': 'files.security_events.BackgroundFileHandler',
+            'filename': os.path.join(BASE_DIR, 'logs', 'security.log'),
+            'formatter': 'security',
+        },
+        'traces_file': {
+            'level': 'INFO',
+            'class': 'files.security_events.BackgroundFileHandler',
+            'filename': os.path.join(BASE_DIR, 'logs', 'traces.jsonl'),
+            'formatter': 'trace',
+        },
     },
     'root': {
         'handlers': ['console', 'file'],
@@ -154,6 +175,16 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'security': {
+            'handlers': ['security_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'tracing': {
+            'handlers': ['traces_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
@@ -1,7 +1,11 @@
 from django.contrib import admin
+from django.http import Http404
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.utils.html import format_html
 from django.utils import timezone
 from .models import File
+from .profiling import get_profile, list_profiles
 
 
 @admin.register(File)
@@ -16,19 +20,19 @@ class FileAdmin(admin.ModelAdmin):
     ]
     
     list_filter = [
-        'is_protected', 'created_at', 'expires_at'
+        'is_protected', 'file_type', 'created_at', 'expires_at'
     ]
     
     search_fields = ['code', 'filename', 'password']
     
     readonly_fields = [
-        'code', 'file_size', 'created_at', 'download_count', 
+        'code', 'file_size', 'file_type', 'mime_type', 'created_at', 'download_count', 
         'last_downloaded', 'qr_code_preview'
     ]
     
     fieldsets = (
         ('Основная информация', {
-            'fields': ('file', 'filename', 'code', 'file_size')
+            'fields': ('file', 'filename', 'code', 'file_size', 'file_type', 'mime_type')
         }),
         ('Безопасность', {
             'fields': ('password', 'is_protected')
@@ -72,6 +76,40 @@ class FileAdmin(admin.ModelAdmin):
         return "QR код не сгенерирован"
     qr_code_preview.short_description = 'Предварительный просмотр QR кода'
     
+    change_list_template = 'admin/files/file/change_list.html'
+    
+    def get_urls(self):
+        """Страницы профилей запросов (files.profiling)"""
+        urls = [
+            path('profiles/', self.admin_site.admin_view(self.profiles_view), name='files_request_profiles'),
+            path('profiles/<int:record_id>/', self.admin_site.admin_view(self.profile_detail_view),
+                 name='files_request_profile'),
+        ]
+        return urls + super().get_urls()
+    
+    def profiles_view(self, request):
+        """Список последних профилей из кольцевого буфера"""
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Профили запросов',
+            'opts': self.model._meta,
+            'profiles': list_profiles(),
+        }
+        return TemplateResponse(request, 'admin/files/request_profiles.html', context)
+    
+    def profile_detail_view(self, request, record_id):
+        """Подробности профиля: cProfile, SQL и обращения к кешу"""
+        profile = get_profile(record_id)
+        if profile is None:
+            raise Http404('Профиль вытеснен из буфера или истек')
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'Профиль #{record_id}',
+            'opts': self.model._meta,
+            'profile': profile,
+        }
+        return TemplateResponse(request, 'admin/files/request_profile.html', context)
+    
     def get_queryset(self, request):
         """Оптимизированный queryset с предзагрузкой связанных данных"""
         return super().get_queryset(request).select_related()
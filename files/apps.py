@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FilesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "files"
+
+    def ready(self):
+        from . import expiry  # noqa: F401 - постановка файлов в расписание удаления (post_save)
@@ -0,0 +1,158 @@
+"""
+Очистка истекших файлов: один координатор и параллельная обработка
+диапазонов id.
+
+Очистку запускают и django_crontab (CRONJOBS), и Celery beat, возможно на
+нескольких узлах. Координатор работает, только если получил аренду
+cleanup_coordinator (files.leases); остальные запуски сразу завершаются.
+
+Координатор фиксирует проход: время отсечения и диапазоны id истекших строк
+по CLEANUP['range_size']. Диапазоны он раздает задачам очереди maintenance
+(Celery) или обрабатывает сам. Каждый диапазон обрабатывается под своей
+арендой, и после каждой пачки его контрольная точка (последний id)
+сохраняется в кеше. Поэтому:
+- диапазон, который обрабатывает живой воркер, повторно не выдается;
+- диапазон упавшего воркера следующий координатор выдаст снова, и работа
+  продолжится с контрольной точки;
+- проход удаляется из кеша, когда обработаны все его диапазоны.
+"""
+
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .expiry import expire_file
+from .leases import Lease, held
+from .metrics import CLEANUP_FILES
+from .models import File
+
+logger = logging.getLogger(__name__)
+
+RUN_KEY = 'cleanup_run'
+COORDINATOR_LEASE = 'cleanup_coordinator'
+
+
+def plan_ranges(min_id, max_id, size):
+    """Диапазоны [start, end) по size id, покрывающие min_id..max_id"""
+    return [(start, min(start + size, max_id + 1)) for start in range(min_id, max_id + 1, size)]
+
+
+def _range_name(run_id, start):
+    return f'cleanup_range_{run_id}_{start}'
+
+
+def _checkpoint_key(run_id, start):
+    return f'cleanup_checkpoint_{run_id}_{start}'
+
+
+def _done_key(run_id, start):
+    return f'cleanup_done_{run_id}_{start}'
+
+
+def start_run(now):
+    """Новый проход по строкам, истекшим до now; None, если их нет"""
+    config = settings.CLEANUP
+    bounds = File.objects.filter(expires_at__lt=now, is_deleted=False).aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return None
+    run = {
+        'id': uuid.uuid4().hex[:12],
+        'cutoff': now,
+        'ranges': plan_ranges(bounds['first'], bounds['last'], config['range_size']),
+    }
+    cache.set(RUN_KEY, run, config['state_ttl'])
+    return run
+
+
+def pending_ranges(run):
+    """(необработанные диапазоны прохода, из них никем не обрабатываемые сейчас)"""
+    done = cache.get_many([_done_key(run['id'], start) for start, _ in run['ranges']])
+    remaining = [(start, end) for start, end in run['ranges'] if _done_key(run['id'], start) not in done]
+    busy = held(_range_name(run['id'], start) for start, _ in remaining)
+    return remaining, [(start, end) for start, end in remaining if _range_name(run['id'], start) not in busy]
+
+
+def cleanup_range(run_id, start, end, cutoff, runner):
+    """
+    Удаляет истекшие до cutoff файлы с id в [start, end) пачками по
+    CLEANUP['batch_size'] с контрольной точкой после каждой пачки.
+    Возвращает (удалено, ошибок) или None, если диапазон обрабатывает другой воркер
+    """
+    config = settings.CLEANUP
+    lease = Lease(_range_name(run_id, start), config['lease_ttl'])
+    if not lease.acquire():
+        return None
+    try:
+        checkpoint_key = _checkpoint_key(run_id, start)
+        last = cache.get(checkpoint_key, start - 1)
+        deleted = failed = 0
+        while True:
+            batch = list(
+                File.objects.filter(pk__gt=last, pk__lt=end, expires_at__lt=cutoff, is_deleted=False)
+                .order_by('pk')[:config['batch_size']]
+            )
+            for file_instance in batch:
+                try:
+                    expire_file(file_instance)
+                except Exception as e:
+                    # Файл останется неудаленным и попадет в следующий проход
+                    logger.error(f'Ошибка при удалении {file_instance.filename}: {e}')
+                    failed += 1
+                    CLEANUP_FILES.labels(runner, 'failed').inc()
+                    continue
+                deleted += 1
+                CLEANUP_FILES.labels(runner, 'deleted').inc()
+            if len(batch) < config['batch_size']:
+                break
+            last = batch[-1].pk
+            cache.set(checkpoint_key, last, config['state_ttl'])
+            if not lease.renew():
+                # Аренда истекла и перехвачена: диапазон продолжит другой воркер с контрольной точки
+                return deleted, failed
+        cache.set(_done_key(run_id, start), True, config['state_ttl'])
+        return deleted, failed
+    finally:
+        lease.release()
+
+
+def run_cleanup(runner, dispatch=None, now=None):
+    """
+    Проход координатора. dispatch(run, ranges) раздает диапазоны воркерам;
+    без него диапазоны обрабатываются в этом процессе. None, если аренду
+    координатора держит другой процесс
+    """
+    config = settings.CLEANUP
+    lease = Lease(COORDINATOR_LEASE, config['lease_ttl'])
+    if not lease.acquire():
+        return None
+    try:
+        run = cache.get(RUN_KEY)
+        remaining, ranges = pending_ranges(run) if run else ([], [])
+        if not remaining:
+            # Прошлый проход завершен - начинаем новый
+            run = start_run(now or timezone.now())
+            if run is None:
+                cache.delete(RUN_KEY)
+                return {'run': None, 'ranges': 0, 'deleted': 0, 'failed': 0}
+            ranges = run['ranges']
+
+        result = {'run': run['id'], 'ranges': len(ranges), 'deleted': 0, 'failed': 0}
+        if dispatch is not None:
+            dispatch(run, ranges)
+            return result
+
+        for start, end in ranges:
+            counts = cleanup_range(run['id'], start, end, run['cutoff'], runner)
+            if counts is not None:
+                result['deleted'] += counts[0]
+                result['failed'] += counts[1]
+            lease.renew()
+        if not pending_ranges(run)[0]:
+            cache.delete(RUN_KEY)
+        return result
+    finally:
+        lease.release()
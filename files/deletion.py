@@ -0,0 +1,88 @@
+"""
+Очередь физического удаления файлов.
+
+File.delete() только помечает запись удаленной и ставит пути файла и QR
+кода в очередь (PendingDeletion) - одна транзакция без обращений к
+хранилищу. process_queue() удаляет файлы пачками (задача Celery каждые
+DELETION_QUEUE['interval'] секунд или команда process_deletion_queue).
+Неудачные попытки повторяются с экспоненциальной задержкой. После
+max_attempts запись остается в очереди с последней ошибкой для разбора.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .metrics import CLEANUP_FILES
+from .models import File, PendingDeletion
+
+logger = logging.getLogger(__name__)
+
+
+def retry_delay(attempts):
+    """Задержка перед попыткой после attempts неудачных"""
+    config = settings.DELETION_QUEUE
+    return timedelta(seconds=min(config['retry_delay'] * 2 ** (attempts - 1), config['max_retry_delay']))
+
+
+def process_batch(now=None):
+    """
+    Удаляет из хранилища одну пачку наступивших элементов очереди.
+    Элементы, выбранные другим воркером, пропускаются. Возвращает (удалено, ошибок)
+    """
+    config = settings.DELETION_QUEUE
+    now = now or timezone.now()
+    storage = File._meta.get_field('file').storage
+    with transaction.atomic():
+        batch = list(
+            PendingDeletion.objects.select_for_update(skip_locked=True)
+            .filter(attempts__lt=config['max_attempts'], next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:config['batch_size']]
+        )
+        done, failed = [], []
+        for item in batch:
+            try:
+                storage.delete(item.name)
+            except Exception as e:
+                item.attempts += 1
+                item.next_attempt_at = now + retry_delay(item.attempts)
+                item.last_error = str(e)[:1000]
+                failed.append(item)
+                CLEANUP_FILES.labels('deletion_queue', 'failed').inc()
+                logger.warning(f'Не удалось удалить {item.name} (попытка {item.attempts}): {e}')
+                continue
+            done.append(item.pk)
+            CLEANUP_FILES.labels('deletion_queue', 'deleted').inc()
+        if done:
+            PendingDeletion.objects.filter(pk__in=done).delete()
+        if failed:
+            PendingDeletion.objects.bulk_update(failed, ['attempts', 'next_attempt_at', 'last_error'])
+    return len(done), len(failed)
+
+
+def process_queue(now=None):
+    """Обрабатывает до max_batches пачек; возвращает (удалено, ошибок)"""
+    config = settings.DELETION_QUEUE
+    deleted = failed = 0
+    for _ in range(config['max_batches']):
+        batch_deleted, batch_failed = process_batch(now)
+        deleted += batch_deleted
+        failed += batch_failed
+        if batch_deleted + batch_failed < config['batch_size']:
+            break
+    return deleted, failed
+
+
+def queue_stats(now=None):
+    """(в очереди, готовы к удалению, исчерпали попытки)"""
+    now = now or timezone.now()
+    max_attempts = settings.DELETION_QUEUE['max_attempts']
+    queued = PendingDeletion.objects.all()
+    return (
+        queued.count(),
+        queued.filter(attempts__lt=max_attempts, next_attempt_at__lte=now).count(),
+        queued.filter(attempts__gte=max_attempts).count(),
+    )
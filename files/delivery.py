@@ -0,0 +1,127 @@
+"""
+Отдача содержимого файлов (скачивание и просмотр).
+
+Стратегии (FILE_DELIVERY['strategy']):
+- sendfile - FileResponse; WSGI сервер с wsgi.file_wrapper (gunicorn) отдает
+  файл через sendfile без копирования через Python;
+- iterate - файл читается и отдается блоками в Python (так FileResponse
+  работает на серверах без wsgi.file_wrapper);
+- memory - файлы до memory_max_file_size из LRU кеша в памяти процесса,
+  больше - как sendfile;
+- accel - заголовок X-Accel-Redirect: файл из internal location отдает nginx,
+  воркер освобождается сразу после ответа.
+
+Стратегии сравниваются командой benchmark_delivery. При
+FILE_DELIVERY['benchmark'] стратегию можно выбрать заголовком запроса
+X-Delivery-Strategy, фактическая возвращается в одноименном заголовке ответа.
+"""
+
+import mimetypes
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+STRATEGIES = ('sendfile', 'iterate', 'memory', 'accel')
+CHUNK_SIZE = 64 * 1024
+
+
+class HotFileCache:
+    """LRU кеш содержимого небольших файлов, ограниченный суммарным размером"""
+
+    def __init__(self, max_bytes, max_file_size):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, field_file, size):
+        """Содержимое файла (с диска при промахе); имя загруженного файла не переиспользуется"""
+        key = (field_file.name, size)
+        with self._lock:
+            content = self._items.get(key)
+            if content is not None:
+                self._items.move_to_end(key)
+                return content
+        with field_file.open('rb') as f:
+            content = f.read()
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = content
+                self.size += len(content)
+                while self.size > self.max_bytes and self._items:
+                    _, evicted = self._items.popitem(last=False)
+                    self.size -= len(evicted)
+        return content
+
+
+_hot_cache = None
+
+
+def get_hot_cache():
+    global _hot_cache
+    if _hot_cache is None:
+        config = settings.FILE_DELIVERY
+        _hot_cache = HotFileCache(config['memory_max_bytes'], config['memory_max_file_size'])
+    return _hot_cache
+
+
+@receiver(setting_changed)
+def reset_hot_cache(*, setting, **kwargs):
+    global _hot_cache
+    if setting == 'FILE_DELIVERY':
+        _hot_cache = None
+
+
+def get_strategy(request):
+    config = settings.FILE_DELIVERY
+    if config['benchmark']:
+        requested = request.headers.get('X-Delivery-Strategy')
+        if requested in STRATEGIES:
+            return requested
+    return config['strategy']
+
+
+def _read_chunks(file_obj):
+    try:
+        while chunk := file_obj.read(CHUNK_SIZE):
+            yield chunk
+    finally:
+        file_obj.close()
+
+
+def file_response(request, file_instance, as_attachment, content_type=None):
+    """Ответ с содержимым файла по выбранной стратегии"""
+    strategy = get_strategy(request)
+    if strategy == 'memory' and file_instance.file_size > get_hot_cache().max_file_size:
+        strategy = 'sendfile'
+    filename = file_instance.filename
+
+    if strategy == 'sendfile':
+        # Без явного content_type FileResponse определяет его по имени (с учетом .gz, .bz2 и т.п.)
+        response = FileResponse(
+            file_instance.file.open('rb'), as_attachment=as_attachment, filename=filename, content_type=content_type,
+        )
+    else:
+        content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        if strategy == 'accel':
+            # Длину и тело выставит nginx; Content-Type и Content-Disposition он сохраняет
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = settings.FILE_DELIVERY['accel_prefix'] + quote(file_instance.file.name)
+        elif strategy == 'memory':
+            response = HttpResponse(get_hot_cache().get(file_instance.file, file_instance.file_size), content_type=content_type)
+        else:
+            response = StreamingHttpResponse(_read_chunks(file_instance.file.open('rb')), content_type=content_type)
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+
+    if strategy != 'accel':
+        response['Content-Length'] = file_instance.file_size
+    if settings.FILE_DELIVERY['benchmark']:
+        response['X-Delivery-Strategy'] = strategy
+    return response
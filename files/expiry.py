@@ -0,0 +1,186 @@
+"""
+Колесо истечения: удаление файлов в течение секунд после истечения срока
+вместо почасового прохода очистки.
+
+С Redis расписание - sorted set (id файла -> expires_at). Он заполняется при
+сохранении File (загрузка, редактирование, продление срока), а drain() часто
+и небольшими пачками атомарно забирает наступившие элементы одним Lua
+скриптом: несколько воркеров не получат один и тот же файл. Без Redis то же
+упорядоченное множество - индекс (is_deleted, expires_at) в БД.
+
+drain() вызывается задачей Celery каждые EXPIRY_WHEEL['interval'] секунд
+(или командой drain_expiry_wheel --loop). Почасовая очистка остается
+страховкой для файлов, не попавших в расписание (bulk_create, недоступность Redis).
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .metrics import CLEANUP_FILES
+from .models import File
+from .ratelimit import get_redis_client
+from .read_models import invalidate_recent_files
+
+logger = logging.getLogger(__name__)
+
+WHEEL_KEY = 'expiry_wheel'
+BACKENDS = ('auto', 'redis', 'db')
+
+CLAIM_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+
+
+class RedisWheel:
+    """Расписание в sorted set Redis"""
+
+    def __init__(self, client):
+        self.client = client
+        self.key = cache.make_and_validate_key(WHEEL_KEY)
+        self._claim = client.register_script(CLAIM_SCRIPT)
+
+    def schedule(self, entries):
+        """entries: {id файла: момент истечения}"""
+        if entries:
+            self.client.zadd(self.key, {str(pk): expires_at.timestamp() for pk, expires_at in entries.items()})
+
+    def unschedule(self, pk):
+        self.client.zrem(self.key, str(pk))
+
+    def claim(self, now, limit):
+        """Забирает из расписания до limit наступивших id"""
+        return [int(pk) for pk in self._claim(keys=[self.key], args=[now.timestamp(), limit])]
+
+    def pending(self, now):
+        """(всего в расписании, из них наступивших)"""
+        return self.client.zcard(self.key), self.client.zcount(self.key, '-inf', now.timestamp())
+
+    def clear(self):
+        self.client.delete(self.key)
+
+
+class DatabaseWheel:
+    """Без Redis: расписание - сами строки File по индексу (is_deleted, expires_at)"""
+
+    def schedule(self, entries):
+        pass
+
+    def unschedule(self, pk):
+        pass
+
+    def claim(self, now, limit):
+        return list(
+            File.objects.filter(is_deleted=False, expires_at__lte=now)
+            .order_by('expires_at')
+            .values_list('pk', flat=True)[:limit]
+        )
+
+    def pending(self, now):
+        live = File.objects.filter(is_deleted=False)
+        return live.count(), live.filter(expires_at__lte=now).count()
+
+    def clear(self):
+        pass
+
+
+_wheel = None
+
+
+def get_wheel():
+    global _wheel
+    if _wheel is None:
+        backend = settings.EXPIRY_WHEEL['backend']
+        if backend not in BACKENDS:
+            raise ImproperlyConfigured(f'EXPIRY_WHEEL_BACKEND: ожидается {", ".join(BACKENDS)}')
+        client = get_redis_client() if backend in ('auto', 'redis') else None
+        if backend == 'redis' and client is None:
+            logger.warning('EXPIRY_WHEEL_BACKEND=redis, но кеш не Redis: расписание в БД')
+        _wheel = RedisWheel(client) if client is not None else DatabaseWheel()
+    return _wheel
+
+
+def reset_wheel():
+    global _wheel
+    _wheel = None
+
+
+@receiver(post_save, sender=File)
+def schedule_expiry(sender, instance, update_fields=None, **kwargs):
+    """Ставит файл в расписание при сохранении (или снимает удаленный)"""
+    if update_fields is not None and not {'expires_at', 'is_deleted'} & set(update_fields):
+        return
+    try:
+        wheel = get_wheel()
+        if instance.is_deleted:
+            wheel.unschedule(instance.pk)
+        else:
+            wheel.schedule({instance.pk: instance.expires_at})
+    except Exception as e:
+        # Сохранение файла не должно падать из-за Redis: файл удалит почасовая очистка
+        logger.warning(f'Колесо истечения недоступно, файл {instance.code} не запланирован: {e}')
+
+
+def expire_file(file_instance):
+    """Удаляет файл и QR код с диска и помечает запись удаленной"""
+    for field_file in (file_instance.file, file_instance.qr_code):
+        if field_file:
+            field_file.storage.delete(field_file.name)
+    file_instance.is_deleted = True
+    file_instance.save(update_fields=['is_deleted'])
+    invalidate_recent_files(file_instance.session_id)
+
+
+def drain(now=None, wheel=None):
+    """
+    Удаляет наступившие по расписанию файлы пачками по batch_size, не больше
+    max_batches пачек за вызов. Возвращает число удаленных файлов
+    """
+    config = settings.EXPIRY_WHEEL
+    wheel = wheel or get_wheel()
+    deleted = 0
+    for _ in range(config['max_batches']):
+        current = now or timezone.now()
+        pks = wheel.claim(current, config['batch_size'])
+        if not pks:
+            break
+        # Срок мог быть продлен после постановки в расписание - тогда в нем уже новый элемент
+        for file_instance in File.objects.filter(pk__in=pks, is_deleted=False, expires_at__lte=current):
+            try:
+                expire_file(file_instance)
+            except Exception as e:
+                CLEANUP_FILES.labels('wheel', 'failed').inc()
+                logger.error(f'Ошибка при удалении {file_instance.filename}: {e}')
+                wheel.schedule({file_instance.pk: current + timedelta(seconds=config['retry_delay'])})
+                continue
+            deleted += 1
+            CLEANUP_FILES.labels('wheel', 'deleted').inc()
+        if len(pks) < config['batch_size']:
+            break
+    return deleted
+
+
+def rebuild(batch_size=1000):
+    """Заполняет расписание всеми неудаленными файлами (при включении Redis или после потери данных)"""
+    wheel = get_wheel()
+    wheel.clear()
+    entries = {}
+    count = 0
+    for pk, expires_at in File.objects.filter(is_deleted=False).values_list('pk', 'expires_at').iterator(batch_size):
+        entries[pk] = expires_at
+        if len(entries) >= batch_size:
+            wheel.schedule(entries)
+            count += len(entries)
+            entries = {}
+    wheel.schedule(entries)
+    return count + len(entries)
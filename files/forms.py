@@ -1,11 +1,21 @@
 from django import forms
 from django.conf import settings
 from .models import File
+from .passwords import check_file_password
+from .tracing import start_span
 import os
 from django.utils.translation import gettext_lazy as _
 
 
-class FileUploadForm(forms.ModelForm):
+class TracedFormMixin:
+    """Валидация формы (full_clean) в отдельном спане трассировки"""
+
+    def full_clean(self):
+        with start_span(f'{type(self).__name__}.full_clean'):
+            super().full_clean()
+
+
+class FileUploadForm(TracedFormMixin, forms.ModelForm):
     """
     Форма для загрузки файлов с поддержкой пароля и кастомного кода.
     """
@@ -96,7 +106,7 @@ class FileUploadForm(forms.ModelForm):
         return password
 
 
-class PasswordForm(forms.Form):
+class PasswordForm(TracedFormMixin, forms.Form):
     """
     Форма для ввода пароля при доступе к защищенному файлу.
     """
@@ -116,21 +126,17 @@ class PasswordForm(forms.Form):
         self.file_instance = file_instance
     
     def clean_password(self):
-        """Проверяет правильность пароля (поддержка старых незахешированных значений)"""
-        from django.contrib.auth.hashers import check_password
+        """Проверяет правильность пароля (старые и незахешированные значения перехешируются)"""
         password = self.cleaned_data.get('password')
         
         if self.file_instance:
-            stored = self.file_instance.password or ''
-            is_hashed = stored.startswith('pbkdf2_') or stored.startswith('argon2') or stored.startswith('bcrypt')
-            valid = check_password(password, stored) if is_hashed else (password == stored)
-            if not valid:
+            if not check_file_password(self.file_instance, password):
                 raise forms.ValidationError(_('Неверный пароль.'))
         
         return password
 
 
-class FileEditForm(forms.ModelForm):
+class FileEditForm(TracedFormMixin, forms.ModelForm):
     """
     Форма для редактирования информации о файле.
     """
@@ -0,0 +1,90 @@
+"""
+Распределенная аренда (lease) с TTL: задачу выполняет только получивший
+аренду процесс на любом узле.
+
+С Redis аренда - ключ SET NX PX со случайным токеном владельца; продление и
+освобождение - Lua скрипты, которые меняют ключ, только если токен совпадает
+(истекшую и перехваченную аренду старый владелец не продлит и не удалит).
+Без Redis то же через API кеша Django (cache.add атомарен в пределах бэкенда;
+для разработки и тестов).
+"""
+
+import uuid
+
+from django.core.cache import cache
+
+from .ratelimit import get_redis_client
+
+KEY_PREFIX = 'lease_'
+
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _key(name):
+    return f'{KEY_PREFIX}{name}'
+
+
+class Lease:
+    """Аренда name на ttl секунд; продлевать чаще, чем раз в ttl"""
+
+    def __init__(self, name, ttl):
+        self.name = name
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self.client = get_redis_client()
+
+    @property
+    def key(self):
+        key = _key(self.name)
+        return cache.make_and_validate_key(key) if self.client is not None else key
+
+    def acquire(self):
+        if self.client is not None:
+            return bool(self.client.set(self.key, self.token, nx=True, px=int(self.ttl * 1000)))
+        return cache.add(self.key, self.token, self.ttl)
+
+    def renew(self):
+        """Продлевает аренду; False - аренда потеряна (истекла и перехвачена)"""
+        if self.client is not None:
+            return bool(self.client.eval(RENEW_SCRIPT, 1, self.key, self.token, int(self.ttl * 1000)))
+        if cache.get(self.key) != self.token:
+            return False
+        cache.set(self.key, self.token, self.ttl)
+        return True
+
+    def release(self):
+        if self.client is not None:
+            self.client.eval(RELEASE_SCRIPT, 1, self.key, self.token)
+        elif cache.get(self.key) == self.token:
+            cache.delete(self.key)
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def held(names):
+    """Имена из names, аренда которых сейчас действует"""
+    names = list(names)
+    if not names:
+        return set()
+    client = get_redis_client()
+    if client is not None:
+        values = client.mget([cache.make_and_validate_key(_key(name)) for name in names])
+        return {name for name, value in zip(names, values) if value is not None}
+    found = cache.get_many([_key(name) for name in names])
+    return {name for name in names if _key(name) in found}
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from files.models import File, classify_file_type, sniff_mime_type
+
+
+class Command(BaseCommand):
+    help = 'Заполняет колонки file_type и mime_type для записей, созданных до их появления'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество записей, обновляемых одним запросом',
+        )
+        parser.add_argument(
+            '--sniff',
+            action='store_true',
+            help='Определять MIME тип по содержимому файла на диске (медленнее)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересчитать тип для всех записей, а не только незаполненных',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        sniff = options['sniff']
+
+        files = File.objects.all()
+        if not options['all']:
+            files = files.filter(file_type='')
+
+        # Идем по первичному ключу батчами: без OFFSET и без загрузки всей таблицы
+        last_pk = 0
+        updated = 0
+        while True:
+            batch = list(
+                files.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .only('pk', 'file', 'filename', 'mime_type')[:batch_size]
+            )
+            if not batch:
+                break
+
+            for file in batch:
+                file.file_type = classify_file_type(file.filename)
+                if sniff or not file.mime_type:
+                    file.mime_type = self.detect_mime_type(file, sniff)
+
+            File.objects.bulk_update(batch, ['file_type', 'mime_type'])
+            updated += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f'Обработано записей: {updated}')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Тип файла заполнен для {updated} записей')
+        )
+
+    def detect_mime_type(self, file, sniff):
+        """Определяет MIME тип по содержимому (если запрошено и файл есть на диске)"""
+        if sniff and file.file:
+            try:
+                with file.file.open('rb') as f:
+                    return sniff_mime_type(f, file.filename)
+            except (FileNotFoundError, ValueError):
+                pass
+        return sniff_mime_type(None, file.filename)
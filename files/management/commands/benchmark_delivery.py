@@ -0,0 +1,279 @@
+"""
+Команда бенчмарка отдачи файлов: пропускная способность, CPU сервера на ГБ и
+занятость воркеров для стратегий files.delivery при разных размерах файлов и
+числе одновременных клиентов
+"""
+
+import asyncio
+import json
+import math
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from files.delivery import STRATEGIES
+from files.models import File
+from load_engine import LatencyHistogram, aiohttp
+
+CODE_PREFIX = 'DLV'
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(value):
+    """'1K', '25M' или число байт"""
+    value = value.strip().upper()
+    if value and value[-1] in SIZE_UNITS:
+        return int(float(value[:-1]) * SIZE_UNITS[value[-1]])
+    return int(value)
+
+
+def format_size(size):
+    for unit in ('G', 'M', 'K'):
+        if size >= SIZE_UNITS[unit] and size % SIZE_UNITS[unit] == 0:
+            return f'{size // SIZE_UNITS[unit]}{unit}'
+    return str(size)
+
+
+def _proc_stat(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        # Имя процесса в скобках может содержать пробелы
+        return f.read().rsplit(')', 1)[1].split()
+
+
+def cpu_seconds(pids):
+    """
+    CPU (user + system) процессов pids и всех их потомков, включая завершенных
+    потомков (cutime/cstime) - gunicorn перезапускает воркеров. None, если /proc нет
+    """
+    if not pids or not os.path.isdir('/proc'):
+        return None
+    ticks = os.sysconf('SC_CLK_TCK')
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                children.setdefault(int(_proc_stat(entry)[1]), []).append(int(entry))
+            except (OSError, IndexError):
+                continue
+    total = 0
+    seen = set()
+    stack = list(pids)
+    while stack:
+        pid = stack.pop()
+        if pid in seen:
+            continue
+        seen.add(pid)
+        try:
+            fields = _proc_stat(pid)
+        except OSError:
+            continue
+        # utime, stime, cutime, cstime (поля 14-17 /proc/pid/stat)
+        total += sum(int(value) for value in fields[11:15])
+        stack.extend(children.get(pid, []))
+    return total / ticks
+
+
+def purge_files(queryset):
+    """Удаляет тестовые файлы с диска и записи из БД (File.delete только помечает запись удаленной)"""
+    for file_instance in queryset:
+        file_instance.file.delete(save=False)
+        file_instance.qr_code.delete(save=False)
+    queryset.delete()
+
+
+async def measure(url, strategy, concurrency, requests, timeout):
+    """Закрытая модель: concurrency клиентов скачивают файл, пока не выполнено requests запросов"""
+    total = LatencyHistogram()
+    ttfb = LatencyHistogram()
+    state = {'remaining': requests, 'bytes': 0, 'worker_time': 0.0}
+    errors = Counter()
+    seen = Counter()
+    headers = {'X-Delivery-Strategy': strategy}
+
+    async def client(session):
+        while state['remaining'] > 0:
+            state['remaining'] -= 1
+            started = time.perf_counter()
+            try:
+                async with session.get(url, headers=headers, allow_redirects=False) as response:
+                    first_byte = time.perf_counter() - started
+                    size = 0
+                    async for chunk in response.content.iter_chunked(256 * 1024):
+                        size += len(chunk)
+                    seen[response.headers.get('X-Delivery-Strategy', '?')] += 1
+                    if response.status != 200:
+                        errors[f'HTTP {response.status}'] += 1
+            except Exception as e:
+                errors[type(e).__name__] += 1
+                continue
+            elapsed = time.perf_counter() - started
+            total.record(elapsed)
+            ttfb.record(first_byte)
+            state['bytes'] += size
+            # Воркер занят до отдачи последнего байта; при accel - только до ответа с заголовками
+            state['worker_time'] += first_byte if strategy == 'accel' else elapsed
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        'elapsed': elapsed, 'bytes': state['bytes'], 'worker_time': state['worker_time'],
+        'total': total, 'ttfb': ttfb, 'errors': errors, 'seen': seen,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк стратегий отдачи файлов (files.delivery) против запущенного сервера с '
+        'FILE_DELIVERY_BENCHMARK=true и RATELIMIT_ENABLE = False. Тестовые файлы создаются в БД '
+        'и MEDIA_ROOT из настроек команды - это должны быть БД и каталог сервера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Сервер приложения (gunicorn)')
+        parser.add_argument(
+            '--proxy-url',
+            help='nginx перед сервером: через него идет стратегия accel (без него accel пропускается)',
+        )
+        parser.add_argument(
+            '--via-proxy',
+            action='store_true',
+            help='Все стратегии через --proxy-url, как в продакшене',
+        )
+        parser.add_argument(
+            '--strategies',
+            default=','.join(STRATEGIES),
+            help=f'Стратегии через запятую (по умолчанию {",".join(STRATEGIES)})',
+        )
+        parser.add_argument('--sizes', default='1K,16K,256K,1M,5M,25M', help='Размеры файлов (по умолчанию 1K..25M)')
+        parser.add_argument('--concurrency', default='1,8,32', help='Числа одновременных клиентов (по умолчанию 1,8,32)')
+        parser.add_argument(
+            '--bytes-per-run',
+            default='256M',
+            help='Сколько данных скачать в каждом прогоне, число запросов считается от размера (по умолчанию 256M)',
+        )
+        parser.add_argument('--min-requests', type=int, default=20, help='Минимум запросов в прогоне')
+        parser.add_argument('--max-requests', type=int, default=500, help='Максимум запросов в прогоне')
+        parser.add_argument(
+            '--server-pid',
+            type=int,
+            action='append',
+            default=[],
+            help='PID мастера gunicorn (и nginx): CPU на ГБ считается по ним и их потомкам (можно несколько)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Число воркеров сервера: занятость показывается в процентах',
+        )
+        parser.add_argument('--timeout', type=float, default=120, help='Таймаут запроса (сек)')
+        parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+        parser.add_argument('--keep', action='store_true', help='Не удалять тестовые файлы после прогона')
+
+    def handle(self, *args, **options):
+        if aiohttp is None:
+            raise CommandError('Для бенчмарка нужен aiohttp (pip install aiohttp)')
+        try:
+            sizes = [parse_size(size) for size in options['sizes'].split(',')]
+            levels = [int(level) for level in options['concurrency'].split(',')]
+            bytes_per_run = parse_size(options['bytes_per_run'])
+        except ValueError as e:
+            raise CommandError(f'Неверное значение: {e}')
+        strategies = options['strategies'].split(',')
+        unknown = set(strategies) - set(STRATEGIES)
+        if unknown:
+            raise CommandError(f'Неизвестные стратегии: {", ".join(sorted(unknown))}')
+        if 'accel' in strategies and not options['proxy_url']:
+            self.stdout.write(self.style.WARNING('accel пропущена: без --proxy-url файл отдавать некому'))
+            strategies.remove('accel')
+
+        files = self.create_files(sizes)
+        try:
+            results = self.run(files, strategies, levels, bytes_per_run, options)
+        finally:
+            if not options['keep']:
+                purge_files(File.objects.filter(pk__in=[f.pk for f in files.values()]))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
+
+    def create_files(self, sizes):
+        # Файлы прошлого прогона с --keep
+        purge_files(File.objects.filter(code__startswith=CODE_PREFIX))
+        files = {}
+        expires_at = timezone.now() + timedelta(days=1)
+        for index, size in enumerate(sizes):
+            file_instance = File(
+                filename=f'delivery_{format_size(size)}.bin', file_size=size,
+                code=f'{CODE_PREFIX}{index:03d}', expires_at=expires_at,
+            )
+            file_instance.file.save(file_instance.filename, ContentFile(os.urandom(size)), save=False)
+            file_instance.save()
+            files[size] = file_instance
+        return files
+
+    def run(self, files, strategies, levels, bytes_per_run, options):
+        self.stdout.write(
+            f'{"Стратегия":<10}{"Размер":>8}{"Клиентов":>10}{"Запросов":>10}{"rps":>9}{"МБ/с":>9}'
+            f'{"p50 мс":>9}{"p99 мс":>9}{"TTFB мс":>9}{"CPU с/ГБ":>10}{"Занятость":>11}{"Ошибок":>8}'
+        )
+        results = []
+        for strategy in strategies:
+            base = options['proxy_url'] if strategy == 'accel' or options['via_proxy'] else options['url']
+            for size, file_instance in files.items():
+                url = f'{base.rstrip("/")}/{file_instance.code}/download/'
+                requests = max(options['min_requests'], min(options['max_requests'], math.ceil(bytes_per_run / size)))
+                for level in levels:
+                    # Прогрев: соединения, кеш страниц ОС и (для memory) кеши всех воркеров
+                    warmup = asyncio.run(measure(url, strategy, level, level * 2, options['timeout']))
+                    self.check_strategy(strategy, warmup)
+                    cpu_before = cpu_seconds(options['server_pid'])
+                    run = asyncio.run(measure(url, strategy, level, requests, options['timeout']))
+                    cpu_after = cpu_seconds(options['server_pid'])
+                    results.append(self.report(strategy, size, level, requests, run, cpu_before, cpu_after, options))
+        return results
+
+    def check_strategy(self, strategy, run):
+        if run['errors']:
+            raise CommandError(f'Ошибки при прогреве {strategy}: {dict(run["errors"])}')
+        if '?' in run['seen']:
+            raise CommandError('Сервер не возвращает X-Delivery-Strategy: запустите его с FILE_DELIVERY_BENCHMARK=true')
+
+    def report(self, strategy, size, level, requests, run, cpu_before, cpu_after, options):
+        elapsed = run['elapsed'] or 1e-9
+        gigabytes = run['bytes'] / 1024 ** 3
+        cpu_per_gb = (cpu_after - cpu_before) / gigabytes if cpu_before is not None and gigabytes else None
+        busy_workers = run['worker_time'] / elapsed
+        # memory для больших файлов отдается как sendfile - показываем фактическую стратегию
+        actual = '/'.join(sorted(run['seen']))
+        result = {
+            'strategy': strategy,
+            'actual_strategy': actual,
+            'size': size,
+            'concurrency': level,
+            'requests': requests,
+            'errors': dict(run['errors']),
+            'rps': run['total'].count / elapsed,
+            'mb_per_second': run['bytes'] / 1024 ** 2 / elapsed,
+            'latency': run['total'].summary(),
+            'ttfb': run['ttfb'].summary(),
+            'cpu_seconds_per_gb': cpu_per_gb,
+            'busy_workers': busy_workers,
+        }
+        occupancy = f'{busy_workers / options["workers"] * 100:.0f}%' if options['workers'] else f'{busy_workers:.2f}'
+        self.stdout.write(
+            f'{strategy if actual == strategy else f"{strategy}>{actual}":<10}{format_size(size):>8}{level:>10}'
+            f'{requests:>10}{result["rps"]:>9.1f}{result["mb_per_second"]:>9.1f}'
+            f'{run["total"].percentile(50) * 1000:>9.1f}{run["total"].percentile(99) * 1000:>9.1f}'
+            f'{run["ttfb"].percentile(50) * 1000:>9.1f}'
+            f'{"-" if cpu_per_gb is None else f"{cpu_per_gb:.2f}":>10}{occupancy:>11}{sum(run["errors"].values()):>8}'
+        )
+        return result
@@ -0,0 +1,133 @@
+"""
+Бенчмарк хеширования паролей защищенных файлов.
+Измеряет время хеша для текущих и альтернативных параметров и задержку
+загрузки защищенного файла по сравнению с открытым.
+"""
+
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from files.passwords import (
+    FileArgon2PasswordHasher, FileScryptPasswordHasher, argon2_available, get_file_hasher,
+)
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк хеширования паролей файлов и задержки защищенных загрузок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=10,
+            help='Количество повторов каждого измерения',
+        )
+        parser.add_argument(
+            '--target-ms',
+            type=float,
+            default=50.0,
+            help='Целевое время одного хеша (мс) для подбора параметров',
+        )
+        parser.add_argument(
+            '--skip-uploads',
+            action='store_true',
+            help='Не измерять задержку загрузок',
+        )
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+
+        self.stdout.write(self.style.SUCCESS('=== Хеширование пароля файла ==='))
+        current = get_file_hasher()
+        self.report(f'Текущий ({current.algorithm})', self.time_hasher(current, iterations))
+        self.report('PBKDF2 (Django по умолчанию)', self.time_hasher(PBKDF2PasswordHasher(), iterations))
+
+        self.stdout.write(self.style.SUCCESS('\n=== Подбор параметров ==='))
+        self.suggest_scrypt(iterations, options['target_ms'])
+        if argon2_available():
+            self.suggest_argon2(iterations, options['target_ms'])
+        else:
+            self.stdout.write('argon2-cffi не установлен, Argon2id пропущен')
+
+        if not options['skip_uploads']:
+            self.stdout.write(self.style.SUCCESS('\n=== Задержка загрузки ==='))
+            self.benchmark_uploads(iterations)
+
+    def time_hasher(self, hasher, iterations):
+        """Время хеширования одного пароля (мс) для каждой итерации"""
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            hasher.encode('benchmark-password', hasher.salt())
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def report(self, label, timings):
+        self.stdout.write(
+            f'{label}: медиана {statistics.median(timings):.1f} мс, '
+            f'макс {max(timings):.1f} мс'
+        )
+
+    def suggest_scrypt(self, iterations, target_ms):
+        """Перебирает N для scrypt и показывает самый стойкий в пределах цели"""
+        best = None
+        for log_n in range(12, 18):
+            params = {**settings.FILE_PASSWORD_HASHING['scrypt'], 'work_factor': 2 ** log_n}
+            with override_settings(FILE_PASSWORD_HASHING={**settings.FILE_PASSWORD_HASHING, 'scrypt': params}):
+                timings = self.time_hasher(FileScryptPasswordHasher(), iterations)
+            self.report(f'scrypt N=2^{log_n}', timings)
+            if statistics.median(timings) <= target_ms:
+                best = log_n
+        if best is not None:
+            self.stdout.write(f'Рекомендуется FILE_PASSWORD_SCRYPT_N={2 ** best}')
+
+    def suggest_argon2(self, iterations, target_ms):
+        """Перебирает time_cost для Argon2id при фиксированной памяти"""
+        best = None
+        for time_cost in range(1, 6):
+            params = {**settings.FILE_PASSWORD_HASHING['argon2'], 'time_cost': time_cost}
+            with override_settings(FILE_PASSWORD_HASHING={**settings.FILE_PASSWORD_HASHING, 'argon2': params}):
+                timings = self.time_hasher(FileArgon2PasswordHasher(), iterations)
+            self.report(f'argon2id t={time_cost}', timings)
+            if statistics.median(timings) <= target_ms:
+                best = time_cost
+        if best is not None:
+            self.stdout.write(f'Рекомендуется FILE_PASSWORD_ARGON2_TIME_COST={best}')
+
+    def benchmark_uploads(self, iterations):
+        """
+        Сравнивает задержку загрузки открытого и защищенного файла через тестовый клиент.
+        Записи создаются в откатываемой транзакции, файлы - во временном MEDIA_ROOT.
+        """
+        results = {'public': [], 'protected': []}
+        allowed_hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            RATELIMIT_ENABLE=False, ALLOWED_HOSTS=allowed_hosts, MEDIA_ROOT=media_root
+        ):
+            client = Client()
+            for i in range(iterations):
+                for kind in results:
+                    data = {'file': SimpleUploadedFile(f'bench_{kind}_{i}.txt', b'0' * 10240)}
+                    if kind == 'protected':
+                        data['password'] = 'benchmark-password'
+                    with transaction.atomic():
+                        start = time.perf_counter()
+                        response = client.post(reverse('files:api_upload'), data)
+                        results[kind].append((time.perf_counter() - start) * 1000)
+                        transaction.set_rollback(True)
+                    if response.status_code != 200:
+                        self.stdout.write(self.style.ERROR(f'Загрузка ({kind}) вернула HTTP {response.status_code}'))
+
+        for kind, timings in results.items():
+            self.report(f'Загрузка 10KB ({kind})', timings)
+        overhead = statistics.median(results['protected']) - statistics.median(results['public'])
+        self.stdout.write(f'Стоимость пароля при загрузке: {overhead:.1f} мс')
@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
+from files.cleanup import run_cleanup
 from files.models import File
-import os
 
 
 class Command(BaseCommand):
@@ -38,28 +38,16 @@ class Command(BaseCommand):
             for file in expired_files:
                 self.stdout.write(f'  - {file.filename} (код: {file.code}, истек: {file.expires_at})')
         else:
-            # Удаляем файлы
-            for file in expired_files:
-                try:
-                    # Удаляем физический файл
-                    if file.file and os.path.exists(file.file.path):
-                        os.remove(file.file.path)
-                    
-                    # Удаляем QR код
-                    if file.qr_code and os.path.exists(file.qr_code.path):
-                        os.remove(file.qr_code.path)
-                    
-                    # Помечаем как удаленный
-                    file.is_deleted = True
-                    file.save()
-                    
-                    self.stdout.write(f'Удален файл: {file.filename} (код: {file.code})')
-                    
-                except Exception as e:
-                    self.stdout.write(
-                        self.style.ERROR(f'Ошибка при удалении {file.filename}: {e}')
-                    )
+            # Под арендой координатора: не пересекается с cron и Celery на других узлах
+            result = run_cleanup('command')
+            if result is None:
+                self.stdout.write(
+                    self.style.WARNING('Очистку сейчас выполняет другой процесс, повторите позже')
+                )
+                return
             
             self.stdout.write(
-                self.style.SUCCESS(f'Успешно удалено {count} истекших файлов')
-            ) 
\ No newline at end of file
+                self.style.SUCCESS(
+                    f'Успешно удалено {result["deleted"]} истекших файлов, ошибок: {result["failed"]}'
+                )
+            )
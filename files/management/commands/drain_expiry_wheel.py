@@ -0,0 +1,47 @@
+"""
+Команда удаления истекших файлов по расписанию (колесо истечения, files.expiry)
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from files.expiry import drain, get_wheel, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы, срок которых наступил, небольшими пачками (EXPIRY_WHEEL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Работать постоянно с паузой EXPIRY_WHEEL_INTERVAL между проходами (без Celery)',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Заново заполнить расписание всеми неудаленными файлами (после включения Redis)',
+        )
+        parser.add_argument('--stats', action='store_true', help='Показать размер расписания и выйти')
+
+    def handle(self, *args, **options):
+        wheel = get_wheel()
+        if options['rebuild']:
+            count = rebuild()
+            self.stdout.write(self.style.SUCCESS(f'В расписание добавлено файлов: {count}'))
+            return
+        if options['stats']:
+            total, due = wheel.pending(timezone.now())
+            self.stdout.write(f'{type(wheel).__name__}: в расписании {total}, наступило {due}')
+            return
+
+        while True:
+            deleted = drain(wheel=wheel)
+            if deleted or not options['loop']:
+                self.stdout.write(f'[{timezone.now():%Y-%m-%d %H:%M:%S}] Удалено файлов: {deleted}')
+            if not options['loop']:
+                return
+            time.sleep(settings.EXPIRY_WHEEL['interval'])
@@ -0,0 +1,55 @@
+"""
+Команда сборки мусора в MEDIA_ROOT (files.media_gc)
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from files.leases import Lease
+from files.media_gc import DIRECTORIES, gc_media
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из media/ файлы, на которые не ссылается ни одна неудаленная запись (uploads, QR коды, превью)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет удалено')
+        parser.add_argument(
+            '--directory',
+            action='append',
+            choices=list(DIRECTORIES),
+            help='Каталог для проверки (можно несколько раз; по умолчанию все)',
+        )
+        parser.add_argument('--min-age', type=int, help='Не трогать файлы моложе N секунд (MEDIA_GC_MIN_AGE)')
+        parser.add_argument('--chunk-size', type=int, help='Имен на один запрос к БД (MEDIA_GC_CHUNK_SIZE)')
+        parser.add_argument('--workers', type=int, help='Потоков удаления (MEDIA_GC_WORKERS)')
+
+    def handle(self, *args, **options):
+        lease = Lease('media_gc', settings.MEDIA_GC['lease_ttl'])
+        if not options['dry_run'] and not lease.acquire():
+            self.stdout.write(self.style.WARNING('Сборку мусора выполняет другой процесс'))
+            return
+        try:
+            results = gc_media(
+                directories=options['directory'],
+                dry_run=options['dry_run'],
+                min_age=options['min_age'],
+                chunk_size=options['chunk_size'],
+                workers=options['workers'],
+                lease=None if options['dry_run'] else lease,
+            )
+        finally:
+            if not options['dry_run']:
+                lease.release()
+
+        self.stdout.write(f'{"Каталог":<12} {"Проверено":>10} {"Сирот":>8} {"Удалено":>8} {"Ошибок":>8} {"МБ":>10}')
+        for stats in results:
+            self.stdout.write(
+                f'{stats.directory:<12} {stats.scanned:>10} {stats.orphans:>8} {stats.deleted:>8} '
+                f'{stats.failed:>8} {stats.reclaimed_bytes / 1024 / 1024:>10.2f}'
+            )
+        reclaimed = sum(stats.reclaimed_bytes for stats in results) / 1024 / 1024
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'DRY RUN: можно освободить {reclaimed:.2f} МБ'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Освобождено {reclaimed:.2f} МБ'))
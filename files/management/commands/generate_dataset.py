@@ -0,0 +1,273 @@
+"""
+Команда генерации синтетического набора файлов (миллионы строк File) для
+проверки планов запросов, очистки и поиска на объеме продакшена
+"""
+
+import contextlib
+import hashlib
+import io
+import multiprocessing
+import os
+import random
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from files.models import File, classify_file_type, sniff_mime_type
+from files.partitions import ensure_partitions
+from files.passwords import hash_password
+from load_engine import SCENARIOS, ZipfSampler
+
+# Синтетические файлы - с этим префиксом кода (настоящие коды - 6 цифр) и в этом каталоге
+CODE_PREFIX = 'G'
+PAYLOAD_DIR = 'uploads/dataset'
+DATASET_PASSWORD = 'dataset'
+
+
+def session_ids(seed, count):
+    """Идентификаторы сессий, одинаковые во всех процессах-генераторах"""
+    return [hashlib.sha256(f'{seed}:{index}'.encode()).hexdigest() for index in range(count)]
+
+
+def copy_value(value):
+    """Значение для COPY ... FROM STDIN в текстовом формате PostgreSQL"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+class DatasetGenerator:
+    """
+    Строки File с распределениями, похожими на продакшн: размеры и типы из
+    сценария production (load_engine), сессии по закону Ципфа (большинство
+    сессий - один-два файла), создание равномерно за history_days, срок жизни
+    FILE_EXPIRY_HOURS, истекшие файлы в основном уже удалены очисткой
+    """
+
+    def __init__(self, options, now, password_hash):
+        self.options = options
+        self.now = now
+        self.password_hash = password_hash
+        self.scenario = SCENARIOS['production']
+        self.sessions = session_ids(options['seed'], options['sessions'])
+        self.session_sampler = ZipfSampler(len(self.sessions), 1.0)
+        self.lifetime = timedelta(hours=settings.FILE_EXPIRY_HOURS)
+        self.history = options['history_days'] * 86400
+        self.mime_types = {}
+
+    def mime_type(self, filename):
+        ext = os.path.splitext(filename)[1]
+        if ext not in self.mime_types:
+            self.mime_types[ext] = sniff_mime_type(None, filename)
+        return self.mime_types[ext]
+
+    def build(self, index, rng):
+        filename, size = self.scenario.sample_file(rng)
+        code = f'{CODE_PREFIX}{index:09d}'
+        created_at = self.now - timedelta(seconds=rng.uniform(0, self.history))
+        expires_at = created_at + self.lifetime
+        expired = expires_at <= self.now
+        protected = rng.random() < self.options['protected_ratio']
+        # Популярность скачиваний - тяжелый хвост (Парето)
+        download_count = min(int(rng.paretovariate(1.2)) - 1, 100000)
+        last_downloaded = None
+        if download_count:
+            active = (min(expires_at, self.now) - created_at).total_seconds()
+            last_downloaded = created_at + timedelta(seconds=rng.uniform(0, active))
+        return File(
+            file=f'{PAYLOAD_DIR}/{code}{os.path.splitext(filename)[1]}',
+            filename=filename,
+            file_size=size,
+            code=code,
+            password=self.password_hash if protected else None,
+            is_protected=protected,
+            file_type=classify_file_type(filename),
+            mime_type=self.mime_type(filename),
+            session_id=self.sessions[self.session_sampler.sample(rng)],
+            created_at=created_at,
+            expires_at=expires_at,
+            download_count=download_count,
+            last_downloaded=last_downloaded,
+            is_deleted=expired and rng.random() < self.options['deleted_ratio'],
+        )
+
+
+@contextlib.contextmanager
+def keep_created_at():
+    """bulk_create не перезаписывает created_at (auto_now_add) текущим временем"""
+    field = File._meta.get_field('created_at')
+    auto_now_add = field.auto_now_add
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = auto_now_add
+
+
+def insert_copy(objs):
+    """Вставка батча через COPY (PostgreSQL): в разы быстрее INSERT"""
+    fields = [field for field in File._meta.concrete_fields if not field.primary_key]
+    buffer = io.StringIO()
+    for obj in objs:
+        buffer.write('\t'.join(copy_value(field.get_prep_value(getattr(obj, field.attname))) for field in fields))
+        buffer.write('\n')
+    buffer.seek(0)
+    sql = f'COPY {File._meta.db_table} ({", ".join(connection.ops.quote_name(f.column) for f in fields)}) FROM STDIN'
+    with connection.cursor() as cursor:
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, 'copy_expert'):  # psycopg2
+            raw_cursor.copy_expert(sql, buffer)
+        else:  # psycopg 3
+            with raw_cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def write_payloads(objs):
+    """Разреженные файлы нужного размера: место на диске почти не занимают"""
+    directory = os.path.join(settings.MEDIA_ROOT, PAYLOAD_DIR)
+    os.makedirs(directory, exist_ok=True)
+    for obj in objs:
+        if obj.is_deleted:
+            continue
+        with open(os.path.join(settings.MEDIA_ROOT, obj.file.name), 'wb') as f:
+            f.truncate(obj.file_size)
+
+
+def generate_range(start, end, options, now, password_hash):
+    """Генерирует и вставляет строки с индексами [start, end); выполняется в процессе-генераторе"""
+    generator = DatasetGenerator(options, now, password_hash)
+    rng = random.Random(f'{options["seed"]}:{start}')
+    use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+    batch_size = options['batch_size']
+    with keep_created_at():
+        for batch_start in range(start, end, batch_size):
+            objs = [generator.build(index, rng) for index in range(batch_start, min(batch_start + batch_size, end))]
+            with transaction.atomic():
+                if use_copy:
+                    insert_copy(objs)
+                else:
+                    File.objects.bulk_create(objs, batch_size=batch_size)
+            if options['payloads']:
+                write_payloads(objs)
+    return end - start
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует синтетические записи File (коды с префиксом G) с распределениями как в продакшене: '
+        'сессии, размеры, сроки, защищенные и удаленные файлы'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000, help='Сколько записей создать (по умолчанию 100000)')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Записей на один INSERT/COPY (по умолчанию 5000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Параллельных процессов-генераторов (на SQLite всегда 1)',
+        )
+        parser.add_argument('--sessions', type=int, help='Число анонимных сессий (по умолчанию count / 5)')
+        parser.add_argument(
+            '--history-days',
+            type=float,
+            default=30,
+            help='За сколько дней распределены даты создания (по умолчанию 30)',
+        )
+        parser.add_argument(
+            '--protected-ratio',
+            type=float,
+            default=0.1,
+            help=f'Доля защищенных паролем файлов, пароль "{DATASET_PASSWORD}" (по умолчанию 0.1)',
+        )
+        parser.add_argument(
+            '--deleted-ratio',
+            type=float,
+            default=0.95,
+            help='Доля истекших файлов, уже помеченных удаленными; остальные - невыполненная очистка (по умолчанию 0.95)',
+        )
+        parser.add_argument(
+            '--payloads',
+            action='store_true',
+            help=f'Создать на диске разреженные файлы нужного размера в MEDIA_ROOT/{PAYLOAD_DIR}',
+        )
+        parser.add_argument('--no-copy', action='store_true', help='Не использовать COPY на PostgreSQL')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора (по умолчанию 0)')
+        parser.add_argument(
+            '--purge',
+            action='store_true',
+            help='Удалить ранее сгенерированные записи и файлы вместо генерации',
+        )
+
+    def handle(self, *args, **options):
+        if options['purge']:
+            deleted, _ = File.objects.filter(code__startswith=CODE_PREFIX).delete()
+            shutil.rmtree(os.path.join(settings.MEDIA_ROOT, PAYLOAD_DIR), ignore_errors=True)
+            self.stdout.write(self.style.SUCCESS(f'Удалено сгенерированных записей: {deleted}'))
+            return
+
+        count = options['count']
+        if count <= 0 or options['batch_size'] <= 0:
+            raise CommandError('--count и --batch-size должны быть больше 0')
+        if count >= 10 ** 9:
+            raise CommandError('Не больше 999999999 записей (коды G + 9 цифр)')
+        if File.objects.filter(code__startswith=CODE_PREFIX).exists():
+            raise CommandError('Сгенерированные записи уже есть: сначала удалите их (--purge)')
+        options['sessions'] = options['sessions'] or max(1, count // 5)
+
+        workers = max(1, options['workers'])
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING('SQLite не поддерживает параллельную запись: используется 1 процесс'))
+            workers = 1
+
+        now = timezone.now()
+        password_hash = hash_password(DATASET_PASSWORD)
+        # Секционированная таблица (PostgreSQL): секции под весь диапазон expires_at
+        created = ensure_partitions(
+            now - timedelta(days=options['history_days']), now + timedelta(hours=settings.FILE_EXPIRY_HOURS),
+        )
+        if created:
+            self.stdout.write(f'Создано секций files_file: {len(created)}')
+        # Каждому процессу - несколько диапазонов, чтобы видеть прогресс и выровнять нагрузку
+        chunk = max(options['batch_size'], min(count // (workers * 4) or count, options['batch_size'] * 20))
+        ranges = [(start, min(start + chunk, count)) for start in range(0, count, chunk)]
+
+        started = time.monotonic()
+        if workers == 1:
+            results = (generate_range(start, end, options, now, password_hash) for start, end in ranges)
+            self.report(results, count, started)
+        else:
+            # Дочерние процессы (fork) не должны использовать соединения родителя
+            connections.close_all()
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as executor:
+                futures = [
+                    executor.submit(generate_range, start, end, options, now, password_hash)
+                    for start, end in ranges
+                ]
+                self.report((future.result() for future in futures), count, started)
+
+    def report(self, results, count, started):
+        done = 0
+        for inserted in results:
+            done += inserted
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'Создано записей: {done}/{count} ({done / elapsed:.0f} в сек)')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано {done} записей за {time.monotonic() - started:.1f} сек '
+            f'(коды {CODE_PREFIX}000000000-{CODE_PREFIX}{count - 1:09d})'
+        ))
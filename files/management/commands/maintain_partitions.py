@@ -0,0 +1,54 @@
+"""
+Команда обслуживания секций таблицы files_file (PostgreSQL): создание секций
+вперед и отсоединение секций, все строки которых истекли
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from files.partitions import expired_partitions, horizon_days, is_partitioned, list_partitions, maintain_partitions
+
+
+class Command(BaseCommand):
+    help = 'Создает дневные секции files_file вперед и отсоединяет истекшие (FILE_PARTITIONING)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Показать секции и то, что будет отсоединено, без изменений',
+        )
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            self.stdout.write(self.style.WARNING('Таблица files_file не секционирована (нужен PostgreSQL)'))
+            return
+
+        if options['dry_run']:
+            now = timezone.now()
+            with connection.cursor() as cursor:
+                partitions = list_partitions(cursor)
+            grace = timedelta(hours=settings.FILE_PARTITIONING['grace_hours'])
+            expired = {partition.name for partition in expired_partitions(partitions, now, grace)}
+            for partition in partitions:
+                start = partition.start.isoformat() if partition.start else 'MINVALUE'
+                mark = '  (будет отсоединена)' if partition.name in expired else ''
+                self.stdout.write(f'  {partition.name}: {start} - {partition.end.isoformat()}{mark}')
+            last = partitions[-1].end if partitions else now
+            if last < now + timedelta(days=horizon_days()):
+                self.stdout.write(f'Будут созданы секции до {(now + timedelta(days=horizon_days())).date()}')
+            return
+
+        result = maintain_partitions()
+        for name in result['created']:
+            self.stdout.write(f'Создана секция: {name}')
+        for archived in result['retired']:
+            action = 'удалена' if archived.dropped else 'отсоединена'
+            self.stdout.write(f'Секция {archived.name} {action}: файлов {archived.files_count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано секций: {len(result["created"])}, отсоединено: {len(result["retired"])}'
+        ))
@@ -0,0 +1,37 @@
+"""
+Команда обработки очереди физического удаления файлов (files.deletion)
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from files.deletion import process_queue, queue_stats
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из хранилища файлы, удаленные пользователями, пачками из очереди (DELETION_QUEUE)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Работать постоянно с паузой DELETION_QUEUE_INTERVAL между проходами (без Celery)',
+        )
+        parser.add_argument('--stats', action='store_true', help='Показать размер очереди и выйти')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            queued, due, exhausted = queue_stats()
+            self.stdout.write(f'В очереди: {queued}, готовы к удалению: {due}, исчерпали попытки: {exhausted}')
+            return
+
+        while True:
+            deleted, failed = process_queue()
+            if deleted or failed or not options['loop']:
+                self.stdout.write(f'[{timezone.now():%Y-%m-%d %H:%M:%S}] Удалено файлов: {deleted}, ошибок: {failed}')
+            if not options['loop']:
+                return
+            time.sleep(settings.DELETION_QUEUE['interval'])
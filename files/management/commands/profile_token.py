@@ -0,0 +1,21 @@
+"""
+Команда выдачи токена для профилирования запроса (заголовок X-Profile)
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from files.profiling import make_profile_token
+
+
+class Command(BaseCommand):
+    help = 'Выдает подписанный токен для заголовка X-Profile'
+
+    def handle(self, *args, **options):
+        token = make_profile_token()
+        ttl_minutes = settings.PROFILING['token_ttl'] // 60
+        self.stdout.write(token)
+        self.stderr.write(
+            f'Токен действует {ttl_minutes} мин. Пример: curl -H "X-Profile: {token}" https://0123.ru/\n'
+            'Профиль появится в админке: Файлы -> Профили запросов (id в заголовке ответа X-Profile-Id)'
+        )
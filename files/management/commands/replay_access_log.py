@@ -0,0 +1,292 @@
+"""
+Команда воспроизведения access лога gunicorn или nginx против локального
+экземпляра: исходные или ускоренные интервалы между запросами, синтез файлов
+для кодов из лога и сравнение задержек по маршрутам с записанными в логе
+"""
+
+import random
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from files.management.commands.security_monitor import parse_time
+from files.models import File
+from load_engine import LatencyHistogram, ReplayRequest, format_summary, make_payload, run_replay
+
+# access_log_format из gunicorn.conf.py и формат timed из nginx.conf (combined + $request_time)
+LINE_RE = re.compile(
+    r'^(?P<host>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<request>[^"]*)" (?P<status>\d{3}) (?P<bytes>\S+)'
+    r'(?: "[^"]*" "[^"]*")?(?: (?P<duration>\d+(?:\.\d+)?))?\s*$'
+)
+TIME_FORMAT = '%d/%b/%Y:%H:%M:%S %z'
+# gunicorn %(D)s - микросекунды, nginx $request_time - секунды с миллисекундами
+DURATION_UNITS = {'gunicorn': 1e-6, 'nginx': 1.0}
+UPLOAD_ROUTES = {'files:home', 'files:api_upload'}
+# Маршруты, по размеру ответа которых можно судить о размере файла
+FILE_BODY_ROUTES = {'files:download_file', 'files:view_file', 'files:direct_pdf_view'}
+DEFAULT_SKIP_PREFIXES = ('/static/', '/media/')
+
+
+def parse_line(line, log_format='auto'):
+    """Запись access лога: время, метод, путь, статус, байты ответа и длительность (сек или None)"""
+    match = LINE_RE.match(line)
+    if not match:
+        return None
+    parts = match.group('request').split()
+    if len(parts) != 3:
+        return None
+    try:
+        time = datetime.strptime(match.group('time'), TIME_FORMAT)
+    except ValueError:
+        return None
+    duration = match.group('duration')
+    if duration is not None:
+        unit_format = log_format if log_format != 'auto' else ('nginx' if '.' in duration else 'gunicorn')
+        duration = float(duration) * DURATION_UNITS[unit_format]
+    size = match.group('bytes')
+    return {
+        'time': time,
+        'method': parts[0],
+        'path': parts[1],
+        'status': int(match.group('status')),
+        'bytes': int(size) if size.isdigit() else 0,
+        'duration': duration,
+    }
+
+
+def route_of(path):
+    """Имя маршрута Django (files:file_detail) и код файла из пути"""
+    try:
+        match = resolve(urlsplit(path).path)
+    except Resolver404:
+        return 'other', None
+    return match.view_name, match.kwargs.get('code')
+
+
+def in_window(time, start, end):
+    def comparable(bound):
+        # Границы без часового пояса - во времени лога
+        return time.replace(tzinfo=None) if bound.tzinfo is None else time
+
+    return (start is None or comparable(start) >= start) and (end is None or comparable(end) < end)
+
+
+def schedule_offsets(entries):
+    """
+    Смещения начала запросов от первого. Время в логе - момент ответа с
+    точностью до секунды: запросы одной секунды равномерно распределяются
+    внутри нее, затем вычитается записанная длительность
+    """
+    per_second = Counter(entry['time'] for entry in entries)
+    seen = Counter()
+    origin = entries[0]['time']
+    offsets = []
+    for entry in entries:
+        index = seen[entry['time']]
+        seen[entry['time']] += 1
+        finished = (entry['time'] - origin).total_seconds() + (index + 0.5) / per_second[entry['time']]
+        offsets.append(finished - (entry['duration'] or 0.0))
+    first = min(offsets)
+    return [offset - first for offset in offsets]
+
+
+class Command(BaseCommand):
+    help = (
+        'Воспроизводит access лог gunicorn/nginx против локального экземпляра и сравнивает задержки '
+        'по маршрутам с записанными. Файлы для кодов из лога создаются в БД из настроек команды - '
+        'это должна быть БД экземпляра, на который идет нагрузка'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('log', nargs='+', help='Файлы access лога (в порядке времени)')
+        parser.add_argument(
+            '--url',
+            default='http://127.0.0.1:8000',
+            help='Экземпляр, на который воспроизводится нагрузка (по умолчанию http://127.0.0.1:8000)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['auto', 'gunicorn', 'nginx'],
+            default='auto',
+            help='Формат длительности: gunicorn %%(D)s в мкс или nginx $request_time в сек (по умолчанию auto)',
+        )
+        parser.add_argument(
+            '--speed',
+            type=float,
+            default=1.0,
+            help='Ускорение относительно исходных интервалов (2 - вдвое быстрее, по умолчанию 1)',
+        )
+        parser.add_argument('--start', help='Воспроизводить запросы начиная с этого времени (ISO)')
+        parser.add_argument('--end', help='Воспроизводить запросы до этого времени (ISO)')
+        parser.add_argument('--limit', type=int, help='Не больше указанного числа запросов')
+        parser.add_argument(
+            '--upload-size-kb',
+            type=float,
+            default=100,
+            help='Размер синтезируемого файла для POST загрузок - тело запроса в логе не записано (по умолчанию 100)',
+        )
+        parser.add_argument(
+            '--include-static',
+            action='store_true',
+            help='Воспроизводить и /static/, /media/ (обычно их отдает nginx)',
+        )
+        parser.add_argument(
+            '--no-synthesize',
+            action='store_true',
+            help='Не создавать файлы для кодов из лога',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только разобрать лог и показать записанные задержки по маршрутам',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Создавать файлы, даже если DEBUG выключен (команда не для продакшн БД)',
+        )
+        parser.add_argument('--max-in-flight', type=int, default=1000, help='Одновременных запросов')
+        parser.add_argument('--seed', type=int, help='Зерно генератора случайных чисел')
+
+    def handle(self, *args, **options):
+        if options['speed'] <= 0:
+            raise CommandError('--speed должен быть больше 0')
+        entries, stats = self.read_entries(options)
+        self.stdout.write(
+            f'Прочитано строк: {stats["lines"]}, к воспроизведению: {len(entries)}, '
+            f'пропущено: {stats["skipped"]}, не разобрано: {stats["unparsed"]}'
+        )
+        if not entries:
+            raise CommandError('В логе нет запросов для воспроизведения')
+
+        recorded = {}
+        for entry in entries:
+            if entry['duration'] is not None:
+                recorded.setdefault(entry['route'], LatencyHistogram()).record(entry['duration'])
+        if options['dry_run']:
+            self.show_comparison(entries, recorded, {})
+            return
+
+        if not options['no_synthesize']:
+            if not settings.DEBUG and not options['force']:
+                raise CommandError('DEBUG выключен: создание файлов в этой БД требует --force (или --no-synthesize)')
+            created = self.synthesize_files(entries)
+            self.stdout.write(f'Создано файлов для кодов из лога: {created}')
+
+        offsets = schedule_offsets(entries)
+        upload_size = int(options['upload_size_kb'] * 1024)
+        # Загрузки с формы главной страницы требуют CSRF токен - воспроизводятся через API загрузки
+        requests = [
+            ReplayRequest(offset, entry['route'], 'POST', '/api/upload/', upload_size)
+            if entry['method'] == 'POST' else
+            ReplayRequest(offset, entry['route'], entry['method'], entry['path'])
+            for offset, entry in zip(offsets, entries)
+        ]
+        span = max(offsets) / options['speed']
+        self.stdout.write(f'Воспроизведение {len(requests)} запросов за {span:.1f} сек на {options["url"]}...')
+        result = run_replay(
+            options['url'].rstrip('/'), requests, speed=options['speed'],
+            max_in_flight=options['max_in_flight'], seed=options['seed'],
+        )
+        self.stdout.write(format_summary(result.summary()))
+        self.show_comparison(entries, recorded, result.endpoints)
+
+    def read_entries(self, options):
+        start = parse_time(options['start'], datetime.now()) if options['start'] else None
+        end = parse_time(options['end'], datetime.now()) if options['end'] else None
+        skip_prefixes = () if options['include_static'] else DEFAULT_SKIP_PREFIXES
+        entries = []
+        stats = Counter(lines=0, skipped=0, unparsed=0)
+        for path in options['log']:
+            try:
+                f = open(path, encoding='utf-8', errors='replace')
+            except FileNotFoundError:
+                raise CommandError(f'Файл лога не найден: {path}')
+            with f:
+                for line in f:
+                    stats['lines'] += 1
+                    entry = parse_line(line, options['format'])
+                    if entry is None:
+                        stats['unparsed'] += 1
+                        continue
+                    if not in_window(entry['time'], start, end):
+                        continue
+                    entry['route'], entry['code'] = route_of(entry['path'])
+                    # Тела POST запросов в логе нет: воспроизводятся только загрузки (с синтезированным файлом)
+                    if entry['path'].startswith(skip_prefixes) or entry['method'] not in ('GET', 'HEAD', 'POST') or (
+                        entry['method'] == 'POST' and entry['route'] not in UPLOAD_ROUTES
+                    ):
+                        stats['skipped'] += 1
+                        continue
+                    entries.append(entry)
+        entries.sort(key=lambda entry: entry['time'])
+        if options['limit']:
+            entries = entries[:options['limit']]
+        return entries, stats
+
+    def synthesize_files(self, entries):
+        """
+        Файлы для кодов, которые в продакшене существовали (был ответ не 404):
+        размер - по наибольшему ответу со скачиванием, PDF - если код открывали
+        как PDF по короткой ссылке. Токены и пароли продакшена локально не
+        действительны, поэтому файлы создаются без пароля
+        """
+        codes = {}
+        for entry in entries:
+            code = entry['code']
+            if not code or len(code) > File._meta.get_field('code').max_length or entry['status'] == 404:
+                continue
+            info = codes.setdefault(code.upper(), {'size': 0, 'pdf': False})
+            if entry['route'] in FILE_BODY_ROUTES and entry['status'] == 200:
+                info['size'] = max(info['size'], entry['bytes'])
+            if entry['route'] == 'files:direct_pdf_view':
+                info['pdf'] = True
+
+        existing = set(File.objects.filter(code__in=codes).values_list('code', flat=True))
+        expires_at = timezone.now() + timedelta(hours=settings.FILE_EXPIRY_HOURS)
+        created = 0
+        for code, info in codes.items():
+            if code in existing:
+                continue
+            ext = 'pdf' if info['pdf'] else 'bin'
+            size = info['size'] or 10 * 1024
+            file_instance = File(
+                filename=f'replay_{code}.{ext}', file_size=size, code=code, expires_at=expires_at,
+            )
+            payload = make_payload(ext, size, random.Random(code))
+            file_instance.file.save(f'replay_{code}.{ext}', ContentFile(payload), save=False)
+            file_instance.save()
+            created += 1
+        return created
+
+    def show_comparison(self, entries, recorded, replayed):
+        counts = Counter(entry['route'] for entry in entries)
+        self.stdout.write('')
+        self.stdout.write(
+            f'{"Маршрут":<28}{"запросов":>9}  {"лог p50/p95/p99, мс":>24}  {"повтор p50/p95/p99, мс":>24}'
+            f'{"p99 x":>8}{"ошибок":>8}'
+        )
+        for route, count in counts.most_common():
+            log_hist = recorded.get(route)
+            stats = replayed.get(route)
+            line = f'{route:<28}{count:>9}  {self.format_percentiles(log_hist):>24}  '
+            line += f'{self.format_percentiles(stats.service_time if stats else None):>24}'
+            if log_hist and stats and log_hist.percentile(99):
+                line += f'{stats.service_time.percentile(99) / log_hist.percentile(99):>8.2f}'
+            else:
+                line += f'{"-":>8}'
+            line += f'{sum(stats.errors.values()) if stats else 0:>8}'
+            self.stdout.write(line)
+
+    @staticmethod
+    def format_percentiles(histogram):
+        if histogram is None or not histogram.count:
+            return '-'
+        return '/'.join(f'{histogram.percentile(q) * 1000:.1f}' for q in (50, 95, 99))
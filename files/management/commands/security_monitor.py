@@ -3,13 +3,28 @@
 Анализирует логи безопасности и выявляет подозрительную активность
 """
 
-from django.core.management.base import BaseCommand
-from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from files.ratelimit import scan_rate_limits, unblock
+from files.security_log import analyze_incremental, analyze_window, get_log_file
 import os
 import re
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import Counter, defaultdict
+
+DURATION_RE = re.compile(r'^(\d+)([smhd])$')
+DURATION_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days'}
+
+
+def parse_time(value, now):
+    """'15m', '2h', '7d' - относительно текущего времени, иначе ISO дата/время"""
+    match = DURATION_RE.match(value)
+    if match:
+        return now - timedelta(**{DURATION_UNITS[match.group(2)]: int(match.group(1))})
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Неверное время: {value} (ожидается 15m, 2h, 7d или ISO дата)')
 
 
 class Command(BaseCommand):
@@ -21,6 +36,24 @@ class Command(BaseCommand):
             action='store_true',
             help='Проверить логи безопасности',
         )
+        parser.add_argument(
+            '--since',
+            default='1h',
+            help='Начало окна анализа логов: 15m, 2h, 7d или ISO дата (по умолчанию 1h)',
+        )
+        parser.add_argument(
+            '--until',
+            help='Конец окна анализа логов: 15m, 2h, 7d или ISO дата (по умолчанию сейчас)',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Анализировать только строки, добавленные с прошлого запуска --incremental',
+        )
+        parser.add_argument(
+            '--log-file',
+            help='Путь к логу безопасности (по умолчанию из settings.LOGGING)',
+        )
         parser.add_argument(
             '--check-rate-limits',
             action='store_true',
@@ -31,6 +64,31 @@ class Command(BaseCommand):
             action='store_true',
             help='Очистить все rate limits',
         )
+        parser.add_argument(
+            '--unblock-ip',
+            action='append',
+            default=[],
+            metavar='IP',
+            help='Снять rate limits с IP (можно указать несколько раз)',
+        )
+        parser.add_argument(
+            '--bucket',
+            action='append',
+            default=[],
+            help='Ограничить --unblock-ip/--clear-rate-limits bucket политики (upload, api, download, view)',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=10,
+            help='Сколько IP показывать в --check-logs и --check-rate-limits',
+        )
+        parser.add_argument(
+            '--scan-batch',
+            type=int,
+            default=500,
+            help='Размер пачки SCAN/MGET при просмотре ключей Redis',
+        )
         parser.add_argument(
             '--summary',
             action='store_true',
@@ -39,20 +97,20 @@ class Command(BaseCommand):
     
     def handle(self, *args, **options):
         if options['check_logs']:
-            self.check_security_logs()
+            self.check_security_logs(options)
         elif options['check_rate_limits']:
-            self.check_rate_limits()
-        elif options['clear_rate_limits']:
-            self.clear_rate_limits()
+            self.check_rate_limits(options['top'], options['scan_batch'])
+        elif options['unblock_ip'] or options['clear_rate_limits']:
+            self.clear_rate_limits(options['unblock_ip'], options['bucket'], options['scan_batch'])
         elif options['summary']:
-            self.show_security_summary()
+            self.show_security_summary(options['scan_batch'])
         else:
             # По умолчанию показываем сводку
-            self.show_security_summary()
+            self.show_security_summary(options['scan_batch'])
     
-    def check_security_logs(self):
-        """Проверка логов безопасности"""
-        log_file = 'logs/security.log'
+    def check_security_logs(self, options):
+        """Проверка логов безопасности за окно времени или с прошлого запуска"""
+        log_file = options['log_file'] or get_log_file()
         
         if not os.path.exists(log_file):
             self.stdout.write(
@@ -64,91 +122,92 @@ class Command(BaseCommand):
             self.style.SUCCESS('=== Анализ логов безопасности ===')
         )
         
-        # Читаем последние 100 строк лога
-        with open(log_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()[-100:]
-        
-        # Анализируем логи
-        security_events = defaultdict(int)
-        ip_addresses = defaultdict(int)
-        suspicious_patterns = defaultdict(int)
-        
-        for line in lines:
-            if 'SECURITY_EVENT' in line:
-                security_events['total'] += 1
-                
-                # Извлекаем IP адрес
-                ip_match = re.search(r'IP: ([\d\.]+)', line)
-                if ip_match:
-                    ip = ip_match.group(1)
-                    ip_addresses[ip] += 1
-                
-                # Анализируем паттерны
-                if 'suspicious_request' in line:
-                    suspicious_patterns['suspicious_request'] += 1
-                elif 'rate_limit_exceeded' in line:
-                    suspicious_patterns['rate_limit_exceeded'] += 1
+        # Лог читается потоково: с конца до начала окна или от сохраненного смещения
+        if options['incremental']:
+            stats = analyze_incremental(log_file)
+            self.stdout.write('Новые записи с прошлого запуска')
+        else:
+            now = datetime.now()
+            since = parse_time(options['since'], now)
+            until = parse_time(options['until'], now) if options['until'] else None
+            stats = analyze_window(log_file, since=since, until=until)
+            self.stdout.write(f"Окно: {since:%Y-%m-%d %H:%M:%S} - {(until or now):%Y-%m-%d %H:%M:%S}")
         
         # Выводим статистику
-        self.stdout.write(f"Всего событий безопасности: {security_events['total']}")
-        self.stdout.write(f"Подозрительных запросов: {suspicious_patterns['suspicious_request']}")
-        self.stdout.write(f"Превышений rate limit: {suspicious_patterns['rate_limit_exceeded']}")
-        
-        if ip_addresses:
+        self.stdout.write(f"Записей в логе: {stats.lines}")
+        if stats.lines:
+            self.stdout.write(f"Период записей: {stats.first} - {stats.last}")
+            levels = ', '.join(f'{level}: {count}' for level, count in stats.levels.most_common())
+            self.stdout.write(f"По уровням: {levels}")
+        self.stdout.write(f"Всего событий безопасности: {stats.total_events}")
+        self.stdout.write(f"Подозрительных запросов: {stats.events['suspicious_request']}")
+        self.stdout.write(f"Превышений rate limit: {stats.events['rate_limit_exceeded']}")
+        
+        other_events = [(event, count) for event, count in stats.events.most_common()
+                        if event not in ('suspicious_request', 'rate_limit_exceeded')]
+        for event, count in other_events:
+            self.stdout.write(f"  {event}: {count}")
+        
+        top_ips = stats.ips.most_common(options['top'])
+        if top_ips:
             self.stdout.write("\nТоп IP адресов по активности:")
-            sorted_ips = sorted(ip_addresses.items(), key=lambda x: x[1], reverse=True)
-            for ip, count in sorted_ips[:5]:
+            for ip, count in top_ips:
                 self.stdout.write(f"  {ip}: {count} событий")
     
-    def check_rate_limits(self):
-        """Проверка текущих rate limits"""
+    def scan_rate_limits(self, batch_size):
+        try:
+            yield from scan_rate_limits(batch_size)
+        except NotImplementedError as e:
+            raise CommandError(str(e))
+
+    def check_rate_limits(self, top, batch_size):
+        """Проверка текущих rate limits (агрегаты по bucket и IP)"""
         self.stdout.write(
             self.style.SUCCESS('=== Текущие Rate Limits ===')
         )
         
-        # Получаем все ключи rate limiting из кэша
-        rate_limit_keys = []
-        for key in cache._cache.keys():
-            if key.startswith('rate_limit_'):
-                rate_limit_keys.append(key)
-        
-        if not rate_limit_keys:
+        # Ключи просматриваются потоково, в памяти только агрегаты
+        tracked = Counter()
+        blocked = Counter()
+        used_by_ip = Counter()
+        blocked_ips = defaultdict(set)
+        for state in self.scan_rate_limits(batch_size):
+            tracked[state.bucket] += 1
+            used_by_ip[state.ip] += state.used
+            if state.blocked:
+                blocked[state.bucket] += 1
+                blocked_ips[state.ip].add(state.bucket)
+        
+        if not tracked:
             self.stdout.write('Активных rate limits не найдено')
             return
         
-        # Группируем по типу
-        rate_limits = defaultdict(list)
-        for key in rate_limit_keys:
-            parts = key.split('_')
-            if len(parts) >= 4:
-                action_type = parts[2]
-                ip = parts[3]
-                count = cache.get(key, 0)
-                rate_limits[action_type].append((ip, count))
-        
         # Выводим статистику
-        for action_type, limits in rate_limits.items():
-            self.stdout.write(f"\n{action_type.upper()}:")
-            for ip, count in limits:
-                self.stdout.write(f"  {ip}: {count} запросов")
+        for bucket, count in tracked.most_common():
+            self.stdout.write(f"{bucket.upper()}: отслеживается IP: {count}, заблокировано: {blocked[bucket]}")
+        
+        self.stdout.write(f"\nТоп {top} IP по израсходованным запросам:")
+        for ip, used in used_by_ip.most_common(top):
+            marker = f" (заблокирован: {', '.join(sorted(blocked_ips[ip]))})" if ip in blocked_ips else ''
+            self.stdout.write(f"  {ip}: {used} запросов{marker}")
     
-    def clear_rate_limits(self):
-        """Очистка всех rate limits"""
+    def clear_rate_limits(self, ips, buckets, batch_size):
+        """Снятие rate limits: всех или для указанных IP/bucket"""
+        target = ', '.join(ips) if ips else 'всех IP'
         self.stdout.write(
-            self.style.WARNING('Очистка всех rate limits...')
+            self.style.WARNING(f'Очистка rate limits для {target}...')
         )
         
-        cleared_count = 0
-        for key in list(cache._cache.keys()):
-            if key.startswith('rate_limit_'):
-                cache.delete(key)
-                cleared_count += 1
+        try:
+            cleared_count = unblock(ips=ips, buckets=buckets, batch_size=batch_size)
+        except NotImplementedError as e:
+            raise CommandError(str(e))
         
         self.stdout.write(
             self.style.SUCCESS(f'Очищено {cleared_count} rate limits')
         )
     
-    def show_security_summary(self):
+    def show_security_summary(self, batch_size):
         """Показать краткую сводку безопасности"""
         self.stdout.write(
             self.style.SUCCESS('=== Сводка безопасности 0123.ru ===')
@@ -157,10 +216,11 @@ class Command(BaseCommand):
         # Проверяем настройки
         self.stdout.write(f"Rate limit загрузки: {getattr(settings, 'RATE_LIMIT_UPLOAD', 'не настроено')} запросов/мин")
         self.stdout.write(f"Rate limit API: {getattr(settings, 'RATE_LIMIT_API', 'не настроено')} запросов/мин")
+        self.stdout.write(f"Rate limit скачивания: {getattr(settings, 'RATE_LIMIT_DOWNLOAD', 'не настроено')} запросов/мин")
         self.stdout.write(f"Окно времени: {getattr(settings, 'RATE_LIMIT_WINDOW', 'не настроено')} сек")
         
         # Проверяем логи
-        log_file = 'logs/security.log'
+        log_file = get_log_file()
         if os.path.exists(log_file):
             log_size = os.path.getsize(log_file)
             self.stdout.write(f"Размер логов безопасности: {log_size} байт")
@@ -170,10 +230,7 @@ class Command(BaseCommand):
             )
         
         # Проверяем активные rate limits
-        rate_limit_count = 0
-        for key in cache._cache.keys():
-            if key.startswith('rate_limit_'):
-                rate_limit_count += 1
+        rate_limit_count = sum(1 for _ in self.scan_rate_limits(batch_size))
         
         self.stdout.write(f"Активных rate limits: {rate_limit_count}")
         
@@ -191,3 +248,4 @@ class Command(BaseCommand):
         
         self.stdout.write("\nИспользуйте --check-logs для анализа логов")
         self.stdout.write("Используйте --check-rate-limits для проверки rate limits")
+        self.stdout.write("Используйте --unblock-ip IP для снятия ограничений с IP")
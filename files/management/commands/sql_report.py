@@ -0,0 +1,86 @@
+"""
+Команда отчета по SQL запросам: отпечатки, доминирующие по времени БД, и N+1
+"""
+
+from django.core.management.base import BaseCommand
+
+from files.sqlstats import collect_stats, reset_stats
+
+SORT_FIELDS = ('total', 'count', 'avg', 'max', 'n_plus_one')
+
+
+class Command(BaseCommand):
+    help = 'Отчет по отпечаткам SQL запросов (files.sqlstats), суммированный по всем процессам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sort',
+            choices=SORT_FIELDS,
+            default='total',
+            help='Поле сортировки (по умолчанию total - суммарное время)',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=20,
+            help='Сколько отпечатков показать (по умолчанию 20)',
+        )
+        parser.add_argument(
+            '--view',
+            help='Только запросы этого view (например files:home или task:cleanup_expired_files)',
+        )
+        parser.add_argument(
+            '--n-plus-one',
+            action='store_true',
+            help='Только отпечатки, отмеченные как N+1',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить статистику (процессы начнут заново при следующем сохранении)',
+        )
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Статистика SQL обнулена'))
+            return
+
+        rows = collect_stats()
+        if options['view']:
+            rows = [row for row in rows if row['view'] == options['view']]
+        if options['n_plus_one']:
+            rows = [row for row in rows if row['n_plus_one']]
+        if not rows:
+            self.stdout.write('Нет данных (статистика сохраняется процессами раз в SQL_STATS[\'flush_interval\'] сек)')
+            return
+
+        total_time = sum(row['total'] for row in rows) or 1
+        self.show_views(rows)
+
+        field = options['sort']
+        rows.sort(key=lambda row: row[field], reverse=True)
+        self.stdout.write(f'\nТоп {options["top"]} отпечатков по {field}:')
+        for row in rows[:options['top']]:
+            marker = self.style.WARNING(f' N+1 x{row["n_plus_one"]}') if row['n_plus_one'] else ''
+            self.stdout.write(
+                f'\n  [{row["fingerprint_id"]}] {row["view"]}{marker}\n'
+                f'    запросов: {row["count"]}, всего: {row["total"] * 1000:.1f} мс '
+                f'({row["total"] / total_time:.1%}), среднее: {row["avg"] * 1000:.2f} мс, '
+                f'макс: {row["max"] * 1000:.2f} мс\n'
+                f'    {row["sql"][:500]}'
+            )
+
+    def show_views(self, rows):
+        """Время БД по view"""
+        views = {}
+        for row in rows:
+            count, total, n_plus_one = views.get(row['view'], (0, 0.0, 0))
+            views[row['view']] = (count + row['count'], total + row['total'], n_plus_one + row['n_plus_one'])
+
+        self.stdout.write('Время БД по view:')
+        for view, (count, total, n_plus_one) in sorted(views.items(), key=lambda item: item[1][1], reverse=True):
+            line = f'  {view}: {count} запросов, {total * 1000:.1f} мс'
+            if n_plus_one:
+                line += self.style.WARNING(f', N+1: {n_plus_one}')
+            self.stdout.write(line)
@@ -0,0 +1,145 @@
+"""
+Команда просмотра трейсов (logs/traces.jsonl, files.tracing):
+самые медленные запросы и дерево спанов отдельного трейса
+"""
+
+import heapq
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from files.management.commands.security_monitor import parse_time
+from files.security_log import iter_lines_reverse
+
+# Спаны пишутся при завершении; спаны трейса могут завершиться раньше корня на время запроса
+TRACE_SCAN_SLACK_NS = 10 * 60 * 10 ** 9
+
+
+def get_trace_file():
+    handler = settings.LOGGING.get('handlers', {}).get('traces_file', {})
+    return handler.get('filename', 'logs/traces.jsonl')
+
+
+def parse_span(line):
+    """Спан из строки экспорта OTLP/JSON или None для посторонних строк"""
+    if not line.startswith(b'{'):
+        return None
+    try:
+        resource_spans = json.loads(line)['resourceSpans'][0]
+        span = resource_spans['scopeSpans'][0]['spans'][0]
+    except (ValueError, KeyError, IndexError):
+        return None
+    span['start'] = int(span['startTimeUnixNano'])
+    span['end'] = int(span['endTimeUnixNano'])
+    span['duration_ms'] = (span['end'] - span['start']) / 10 ** 6
+    return span
+
+
+def iter_spans(path, since_ns=None):
+    """Спаны от последних к первым, до первого завершившегося раньше since_ns"""
+    for line in iter_lines_reverse(path):
+        span = parse_span(line)
+        if span is None:
+            continue
+        if since_ns is not None and span['end'] < since_ns:
+            return
+        yield span
+
+
+def format_attributes(span):
+    values = []
+    for attribute in span.get('attributes', []):
+        value = next(iter(attribute['value'].values()), '')
+        values.append(f'{attribute["key"]}={value}')
+    return ' '.join(values)
+
+
+class Command(BaseCommand):
+    help = 'Самые медленные трейсы и дерево спанов трейса (logs/traces.jsonl)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--trace-id',
+            help='Показать дерево спанов трейса (id из заголовка ответа X-Trace-Id)',
+        )
+        parser.add_argument(
+            '--slowest',
+            type=int,
+            default=10,
+            help='Сколько самых медленных корневых спанов показать (по умолчанию 10)',
+        )
+        parser.add_argument(
+            '--name',
+            help='Только корневые спаны, имя которых содержит строку (например files:api_upload)',
+        )
+        parser.add_argument(
+            '--since',
+            default='1h',
+            help='Начало окна: 15m, 2h, 7d или ISO дата (по умолчанию 1h)',
+        )
+        parser.add_argument(
+            '--file',
+            help='Путь к файлу трейсов (по умолчанию из settings.LOGGING)',
+        )
+
+    def handle(self, *args, **options):
+        path = options['file'] or get_trace_file()
+        since_ns = int(parse_time(options['since'], datetime.now()).timestamp() * 10 ** 9)
+        try:
+            if options['trace_id']:
+                self.show_trace(path, options['trace_id'], since_ns)
+            else:
+                self.show_slowest(path, options['slowest'], options['name'], since_ns)
+        except FileNotFoundError:
+            raise CommandError(f'Файл трейсов не найден: {path} (включите TRACING_ENABLED)')
+
+    def show_slowest(self, path, count, name, since_ns):
+        roots = (
+            span for span in iter_spans(path, since_ns)
+            if (not span.get('parentSpanId') or span['kind'] == 'SPAN_KIND_SERVER')
+            and (not name or name in span['name'])
+        )
+        slowest = heapq.nlargest(count, roots, key=lambda span: span['duration_ms'])
+        if not slowest:
+            self.stdout.write('Нет трейсов за указанный период')
+            return
+        for span in slowest:
+            started = datetime.fromtimestamp(span['start'] / 10 ** 9).strftime('%Y-%m-%d %H:%M:%S')
+            self.stdout.write(f'{span["duration_ms"]:10.1f} мс  {started}  {span["traceId"]}  {span["name"]}')
+
+    def show_trace(self, path, trace_id, since_ns):
+        spans = []
+        earliest = None
+        for span in iter_spans(path, since_ns):
+            if span['traceId'] == trace_id:
+                spans.append(span)
+                earliest = span['start'] if earliest is None else min(earliest, span['start'])
+            elif earliest is not None and span['end'] < earliest - TRACE_SCAN_SLACK_NS:
+                break
+        if not spans:
+            raise CommandError(f'Трейс {trace_id} не найден')
+
+        children = {}
+        ids = {span['spanId'] for span in spans}
+        for span in sorted(spans, key=lambda span: span['start']):
+            parent = span.get('parentSpanId')
+            children.setdefault(parent if parent in ids else None, []).append(span)
+
+        origin = min(span['start'] for span in spans)
+        self.stdout.write(f'Трейс {trace_id}: {len(spans)} спанов')
+        self.write_tree(children, None, origin, 0)
+
+    def write_tree(self, children, parent_id, origin, depth):
+        for span in children.get(parent_id, []):
+            offset_ms = (span['start'] - origin) / 10 ** 6
+            line = f'{offset_ms:9.1f} мс {span["duration_ms"]:9.1f} мс  {"  " * depth}{span["name"]}'
+            attributes = format_attributes(span)
+            if attributes:
+                line += f'  [{attributes}]'
+            status = span.get('status') or {}
+            if status.get('code') == 'STATUS_CODE_ERROR':
+                line = self.style.ERROR(f'{line}  {status.get("message", "")}')
+            self.stdout.write(line)
+            self.write_tree(children, span['spanId'], origin, depth + 1)
@@ -0,0 +1,147 @@
+"""
+Сборка мусора в MEDIA_ROOT: файлы, на которые не ссылается ни одна
+неудаленная запись File.
+
+Мусор остается от неудачных загрузок, упавших очисток и превью
+(previews/<код>.pdf), которые раньше ничем не удалялись. Каталоги читаются
+потоково через os.scandir, имена проверяются по БД пачками по chunk_size
+(один запрос IN на пачку), сироты пачки удаляются параллельно в пуле
+потоков. В памяти одновременно только одна пачка, поэтому память
+ограничена и при миллионах файлов.
+
+Файлы моложе min_age не трогаются: запись о только что загруженном файле
+еще может быть не сохранена.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from itertools import islice
+
+from django.conf import settings
+
+from .metrics import CLEANUP_FILES
+from .models import File
+
+# Каталог в MEDIA_ROOT -> поле File, в котором хранятся имена его файлов (None - превью по коду)
+DIRECTORIES = {
+    'uploads': 'file',
+    'qr_codes': 'qr_code',
+    'previews': None,
+}
+
+
+@dataclass
+class GCStats:
+    directory: str
+    scanned: int = 0
+    orphans: int = 0
+    deleted: int = 0
+    failed: int = 0
+    reclaimed_bytes: int = 0
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def scan(root, directory, min_mtime):
+    """
+    Файлы каталога directory (рекурсивно) старше min_mtime:
+    (имя в хранилище, путь, размер). Подкаталоги обходятся после файлов текущего
+    """
+    pending = [os.path.join(root, directory)]
+    while pending:
+        path = pending.pop()
+        try:
+            entries = os.scandir(path)
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime < min_mtime:
+                    name = os.path.relpath(entry.path, root).replace(os.sep, '/')
+                    yield name, entry.path, stat.st_size
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def live_names(field, names):
+    """
+    Имена из names, на которые ссылаются неудаленные записи (поле field).
+    Поиск по частичным индексам files_file_live_file_idx / files_file_live_qr_idx
+    """
+    return set(
+        File.objects.filter(is_deleted=False, **{f'{field}__in': names}).values_list(field, flat=True)
+    )
+
+
+def live_previews(names):
+    """Превью <код>.pdf неудаленных файлов"""
+    codes = {os.path.splitext(os.path.basename(name))[0].upper(): name for name in names}
+    live = File.objects.filter(is_deleted=False, code__in=list(codes)).values_list('code', flat=True)
+    return {codes[code] for code in live}
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        return e
+    return None
+
+
+def collect(directory, dry_run=False, min_age=None, chunk_size=None, executor=None, lease=None):
+    """Удаляет сирот одного каталога; возвращает GCStats"""
+    config = settings.MEDIA_GC
+    field = DIRECTORIES[directory]
+    min_age = config['min_age'] if min_age is None else min_age
+    stats = GCStats(directory)
+    remove = executor.map if executor is not None else map
+    entries = scan(settings.MEDIA_ROOT, directory, time.time() - min_age)
+    for chunk in chunked(entries, chunk_size or config['chunk_size']):
+        names = [name for name, _, _ in chunk]
+        live = live_names(field, names) if field else live_previews(names)
+        orphans = [(path, size) for name, path, size in chunk if name not in live]
+        stats.scanned += len(chunk)
+        stats.orphans += len(orphans)
+        if dry_run:
+            stats.reclaimed_bytes += sum(size for _, size in orphans)
+            continue
+        errors = remove(_remove, [path for path, _ in orphans])
+        for (_, size), error in zip(orphans, errors):
+            if error is None:
+                stats.deleted += 1
+                stats.reclaimed_bytes += size
+                CLEANUP_FILES.labels('media_gc', 'deleted').inc()
+            else:
+                stats.failed += 1
+                CLEANUP_FILES.labels('media_gc', 'failed').inc()
+        if lease is not None:
+            lease.renew()
+    return stats
+
+
+def gc_media(directories=None, dry_run=False, min_age=None, chunk_size=None, workers=None, lease=None):
+    """Сборка мусора по каталогам DIRECTORIES; список GCStats"""
+    workers = workers or settings.MEDIA_GC['workers']
+    with ThreadPoolExecutor(workers) as executor:
+        return [
+            collect(directory, dry_run, min_age, chunk_size, executor, lease)
+            for directory in directories or DIRECTORIES
+        ]
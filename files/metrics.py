@@ -0,0 +1,119 @@
+"""
+Метрики в формате Prometheus (эндпоинт /metrics).
+
+Собираются: время обработки запросов по view, число SQL запросов на запрос,
+объем загруженных и отданных данных, попадания в кеш по семействам ключей,
+время генерации QR кодов и PDF превью, результаты и длительность очистки,
+SQL запросы по отпечаткам (files.sqlstats).
+
+Несколько процессов (воркеры gunicorn, Celery): задайте переменную окружения
+PROMETHEUS_MULTIPROC_DIR - каждый процесс пишет значения в свои файлы в этом
+каталоге, а /metrics суммирует их по всем процессам. Каталог очищается при
+старте gunicorn (см. gunicorn.conf.py).
+
+Без prometheus_client метрики не собираются, а /metrics недоступен.
+"""
+
+import os
+from contextlib import contextmanager
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+
+class _NoopMetric:
+    """Заглушка метрики при отсутствии prometheus_client"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def set(self, value):
+        pass
+
+    @contextmanager
+    def time(self):
+        yield
+
+
+def _metric(kind, name, documentation, labelnames=(), **kwargs):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return getattr(prometheus_client, kind)(name, documentation, labelnames, **kwargs)
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_DURATION = _metric(
+    'Histogram', 'filehost_request_duration_seconds', 'Время обработки запроса',
+    ('view', 'method', 'status'), buckets=LATENCY_BUCKETS,
+)
+REQUEST_DB_QUERIES = _metric(
+    'Histogram', 'filehost_request_db_queries', 'Число SQL запросов на HTTP запрос',
+    ('view',), buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+UPLOADED_BYTES = _metric(
+    'Counter', 'filehost_uploaded_bytes', 'Принято байт в запросах загрузки', ('view',),
+)
+SERVED_BYTES = _metric(
+    'Counter', 'filehost_served_bytes', 'Отдано байт файлов и превью', ('view',),
+)
+CACHE_REQUESTS = _metric(
+    'Counter', 'filehost_cache_requests', 'Обращения к кешу по семействам ключей', ('family', 'result'),
+)
+QR_GENERATION = _metric(
+    'Histogram', 'filehost_qr_generation_seconds', 'Время генерации QR кода',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+PREVIEW_GENERATION = _metric(
+    'Histogram', 'filehost_preview_generation_seconds', 'Время конвертации документа в PDF превью',
+    ('result',), buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+CLEANUP_FILES = _metric(
+    'Counter', 'filehost_cleanup_files', 'Файлы, обработанные очисткой истекших', ('runner', 'result'),
+)
+CLEANUP_DURATION = _metric(
+    'Histogram', 'filehost_cleanup_duration_seconds', 'Длительность прохода очистки истекших файлов',
+    ('runner',), buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600),
+)
+SQL_QUERIES = _metric(
+    'Counter', 'filehost_sql_queries', 'SQL запросы по отпечаткам (files.sqlstats)', ('view', 'fingerprint'),
+)
+SQL_QUERY_SECONDS = _metric(
+    'Counter', 'filehost_sql_query_seconds', 'Суммарное время SQL запросов по отпечаткам', ('view', 'fingerprint'),
+)
+SQL_QUERY_MAX = _metric(
+    'Gauge', 'filehost_sql_query_max_seconds', 'Максимальное время SQL запроса по отпечатку',
+    ('view', 'fingerprint'), multiprocess_mode='max',
+)
+SQL_N_PLUS_ONE = _metric(
+    'Counter', 'filehost_sql_n_plus_one', 'Запросы с повторением одного отпечатка (N+1)', ('view', 'fingerprint'),
+)
+
+
+def record_cache(family, hit):
+    """Учитывает обращение к кешу семейства ключей (recent_files, home_stats, ...)"""
+    CACHE_REQUESTS.labels(family, 'hit' if hit else 'miss').inc()
+
+
+def render_metrics():
+    """
+    Возвращает (body, content_type) или None без prometheus_client.
+    В многопроцессном режиме значения суммируются по всем процессам.
+    """
+    if prometheus_client is None:
+        return None
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
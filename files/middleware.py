@@ -4,18 +4,160 @@ Middleware для rate limiting и мониторинга безопасност
 """
 
 import logging
+import math
+import os
 import secrets
 import hashlib
+import shutil
+import sys
+import time
+from django.db import connection
 from django.utils.deprecation import MiddlewareMixin
 from django.core.cache import cache
 from django.http import HttpResponse, JsonResponse
 from django.conf import settings
-from django.utils import timezone
-from django_ratelimit.core import is_ratelimited
-from django_ratelimit.exceptions import Ratelimited
+from django.urls import resolve, Resolver404
+from django.utils.translation import gettext as _
+from .ratelimit import limiter, get_policies, get_client_ip
+from .security_events import log_event
+from .metrics import REQUEST_DURATION, REQUEST_DB_QUERIES, UPLOADED_BYTES, SERVED_BYTES
+from .sqlstats import QueryStats, aggregator
+from .profiling import install_cache_instrumentation, profile_request, should_profile
+from .tracing import KIND_SERVER, NOOP_SPAN, begin_span, end_span, extract, traced
 
-# Настройка логирования для безопасности
-security_logger = logging.getLogger('security')
+# Маршруты загрузки файлов, для которых действует UploadAdmissionMiddleware
+UPLOAD_ROUTES = {'files:home', 'files:api_upload'}
+
+# Маршруты, отдающие содержимое файлов
+SERVE_ROUTES = {'files:download_file', 'files:view_file'}
+
+
+def _resolve(request):
+    """
+    Определяет маршрут запроса до вызова view (request.resolver_match еще не заполнен).
+    Результат сохраняется в запросе, чтобы не разбирать URL повторно.
+    """
+    if not hasattr(request, '_early_resolver_match'):
+        try:
+            request._early_resolver_match = resolve(request.path_info)
+        except Resolver404:
+            request._early_resolver_match = None
+    return request._early_resolver_match
+
+
+def _reject(match, message, status, retry_after=None):
+    """Ответ об отказе: JSON для API маршрутов, текст для остальных"""
+    if match.url_name.startswith('api_'):
+        response = JsonResponse({'success': False, 'error': message}, status=status)
+    else:
+        response = HttpResponse(message, status=status)
+    if retry_after is not None:
+        response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def _free_space(path):
+    """
+    Свободное место на разделе path. MEDIA_ROOT создается хранилищем при первом
+    сохранении, поэтому до него проверяем ближайший существующий родительский каталог.
+    None - место определить не удалось (загрузку не блокируем)
+    """
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    try:
+        return shutil.disk_usage(path).free
+    except OSError:
+        return None
+
+
+class TracingMiddleware:
+    """
+    Корневой спан HTTP запроса (files.tracing). Должен быть первым в MIDDLEWARE,
+    чтобы спаны остальных middleware и view были вложенными. Для трейсов из
+    выборки в ответ добавляется X-Trace-Id (для поиска командой trace_report).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        parent = None
+        if settings.TRACING['trust_incoming']:
+            parent = extract(request.META.get('HTTP_TRACEPARENT'))
+        span, token = begin_span(f'HTTP {request.method}', KIND_SERVER, {
+            'http.request.method': request.method,
+            'url.path': request.path,
+        }, parent)
+        if span is NOOP_SPAN:
+            try:
+                return self.get_response(request)
+            finally:
+                end_span(span, token)
+
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            match = getattr(request, 'resolver_match', None) or getattr(request, '_early_resolver_match', None)
+            if match:
+                span.name = f'HTTP {request.method} {match.view_name}'
+                span.set_attribute('http.route', match.view_name)
+            if response is not None:
+                span.set_attribute('http.response.status_code', response.status_code)
+                response['X-Trace-Id'] = span.context.trace_id
+            end_span(span, token, None if response is not None else sys.exc_info()[1])
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Метрики запросов (files.metrics): время обработки и число SQL запросов по view,
+    объем загрузок и отданных файлов, SQL запросы по отпечаткам (files.sqlstats).
+    Должен быть первым в MIDDLEWARE, чтобы учитывать и ответы, возвращенные
+    другими middleware (429, 413).
+    Для потоковых ответов время считается до начала передачи тела.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryStats()
+        start = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None) or getattr(request, '_early_resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        REQUEST_DURATION.labels(view, request.method, response.status_code).observe(duration)
+        REQUEST_DB_QUERIES.labels(view).observe(queries.count)
+        if settings.SQL_STATS['enabled']:
+            aggregator.add(view, queries)
+
+        if response.status_code < 400:
+            if request.method == 'POST' and view in UPLOAD_ROUTES:
+                UPLOADED_BYTES.labels(view).inc(int(request.META.get('CONTENT_LENGTH') or 0))
+            elif view in SERVE_ROUTES and response.has_header('Content-Length'):
+                SERVED_BYTES.labels(view).inc(int(response['Content-Length']))
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Профилирование выбранных запросов (files.profiling): доля PROFILING['sample_rate']
+    или запросы с подписанным заголовком X-Profile. Остальные запросы не замедляются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_cache_instrumentation()
+
+    def __call__(self, request):
+        if not should_profile(request):
+            return self.get_response(request)
+        return profile_request(request, self.get_response)
 
 
 class SecurityMonitoringMiddleware(MiddlewareMixin):
@@ -23,28 +165,123 @@ class SecurityMonitoringMiddleware(MiddlewareMixin):
     Middleware для мониторинга безопасности и логирования подозрительной активности.
     """
     
+    @traced('SecurityMonitoringMiddleware.process_request')
     def process_request(self, request):
         """Логируем подозрительные запросы"""
         # Логируем попытки доступа к защищенным файлам
         if 'download' in request.path and request.method == 'GET':
-            security_logger.info(f"Download attempt: {request.path} from {request.META.get('REMOTE_ADDR')}")
+            log_event('download_attempt', logging.INFO, IP=get_client_ip(request), path=request.path)
         
-        # Логируем загрузки файлов
-        if request.method == 'POST' and request.FILES:
-            security_logger.info(f"File upload: {request.path} from {request.META.get('REMOTE_ADDR')}")
+        # Логируем загрузки файлов (по Content-Type, без разбора тела запроса)
+        if request.method == 'POST' and request.content_type == 'multipart/form-data':
+            log_event('file_upload', logging.INFO, IP=get_client_ip(request), path=request.path)
         
         return None
 
 
 class RateLimitMiddleware(MiddlewareMixin):
     """
-    Дополнительный middleware для rate limiting (дублирует функционал декораторов).
+    Rate limiting по политикам маршрутов (files.ratelimit.get_policies).
+    Проверка выполняется один раз на запрос до чтения тела: одним Lua вызовом
+    в Redis или через кеш Django, если Redis не используется.
+    Должен стоять в MIDDLEWARE до CsrfViewMiddleware, который разбирает POST.
     """
     
     def process_request(self, request):
-        # Основной rate limiting уже реализован через декораторы
+        if not getattr(settings, 'RATELIMIT_ENABLE', True):
+            return None
+
+        match = _resolve(request)
+        policy = get_policies().get(match.view_name) if match else None
+        if policy is None or request.method not in policy.methods:
+            return None
+
+        ip = get_client_ip(request)
+        allowed, retry_after = limiter.check(policy, ip)
+        if allowed:
+            return None
+
+        log_event('rate_limit_exceeded', IP=ip, route=match.view_name, bucket=policy.bucket)
+        return _reject(match, _('Слишком много запросов. Попробуйте позже.'), 429, retry_after)
+
+
+class UploadAdmissionMiddleware(MiddlewareMixin):
+    """
+    Допуск загрузок до чтения тела запроса.
+
+    По заголовкам отклоняет загрузки, которые все равно будут отвергнуты:
+    слишком большой Content-Length (413), превышение числа одновременных
+    загрузок с IP адреса или сессии (429) и нехватка места в MEDIA_ROOT (507).
+    Клиент без cookie сессии получает новый идентификатор на каждый запрос,
+    поэтому его загрузки считаются по IP адресу.
+    Должен стоять в MIDDLEWARE до CsrfViewMiddleware и до любого обращения
+    к request.POST / request.FILES.
+    """
+
+    def process_request(self, request):
+        if request.method != 'POST':
+            return None
+
+        match = _resolve(request)
+        if match is None or match.view_name not in UPLOAD_ROUTES:
+            return None
+
+        ip = get_client_ip(request)
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return _reject(match, _('Неверный запрос.'), 400)
+
+        # Кроме файла тело содержит остальные поля формы и границы multipart
+        if content_length > settings.MAX_FILE_SIZE + settings.UPLOAD_BODY_OVERHEAD:
+            log_event('upload_too_large', IP=ip, size=content_length)
+            max_size_mb = settings.MAX_FILE_SIZE // (1024 * 1024)
+            return _reject(match, _('Размер файла не должен превышать %(size)s МБ.') % {'size': max_size_mb}, 413)
+
+        free = _free_space(settings.MEDIA_ROOT)
+        if free is not None and free < content_length + settings.UPLOAD_MIN_FREE_SPACE:
+            log_event('upload_no_space', logging.ERROR, IP=ip, size=content_length)
+            return _reject(match, _('Недостаточно места для загрузки. Попробуйте позже.'), 507, 60)
+
+        # Идентификатор сессии, выданный в этом же запросе, не выделяет отдельный слот
+        session_id = None if getattr(request, 'set_anonymous_cookie', True) else request.anonymous_session_id
+        slots = (
+            (f'upload_slots_ip_{ip}', settings.UPLOAD_MAX_CONCURRENT_PER_IP),
+            (f'upload_slots_{session_id or ip}', settings.UPLOAD_MAX_CONCURRENT_PER_SESSION),
+        )
+        acquired = []
+        for slot_key, limit in slots:
+            acquired.append(slot_key)
+            if self._acquire_slot(slot_key) > limit:
+                for key in acquired:
+                    self._release_slot(key)
+                log_event('upload_concurrency_exceeded', IP=ip)
+                return _reject(match, _('Слишком много одновременных загрузок. Дождитесь завершения текущих.'), 429, 1)
+
+        request.upload_slot_keys = acquired
         return None
 
+    def process_response(self, request, response):
+        for slot_key in getattr(request, 'upload_slot_keys', ()):
+            self._release_slot(slot_key)
+        return response
+
+    def _acquire_slot(self, key):
+        """Увеличивает счетчик активных загрузок. Таймаут страхует от утечки слотов при падении воркера."""
+        cache.add(key, 0, timeout=settings.UPLOAD_SLOT_TIMEOUT)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # Ключ истек между add и incr
+            cache.set(key, 1, timeout=settings.UPLOAD_SLOT_TIMEOUT)
+            return 1
+
+    def _release_slot(self, key):
+        try:
+            cache.decr(key)
+        except ValueError:
+            pass
+
 
 class SecurityHeadersMiddleware(MiddlewareMixin):
     """
@@ -82,6 +319,7 @@ class AnonymousSessionMiddleware(MiddlewareMixin):
         self.cookie_name = 'anonymous_session_id'
         self.cookie_max_age = 365 * 24 * 60 * 60  # 1 год в секундах
     
+    @traced('AnonymousSessionMiddleware.process_request')
     def process_request(self, request):
         """
         Обрабатываем каждый запрос и генерируем session_id если его нет.
@@ -109,6 +347,7 @@ class AnonymousSessionMiddleware(MiddlewareMixin):
         
         return None
     
+    @traced('AnonymousSessionMiddleware.process_response')
     def process_response(self, request, response):
         """
         Устанавливаем cookie с session_id если это новый пользователь.
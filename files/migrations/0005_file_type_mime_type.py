@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0004_file_keyset_pagination_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="file",
+            name="file_type",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("image", "Изображение"),
+                    ("video", "Видео"),
+                    ("audio", "Аудио"),
+                    ("document", "Документ"),
+                    ("spreadsheet", "Таблица"),
+                    ("presentation", "Презентация"),
+                    ("archive", "Архив"),
+                    ("code", "Код"),
+                    ("executable", "Программа"),
+                    ("other", "Файл"),
+                ],
+                default="",
+                max_length=20,
+                verbose_name="Тип файла",
+            ),
+        ),
+        migrations.AddField(
+            model_name="file",
+            name="mime_type",
+            field=models.CharField(
+                blank=True, default="", max_length=100, verbose_name="MIME тип"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="file",
+            index=models.Index(
+                fields=["session_id", "file_type", "-created_at"],
+                name="files_file_session_type_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0005_file_type_mime_type"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedPartition",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(max_length=63, unique=True, verbose_name="Секция"),
+                ),
+                (
+                    "range_start",
+                    models.DateTimeField(
+                        blank=True,
+                        null=True,
+                        verbose_name="Начало диапазона expires_at",
+                    ),
+                ),
+                (
+                    "range_end",
+                    models.DateTimeField(verbose_name="Конец диапазона expires_at"),
+                ),
+                (
+                    "files_count",
+                    models.BigIntegerField(default=0, verbose_name="Файлов"),
+                ),
+                (
+                    "download_count",
+                    models.BigIntegerField(default=0, verbose_name="Скачиваний"),
+                ),
+                (
+                    "total_size",
+                    models.BigIntegerField(
+                        default=0, verbose_name="Суммарный размер (байт)"
+                    ),
+                ),
+                (
+                    "detached_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Отсоединена"),
+                ),
+                (
+                    "dropped",
+                    models.BooleanField(default=False, verbose_name="Таблица удалена"),
+                ),
+            ],
+            options={
+                "verbose_name": "Архивная секция",
+                "verbose_name_plural": "Архивные секции",
+                "ordering": ["-range_end"],
+            },
+        ),
+    ]
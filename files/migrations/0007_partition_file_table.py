@@ -0,0 +1,30 @@
+# Секционирование files_file по дням expires_at (только PostgreSQL, см. files.partitions)
+
+from django.db import migrations
+
+
+def partition(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from files.partitions import partition_table
+
+    partition_table(schema_editor, apps.get_model('files', 'File'))
+
+
+def unpartition(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from files.partitions import unpartition_table
+
+    unpartition_table(schema_editor, apps.get_model('files', 'File'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0006_archivedpartition"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
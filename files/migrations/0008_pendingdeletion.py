@@ -0,0 +1,67 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0007_partition_file_table"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingDeletion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(max_length=255, verbose_name="Путь в хранилище"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Поставлен в очередь"
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Неудачных попыток"
+                    ),
+                ),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="Следующая попытка",
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(
+                        blank=True, default="", verbose_name="Последняя ошибка"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Файл в очереди удаления",
+                "verbose_name_plural": "Очередь удаления",
+                "indexes": [
+                    models.Index(
+                        fields=["attempts", "next_attempt_at"],
+                        name="files_pendi_attempt_c0b13a_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0008_pendingdeletion"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="file",
+            index=models.Index(
+                condition=models.Q(("is_deleted", False)),
+                fields=["file"],
+                name="files_file_live_file_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="file",
+            index=models.Index(
+                condition=models.Q(("is_deleted", False)),
+                fields=["qr_code"],
+                name="files_file_live_qr_idx",
+            ),
+        ),
+    ]
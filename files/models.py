@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.conf import settings
 import os
@@ -6,9 +6,155 @@ import qrcode
 from io import BytesIO
 from django.core.files.base import ContentFile
 from PIL import Image
+import mimetypes
+from .metrics import QR_GENERATION
+from .tracing import start_span
 
+# python-magic опционален: без него MIME тип определяется по расширению
+try:
+    import magic
+except ImportError:
+    magic = None
 
-class File(models.Model):
+
+# Расширения по категориям файлов
+FILE_TYPE_EXTENSIONS = {
+    'image': ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg', '.ico'],
+    'video': ['.mp4', '.avi', '.mov', '.wmv', '.flv', '.webm', '.mkv', '.m4v'],
+    'audio': ['.mp3', '.wav', '.flac', '.aac', '.ogg', '.wma', '.m4a'],
+    'document': ['.pdf', '.doc', '.docx', '.txt', '.rtf', '.odt'],
+    'spreadsheet': ['.xls', '.xlsx', '.csv', '.ods'],
+    'presentation': ['.ppt', '.pptx', '.odp'],
+    'archive': ['.zip', '.rar', '.7z', '.tar', '.gz', '.bz2'],
+    'code': ['.py', '.js', '.html', '.css', '.php', '.java', '.cpp', '.c', '.h'],
+    'executable': ['.exe', '.msi', '.dmg', '.pkg', '.deb', '.rpm'],
+}
+
+# Обратный индекс расширение -> категория (один поиск в словаре вместо цепочки списков)
+FILE_TYPE_BY_EXTENSION = {
+    ext: file_type
+    for file_type, extensions in FILE_TYPE_EXTENSIONS.items()
+    for ext in extensions
+}
+
+FILE_TYPE_CHOICES = [
+    ('image', 'Изображение'),
+    ('video', 'Видео'),
+    ('audio', 'Аудио'),
+    ('document', 'Документ'),
+    ('spreadsheet', 'Таблица'),
+    ('presentation', 'Презентация'),
+    ('archive', 'Архив'),
+    ('code', 'Код'),
+    ('executable', 'Программа'),
+    ('other', 'Файл'),
+]
+FILE_TYPE_NAMES = dict(FILE_TYPE_CHOICES)
+
+
+def classify_file_type(filename):
+    """Определяет тип файла на основе расширения"""
+    _, ext = os.path.splitext(filename.lower())
+    return FILE_TYPE_BY_EXTENSION.get(ext, 'other')
+
+
+def sniff_mime_type(file_obj=None, filename=''):
+    """
+    Определяет MIME тип файла.
+    Если установлен python-magic - по первым байтам содержимого,
+    иначе (или при ошибке) - по расширению имени файла.
+    """
+    if file_obj is not None and magic is not None:
+        try:
+            position = file_obj.tell()
+            header = file_obj.read(2048)
+            file_obj.seek(position)
+            if header:
+                return magic.from_buffer(header, mime=True)
+        except Exception:
+            pass
+    
+    mime_type, _ = mimetypes.guess_type(filename)
+    return mime_type or 'application/octet-stream'
+
+
+class FileDisplayMixin:
+    """
+    Методы отображения файла, общие для модели File и облегченных
+    read-моделей списков (files.read_models.FileListItem).
+    Требует атрибутов filename, file_size, expires_at и метода get_file_type().
+    """
+    
+    __slots__ = ()
+    
+    def get_file_size_mb(self):
+        """Возвращает размер файла в мегабайтах"""
+        return round(self.file_size / (1024 * 1024), 2)
+    
+    def is_expired(self):
+        """Проверяет, истек ли срок действия файла"""
+        return timezone.now() > self.expires_at
+    
+    def get_file_type_icon(self):
+        """Возвращает иконку FontAwesome для типа файла"""
+        file_type = self.get_file_type()
+        
+        icon_map = {
+            'image': 'fas fa-image',
+            'video': 'fas fa-video',
+            'audio': 'fas fa-music',
+            'document': 'fas fa-file-alt',
+            'spreadsheet': 'fas fa-file-excel',
+            'presentation': 'fas fa-file-powerpoint',
+            'archive': 'fas fa-file-archive',
+            'code': 'fas fa-file-code',
+            'executable': 'fas fa-cog',
+            'other': 'fas fa-file'
+        }
+        
+        return icon_map.get(file_type, 'fas fa-file')
+    
+    def get_file_type_name(self):
+        """Возвращает человекочитаемое название типа файла"""
+        file_type = self.get_file_type()
+        
+        return FILE_TYPE_NAMES.get(file_type, 'Файл')
+    
+    def get_file_type_color(self):
+        """Возвращает цвет для типа файла (Bootstrap классы)"""
+        file_type = self.get_file_type()
+        
+        color_map = {
+            'image': 'text-info',
+            'video': 'text-danger',
+            'audio': 'text-warning',
+            'document': 'text-primary',
+            'spreadsheet': 'text-success',
+            'presentation': 'text-warning',
+            'archive': 'text-secondary',
+            'code': 'text-dark',
+            'executable': 'text-danger',
+            'other': 'text-muted'
+        }
+        
+        return color_map.get(file_type, 'text-muted')
+    
+    def get_remaining_time(self):
+        """Возвращает оставшееся время жизни файла"""
+        if self.is_expired():
+            return "Файл истек"
+        
+        remaining = self.expires_at - timezone.now()
+        hours = int(remaining.total_seconds() // 3600)
+        minutes = int((remaining.total_seconds() % 3600) // 60)
+        
+        if hours > 0:
+            return f"{hours}ч {minutes}м"
+        else:
+            return f"{minutes}м"
+
+
+class File(FileDisplayMixin, models.Model):
     """
     Модель для хранения информации о загруженных файлах.
     Поддерживает автоматическую генерацию QR кодов, защиту паролем
@@ -25,6 +171,10 @@ class File(models.Model):
     password = models.CharField(max_length=128, blank=True, null=True, verbose_name='Пароль')
     is_protected = models.BooleanField(default=False, verbose_name='Защищен паролем')
     
+    # Тип файла (вычисляется один раз при загрузке, см. save())
+    file_type = models.CharField(max_length=20, choices=FILE_TYPE_CHOICES, blank=True, default='', verbose_name='Тип файла')
+    mime_type = models.CharField(max_length=100, blank=True, default='', verbose_name='MIME тип')
+    
     # Анонимная сессия пользователя
     session_id = models.CharField(max_length=64, blank=True, null=True, verbose_name='ID анонимной сессии')
     
@@ -50,25 +200,48 @@ class File(models.Model):
         indexes = [
             models.Index(fields=['session_id', 'created_at']),
             models.Index(fields=['session_id', 'expires_at']),
+            # Для keyset пагинации списков файлов сессии по (created_at, id)
+            models.Index(fields=['session_id', '-created_at', '-id'], name='files_file_session_keyset_idx'),
+            # Для фильтрации списков сессии по типу файла
+            models.Index(fields=['session_id', 'file_type', '-created_at'], name='files_file_session_type_idx'),
             models.Index(fields=['code']),  # Для быстрого поиска по коду
             models.Index(fields=['is_deleted', 'expires_at']),  # Для очистки истекших файлов
             models.Index(fields=['download_count']),  # Для популярных файлов
             models.Index(fields=['created_at']),  # Для сортировки по дате
             models.Index(fields=['file_size']),  # Для фильтрации по размеру
             models.Index(fields=['is_protected']),  # Для защищенных файлов
+            # Для сборки мусора в media/ (files.media_gc): живые записи по имени файла и QR кода
+            models.Index(fields=['file'], condition=models.Q(is_deleted=False), name='files_file_live_file_idx'),
+            models.Index(fields=['qr_code'], condition=models.Q(is_deleted=False), name='files_file_live_qr_idx'),
         ]
     
     def __str__(self):
         return f"{self.code} - {self.filename}"
     
     def save(self, *args, **kwargs):
-        """Переопределяем save для автоматической генерации QR кода"""
-        if not self.pk:  # Только при создании нового файла
-            self.generate_qr_code()
-        super().save(*args, **kwargs)
+        """Переопределяем save для автоматической генерации QR кода и классификации типа"""
+        with start_span('File.save', attributes={'file.code': self.code, 'file.size': self.file_size or 0}):
+            if not self.pk:  # Только при создании нового файла
+                self.generate_qr_code()
+                self.classify()
+            super().save(*args, **kwargs)
+    
+    def classify(self):
+        """Вычисляет и сохраняет в полях тип файла и MIME тип"""
+        self.file_type = classify_file_type(self.filename)
+        if not self.mime_type:
+            file_obj = None
+            # Для только что загруженного файла читаем заголовок из памяти/временного файла
+            if self.file and not self.file._committed:
+                file_obj = self.file.file
+            self.mime_type = sniff_mime_type(file_obj, self.filename)
     
     def generate_qr_code(self):
         """Генерирует QR код со ссылкой на файл"""
+        with QR_GENERATION.time(), start_span('File.generate_qr_code'):
+            self._generate_qr_code()
+
+    def _generate_qr_code(self):
         from django.urls import reverse
         # Используем SITE_BASE_URL из настроек и корректный namespaced url
         base = getattr(settings, 'SITE_BASE_URL', 'http://localhost:8000')
@@ -95,14 +268,6 @@ class File(models.Model):
         # Сохраняем как ImageField
         self.qr_code.save(f'qr_{self.code}.png', ContentFile(buffer.getvalue()), save=False)
     
-    def get_file_size_mb(self):
-        """Возвращает размер файла в мегабайтах"""
-        return round(self.file_size / (1024 * 1024), 2)
-    
-    def is_expired(self):
-        """Проверяет, истек ли срок действия файла"""
-        return timezone.now() > self.expires_at
-    
     def increment_download_count(self):
         """Увеличивает счетчик скачиваний"""
         self.download_count += 1
@@ -110,119 +275,61 @@ class File(models.Model):
         self.save(update_fields=['download_count', 'last_downloaded'])
     
     def get_file_type(self):
-        """Определяет тип файла на основе расширения"""
-        import mimetypes
-        
-        # Получаем расширение файла
-        _, ext = os.path.splitext(self.filename.lower())
-        
-        # Определяем MIME тип
-        mime_type, _ = mimetypes.guess_type(self.filename)
-        
-        # Категории файлов
-        if ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg', '.ico']:
-            return 'image'
-        elif ext in ['.mp4', '.avi', '.mov', '.wmv', '.flv', '.webm', '.mkv', '.m4v']:
-            return 'video'
-        elif ext in ['.mp3', '.wav', '.flac', '.aac', '.ogg', '.wma', '.m4a']:
-            return 'audio'
-        elif ext in ['.pdf', '.doc', '.docx', '.txt', '.rtf', '.odt']:
-            return 'document'
-        elif ext in ['.xls', '.xlsx', '.csv', '.ods']:
-            return 'spreadsheet'
-        elif ext in ['.ppt', '.pptx', '.odp']:
-            return 'presentation'
-        elif ext in ['.zip', '.rar', '.7z', '.tar', '.gz', '.bz2']:
-            return 'archive'
-        elif ext in ['.py', '.js', '.html', '.css', '.php', '.java', '.cpp', '.c', '.h']:
-            return 'code'
-        elif ext in ['.exe', '.msi', '.dmg', '.pkg', '.deb', '.rpm']:
-            return 'executable'
-        else:
-            return 'other'
-    
-    def get_file_type_icon(self):
-        """Возвращает иконку FontAwesome для типа файла"""
-        file_type = self.get_file_type()
-        
-        icon_map = {
-            'image': 'fas fa-image',
-            'video': 'fas fa-video',
-            'audio': 'fas fa-music',
-            'document': 'fas fa-file-alt',
-            'spreadsheet': 'fas fa-file-excel',
-            'presentation': 'fas fa-file-powerpoint',
-            'archive': 'fas fa-file-archive',
-            'code': 'fas fa-file-code',
-            'executable': 'fas fa-cog',
-            'other': 'fas fa-file'
-        }
-        
-        return icon_map.get(file_type, 'fas fa-file')
-    
-    def get_file_type_name(self):
-        """Возвращает человекочитаемое название типа файла"""
-        file_type = self.get_file_type()
-        
-        name_map = {
-            'image': 'Изображение',
-            'video': 'Видео',
-            'audio': 'Аудио',
-            'document': 'Документ',
-            'spreadsheet': 'Таблица',
-            'presentation': 'Презентация',
-            'archive': 'Архив',
-            'code': 'Код',
-            'executable': 'Программа',
-            'other': 'Файл'
-        }
-        
-        return name_map.get(file_type, 'Файл')
-    
-    def get_file_type_color(self):
-        """Возвращает цвет для типа файла (Bootstrap классы)"""
-        file_type = self.get_file_type()
-        
-        color_map = {
-            'image': 'text-info',
-            'video': 'text-danger',
-            'audio': 'text-warning',
-            'document': 'text-primary',
-            'spreadsheet': 'text-success',
-            'presentation': 'text-warning',
-            'archive': 'text-secondary',
-            'code': 'text-dark',
-            'executable': 'text-danger',
-            'other': 'text-muted'
-        }
-        
-        return color_map.get(file_type, 'text-muted')
-    
-    def get_remaining_time(self):
-        """Возвращает оставшееся время жизни файла"""
-        if self.is_expired():
-            return "Файл истек"
-        
-        remaining = self.expires_at - timezone.now()
-        hours = int(remaining.total_seconds() // 3600)
-        minutes = int((remaining.total_seconds() % 3600) // 60)
-        
-        if hours > 0:
-            return f"{hours}ч {minutes}м"
-        else:
-            return f"{minutes}м"
+        """Возвращает тип файла (из поля; для старых записей - по расширению)"""
+        return self.file_type or classify_file_type(self.filename)
     
     def delete(self, *args, **kwargs):
-        """Удаляет физический файл при удалении записи"""
-        if self.file:
-            if os.path.isfile(self.file.path):
-                os.remove(self.file.path)
-        if self.qr_code:
-            if os.path.isfile(self.qr_code.path):
-                os.remove(self.qr_code.path)
-        
-        # Вместо удаления записи помечаем как удаленную
+        """
+        Логическое удаление: запись помечается удаленной (сохраняется для
+        статистики), а файл и QR код ставятся в очередь физического удаления
+        (files.deletion) - запрос не ждет хранилище
+        """
+        names = [field_file.name for field_file in (self.file, self.qr_code) if field_file]
+        with transaction.atomic():
+            File.objects.filter(pk=self.pk).update(is_deleted=True)
+            PendingDeletion.objects.bulk_create(PendingDeletion(name=name) for name in names)
         self.is_deleted = True
-        self.save()
-        
-        # Не вызываем super().delete() - сохраняем запись для статистики
+
+
+class PendingDeletion(models.Model):
+    """Файл в хранилище, ожидающий физического удаления (очередь files.deletion)"""
+
+    name = models.CharField(max_length=255, verbose_name='Путь в хранилище')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Поставлен в очередь')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Неудачных попыток')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    last_error = models.TextField(blank=True, default='', verbose_name='Последняя ошибка')
+
+    class Meta:
+        verbose_name = 'Файл в очереди удаления'
+        verbose_name_plural = 'Очередь удаления'
+        indexes = [
+            models.Index(fields=['attempts', 'next_attempt_at']),  # Выборка пачки из очереди
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class ArchivedPartition(models.Model):
+    """
+    Отсоединенная секция таблицы files_file (PostgreSQL, см. files.partitions).
+    Итоги секции сохраняются, чтобы общая статистика учитывала и отсоединенные файлы
+    """
+
+    name = models.CharField(max_length=63, unique=True, verbose_name='Секция')
+    range_start = models.DateTimeField(blank=True, null=True, verbose_name='Начало диапазона expires_at')
+    range_end = models.DateTimeField(verbose_name='Конец диапазона expires_at')
+    files_count = models.BigIntegerField(default=0, verbose_name='Файлов')
+    download_count = models.BigIntegerField(default=0, verbose_name='Скачиваний')
+    total_size = models.BigIntegerField(default=0, verbose_name='Суммарный размер (байт)')
+    detached_at = models.DateTimeField(auto_now_add=True, verbose_name='Отсоединена')
+    dropped = models.BooleanField(default=False, verbose_name='Таблица удалена')
+
+    class Meta:
+        verbose_name = 'Архивная секция'
+        verbose_name_plural = 'Архивные секции'
+        ordering = ['-range_end']
+
+    def __str__(self):
+        return self.name
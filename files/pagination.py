@@ -0,0 +1,95 @@
+"""
+Keyset (cursor) пагинация по паре (created_at, id).
+
+В отличие от OFFSET-пагинации через Paginator не требует COUNT(*) и
+не замедляется на дальних страницах: каждая страница - один запрос
+по индексу (session_id, -created_at, -id).
+"""
+
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class KeysetPage:
+    """
+    Страница результатов keyset пагинации.
+    Итерируется как список объектов и хранит курсор следующей страницы.
+    """
+
+    def __init__(self, object_list, next_cursor=None, cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        # Курсор указан - значит это не первая страница
+        return bool(self.cursor)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def encode_cursor(created_at, pk):
+    """
+    Кодирует позицию (created_at, id) в непрозрачную строку для URL.
+    """
+    raw = f'{created_at.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Декодирует курсор. Возвращает (created_at, id) или None для невалидного значения.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        created_at, pk = raw.split('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def paginate_keyset(queryset, cursor=None, per_page=20):
+    """
+    Возвращает KeysetPage с объектами, следующими после курсора.
+
+    Сортировка всегда (-created_at, -id); выбирается per_page + 1 строка,
+    чтобы узнать о наличии следующей страницы без отдельного запроса.
+    """
+    position = decode_cursor(cursor)
+    queryset = queryset.order_by('-created_at', '-id')
+
+    if position is not None:
+        created_at, pk = position
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+    else:
+        # Невалидный курсор трактуем как первую страницу
+        cursor = None
+
+    rows = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.pk)
+
+    return KeysetPage(rows, next_cursor=next_cursor, cursor=cursor)
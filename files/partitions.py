@@ -0,0 +1,291 @@
+"""
+Секционирование таблицы files_file по дням expires_at (PostgreSQL).
+
+Каждая строка истекает через FILE_EXPIRY_HOURS, поэтому секция дня D
+(expires_at в [D, D+1)) к концу дня истекает целиком: вместо удаления строк по
+одной она отсоединяется (DETACH PARTITION) или удаляется, а индексы живых
+секций остаются маленькими. Продление срока (UPDATE expires_at) переносит
+строку в секцию нового дня.
+
+Ограничения секционированных таблиц PostgreSQL:
+- первичный ключ включает ключ секционирования: (id, expires_at);
+- глобального UNIQUE по code нет - уникальность обеспечивает таблица
+  files_file_code, которую заполняют триггеры.
+
+Секции вперед и отсоединение истекших - maintain_partitions (команда
+maintain_partitions, задача Celery). На SQLite таблица не секционируется и
+функции ничего не делают.
+"""
+
+import math
+import re
+from dataclasses import dataclass
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from typing import Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from .models import ArchivedPartition, File
+
+TABLE = File._meta.db_table
+CODES_TABLE = f'{TABLE}_code'
+# Строки, истекшие до секционирования: диапазон от MINVALUE до дня миграции
+ARCHIVE_PARTITION = f'{TABLE}_archive'
+RETENTION_MODES = ('detach', 'drop')
+BOUND_RE = re.compile(r"FROM \((?:MINVALUE|'(?P<start>[^']+)')\) TO \('(?P<end>[^']+)'\)")
+
+# Уникальность code: код занят, пока строка есть в любой секции
+CODES_SQL = [
+    f'CREATE TABLE {CODES_TABLE} (code varchar(10) PRIMARY KEY, expires_at timestamptz NOT NULL)',
+    f'CREATE INDEX {CODES_TABLE}_expires_idx ON {CODES_TABLE} (expires_at)',
+    f'INSERT INTO {CODES_TABLE} (code, expires_at) SELECT code, expires_at FROM {TABLE}',
+    f"""
+    CREATE FUNCTION {TABLE}_register_code() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM {CODES_TABLE} WHERE code = OLD.code;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO {CODES_TABLE} (code, expires_at) VALUES (NEW.code, NEW.expires_at);
+        END IF;
+        RETURN NULL;
+    END
+    $$
+    """,
+    f'CREATE TRIGGER {TABLE}_register_code AFTER INSERT OR DELETE ON {TABLE} '
+    f'FOR EACH ROW EXECUTE FUNCTION {TABLE}_register_code()',
+    f'CREATE TRIGGER {TABLE}_reregister_code AFTER UPDATE OF code, expires_at ON {TABLE} FOR EACH ROW '
+    f'WHEN (OLD.code IS DISTINCT FROM NEW.code OR OLD.expires_at IS DISTINCT FROM NEW.expires_at) '
+    f'EXECUTE FUNCTION {TABLE}_register_code()',
+]
+
+
+@dataclass
+class Partition:
+    name: str
+    start: Optional[datetime]  # None - MINVALUE
+    end: datetime
+
+    def overlaps(self, start, end):
+        return (self.start is None or self.start < end) and start < self.end
+
+
+def partition_name(day):
+    return f'{TABLE}_p{day:%Y%m%d}'
+
+
+def day_start(value):
+    """Начало суток (UTC), в которые попадает value"""
+    value = value.astimezone(dt_timezone.utc)
+    return datetime.combine(value.date(), dt_time.min, tzinfo=dt_timezone.utc)
+
+
+def parse_bound(expr):
+    """Границы секции из pg_get_expr(relpartbound): (начало или None для MINVALUE, конец)"""
+    match = BOUND_RE.search(expr)
+    if not match:
+        raise ValueError(f'Неизвестная граница секции: {expr}')
+    start = match.group('start')
+    return datetime.fromisoformat(start) if start else None, datetime.fromisoformat(match.group('end'))
+
+
+def horizon_days():
+    """На сколько дней вперед нужны секции: не меньше срока жизни файла"""
+    return max(settings.FILE_PARTITIONING['premake_days'], math.ceil(settings.FILE_EXPIRY_HOURS / 24) + 1)
+
+
+def missing_days(partitions, first_day, last_day):
+    """Дни с first_day по last_day включительно, не покрытые ни одной секцией"""
+    days = []
+    day = first_day
+    while day <= last_day:
+        if not any(partition.overlaps(day, day + timedelta(days=1)) for partition in partitions):
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def expired_partitions(partitions, now, grace):
+    """Секции, все строки которых истекли не позже чем grace назад"""
+    return [partition for partition in partitions if partition.end <= now - grace]
+
+
+def _bound(value):
+    return f"'{value.isoformat(' ')}'"
+
+
+def is_partitioned(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [TABLE])
+        return cursor.fetchone() is not None
+
+
+def list_partitions(cursor):
+    cursor.execute(
+        'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i '
+        'JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s)',
+        [TABLE],
+    )
+    partitions = [
+        Partition(name, *parse_bound(bound)) for name, bound in cursor.fetchall() if bound != 'DEFAULT'
+    ]
+    return sorted(partitions, key=lambda partition: partition.end)
+
+
+def create_partition_sql(quote_name, day):
+    return (
+        f'CREATE TABLE IF NOT EXISTS {quote_name(partition_name(day))} PARTITION OF {quote_name(TABLE)} '
+        f'FOR VALUES FROM ({_bound(day)}) TO ({_bound(day + timedelta(days=1))})'
+    )
+
+
+def ensure_partitions(start=None, end=None, using=DEFAULT_DB_ALIAS):
+    """
+    Создает недостающие дневные секции с дня start (по умолчанию сегодня) по
+    день end (по умолчанию на horizon_days вперед). Возвращает имена созданных
+    """
+    if not is_partitioned(using):
+        return []
+    now = timezone.now()
+    connection = connections[using]
+    with transaction.atomic(using), connection.cursor() as cursor:
+        days = missing_days(
+            list_partitions(cursor), day_start(start or now), day_start(end or now + timedelta(days=horizon_days())),
+        )
+        for day in days:
+            cursor.execute(create_partition_sql(connection.ops.quote_name, day))
+    return [partition_name(day) for day in days]
+
+
+def retire_partition(partition, using=DEFAULT_DB_ALIAS):
+    """
+    Отсоединяет истекшую секцию (и удаляет ее таблицу при retention = drop).
+    Файлы строк, которые очистка еще не удалила, удаляются с диска; итоги
+    секции сохраняются в ArchivedPartition
+    """
+    config = settings.FILE_PARTITIONING
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    table = quote_name(partition.name)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT file, qr_code FROM {table} WHERE NOT is_deleted')
+        for names in cursor.fetchall():
+            for field_name, name in zip(('file', 'qr_code'), names):
+                if name:
+                    File._meta.get_field(field_name).storage.delete(name)
+
+    with transaction.atomic(using), connection.cursor() as cursor:
+        # DETACH ждет ACCESS EXCLUSIVE блокировку: не выстраиваем за ней очередь запросов
+        cursor.execute(f'SET LOCAL lock_timeout = {int(config["lock_timeout_ms"])}')
+        cursor.execute(
+            f'SELECT count(*), coalesce(sum(download_count), 0), coalesce(sum(file_size), 0) FROM {table}'
+        )
+        files_count, download_count, total_size = cursor.fetchone()
+        cursor.execute(f'ALTER TABLE {quote_name(TABLE)} DETACH PARTITION {table}')
+        # Коды истекших строк снова свободны; в более поздних секциях таких expires_at нет
+        cursor.execute(f'DELETE FROM {quote_name(CODES_TABLE)} WHERE expires_at < %s', [partition.end])
+        dropped = config['retention'] == 'drop'
+        if dropped:
+            cursor.execute(f'DROP TABLE {table}')
+        return ArchivedPartition.objects.using(using).create(
+            name=partition.name, range_start=partition.start, range_end=partition.end,
+            files_count=files_count, download_count=download_count, total_size=total_size, dropped=dropped,
+        )
+
+
+def maintain_partitions(now=None, using=DEFAULT_DB_ALIAS):
+    """
+    Создает секции на horizon_days вперед и отсоединяет истекшие.
+    None, если таблица не секционирована
+    """
+    if settings.FILE_PARTITIONING['retention'] not in RETENTION_MODES:
+        raise ImproperlyConfigured(f'FILE_PARTITION_RETENTION: ожидается {" или ".join(RETENTION_MODES)}')
+    if not is_partitioned(using):
+        return None
+    now = now or timezone.now()
+    created = ensure_partitions(now, now + timedelta(days=horizon_days()), using)
+    with connections[using].cursor() as cursor:
+        partitions = list_partitions(cursor)
+    grace = timedelta(hours=settings.FILE_PARTITIONING['grace_hours'])
+    retired = [retire_partition(partition, using) for partition in expired_partitions(partitions, now, grace)]
+    return {'created': created, 'retired': retired}
+
+
+def partition_table(schema_editor, model):
+    """
+    Перестраивает files_file в секционированную таблицу (миграция 0007):
+    строки, истекшие до сегодняшнего дня, попадают в секцию files_file_archive,
+    остальные - в дневные секции
+    """
+    quote_name = schema_editor.quote_name
+    table, old = quote_name(TABLE), quote_name(f'{TABLE}_unpartitioned')
+    sequence = f'{TABLE}_id_seq'
+    today = day_start(timezone.now())
+
+    schema_editor.execute(f'ALTER TABLE {table} RENAME TO {old}', None)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT coalesce(max(id), 0), max(expires_at) FROM {old}')
+        max_id, max_expires_at = cursor.fetchone()
+    last_day = day_start(today + timedelta(days=horizon_days()))
+    if max_expires_at is not None:
+        last_day = max(last_day, day_start(max_expires_at))
+
+    schema_editor.execute(
+        f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE (expires_at)', None,
+    )
+    schema_editor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, expires_at)', None)
+    schema_editor.execute(
+        f'CREATE TABLE {quote_name(ARCHIVE_PARTITION)} PARTITION OF {table} '
+        f'FOR VALUES FROM (MINVALUE) TO ({_bound(today)})',
+        None,
+    )
+    for day in missing_days([], today, last_day):
+        schema_editor.execute(create_partition_sql(quote_name, day), None)
+    schema_editor.execute(f'INSERT INTO {table} SELECT * FROM {old}', None)
+    # Вместе со старой таблицей удаляются ее индексы и identity последовательность id
+    schema_editor.execute(f'DROP TABLE {old}', None)
+
+    schema_editor.execute(f'CREATE SEQUENCE {quote_name(sequence)} OWNED BY {table}.id', None)
+    schema_editor.execute(f"SELECT setval('{sequence}', {max(max_id, 1)}, {'true' if max_id else 'false'})", None)
+    schema_editor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{sequence}')", None)
+
+    for index in model._meta.indexes:
+        schema_editor.add_index(model, index)
+    # Поиск по префиксу кода (code__startswith)
+    schema_editor.execute(f'CREATE INDEX {TABLE}_code_like_idx ON {table} (code varchar_pattern_ops)', None)
+    for sql in CODES_SQL:
+        schema_editor.execute(sql, None)
+
+
+def unpartition_table(schema_editor, model):
+    """
+    Обратно к обычной таблице. Строки отсоединенных секций не возвращаются -
+    их таблицы (retention = detach) остаются отдельными
+    """
+    quote_name = schema_editor.quote_name
+    table, old = quote_name(TABLE), quote_name(f'{TABLE}_partitioned')
+
+    schema_editor.execute(f'DROP TABLE {quote_name(CODES_TABLE)}', None)
+    schema_editor.execute(f'DROP FUNCTION {TABLE}_register_code() CASCADE', None)
+    schema_editor.execute(f'ALTER TABLE {table} RENAME TO {old}', None)
+    schema_editor.execute(f'CREATE TABLE {table} (LIKE {old})', None)
+    schema_editor.execute(f'ALTER TABLE {table} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY', None)
+    schema_editor.execute(f'INSERT INTO {table} SELECT * FROM {old}', None)
+    schema_editor.execute(f'DROP TABLE {old}', None)
+    schema_editor.execute(
+        f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), coalesce(max(id), 1), max(id) IS NOT NULL) "
+        f'FROM {table}',
+        None,
+    )
+    schema_editor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id)', None)
+    schema_editor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {TABLE}_code_key UNIQUE (code)', None)
+    for index in model._meta.indexes:
+        schema_editor.add_index(model, index)
+    schema_editor.execute(f'CREATE INDEX {TABLE}_code_like_idx ON {table} (code varchar_pattern_ops)', None)
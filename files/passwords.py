@@ -0,0 +1,172 @@
+"""
+Хеширование паролей защищенных файлов.
+
+Пароли файлов хешируются отдельно настроенным алгоритмом
+(FILE_PASSWORD_HASHING: Argon2id при наличии argon2-cffi или scrypt)
+с параметрами, подобранными командой benchmark_password_hashing.
+Вычисления выполняются в ограниченном пуле потоков: hashlib.scrypt и
+argon2-cffi отпускают GIL, поэтому хеш считается параллельно с остальной
+обработкой загрузки (генерация кода, QR), а число одновременных тяжелых
+вычислений на процесс ограничено.
+
+Старые значения (PBKDF2 или незахешированные пароли) проверяются и
+прозрачно перехешируются текущим алгоритмом при успешной проверке.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, ScryptPasswordHasher, get_hashers_by_algorithm,
+)
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
+
+
+class FileScryptPasswordHasher(ScryptPasswordHasher):
+    """scrypt с параметрами из FILE_PASSWORD_HASHING['scrypt']"""
+
+    def __init__(self):
+        params = settings.FILE_PASSWORD_HASHING['scrypt']
+        self.work_factor = params['work_factor']
+        self.block_size = params['block_size']
+        self.parallelism = params['parallelism']
+        # Лимит памяти OpenSSL по умолчанию (32 МиБ) меньше, чем нужно при N >= 2^15
+        self.maxmem = max(64 * 1024 * 1024, 256 * self.work_factor * self.block_size)
+
+
+class FileArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2id с параметрами из FILE_PASSWORD_HASHING['argon2']"""
+
+    def __init__(self):
+        params = settings.FILE_PASSWORD_HASHING['argon2']
+        self.time_cost = params['time_cost']
+        self.memory_cost = params['memory_cost']
+        self.parallelism = params['parallelism']
+
+
+def argon2_available():
+    try:
+        import argon2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+_hasher_lock = threading.Lock()
+_hasher = None
+_executor = None
+_slots = None
+
+
+def get_file_hasher():
+    """
+    Возвращает хешер для новых паролей файлов.
+    'auto' выбирает Argon2id, если установлен argon2-cffi, иначе scrypt.
+    """
+    global _hasher
+    if _hasher is None:
+        algorithm = settings.FILE_PASSWORD_HASHING['algorithm']
+        if algorithm == 'auto':
+            algorithm = 'argon2' if argon2_available() else 'scrypt'
+        _hasher = FileArgon2PasswordHasher() if algorithm == 'argon2' else FileScryptPasswordHasher()
+    return _hasher
+
+
+@receiver(setting_changed)
+def reset_file_hasher(*, setting, **kwargs):
+    """Сбрасывает выбранный хешер при изменении настроек (например, в тестах)"""
+    global _hasher
+    if setting == 'FILE_PASSWORD_HASHING':
+        _hasher = None
+
+
+def _get_executor():
+    """Лениво создает пул потоков и семафор, ограничивающий очередь задач"""
+    global _executor, _slots
+    if _executor is None:
+        with _hasher_lock:
+            if _executor is None:
+                workers = settings.FILE_PASSWORD_HASHING['workers']
+                _slots = threading.BoundedSemaphore(workers * 2)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='file-password')
+    return _executor
+
+
+def _submit(fn, *args):
+    """
+    Отправляет задачу в пул. Если очередь заполнена, вызывающий поток ждет
+    свободного места - так пиковая нагрузка не копит неограниченную очередь.
+    """
+    executor = _get_executor()
+    _slots.acquire()
+    try:
+        future = executor.submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def hash_password_async(raw_password):
+    """
+    Начинает хеширование пароля в пуле и возвращает Future с закодированным хешем.
+    """
+    hasher = get_file_hasher()
+    return _submit(hasher.encode, raw_password, hasher.salt())
+
+
+def hash_password(raw_password):
+    """Хеширует пароль файла (блокирующий вариант)"""
+    return hash_password_async(raw_password).result()
+
+
+def _verify(raw_password, encoded):
+    """
+    Проверяет пароль. Возвращает (valid, needs_rehash).
+    """
+    if not encoded:
+        return False, False
+
+    algorithm = encoded.split('$', 1)[0]
+    preferred = get_file_hasher()
+
+    if algorithm == preferred.algorithm:
+        hasher = preferred
+    else:
+        # Хеши других алгоритмов (например, PBKDF2) проверяем стандартными хешерами Django
+        hasher = get_hashers_by_algorithm().get(algorithm)
+
+    if hasher is None:
+        # Старое незахешированное значение
+        return constant_time_compare(raw_password, encoded), True
+
+    valid = hasher.verify(raw_password, encoded)
+    needs_rehash = hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+    return valid, valid and needs_rehash
+
+
+def verify_password(raw_password, encoded):
+    """
+    Проверяет пароль файла в пуле потоков. Возвращает (valid, needs_rehash).
+    """
+    return _submit(_verify, raw_password, encoded).result()
+
+
+def check_file_password(file_instance, raw_password):
+    """
+    Проверяет пароль файла и при необходимости перехеширует сохраненное значение
+    текущим алгоритмом (старый PBKDF2, устаревшие параметры или открытый текст).
+    """
+    stored = file_instance.password or ''
+    valid, needs_rehash = verify_password(raw_password, stored)
+    if valid and needs_rehash:
+        from .models import File
+        new_encoded = hash_password(raw_password)
+        # Условие по старому значению защищает от гонки с параллельной сменой пароля
+        File.objects.filter(pk=file_instance.pk, password=stored).update(password=new_encoded)
+        file_instance.password = new_encoded
+    return valid
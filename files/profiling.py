@@ -0,0 +1,225 @@
+"""
+Профилирование отдельных запросов в продакшене.
+
+Запрос профилируется, если он попал в выборку PROFILING['sample_rate'] или
+пришел с заголовком X-Profile, содержащим подписанный токен (команда
+profile_token). Для него собираются cProfile (топ функций по суммарному
+времени), SQL запросы с временем выполнения и обращения к кешу.
+
+Результаты хранятся в кольцевом буфере из PROFILING['buffer_size'] записей
+в кеше, общем для всех воркеров, и доступны в админке на странице
+«Профили запросов» списка файлов. Для остальных запросов стоимость - проверка
+заголовка и один вызов random(), поэтому малую долю выборки можно оставлять
+включенной постоянно.
+"""
+
+import contextvars
+import cProfile
+import functools
+import io
+import pstats
+import random
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache, caches
+from django.db import connection
+from django.utils import timezone
+
+TOKEN_SALT = 'files.profiling'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+RING_SEQ_KEY = 'profiling_seq'
+# Параметры запроса, значения которых не попадают в профиль (токены доступа, пароли)
+REDACTED_PARAMS = {'token', 'password'}
+CACHE_METHODS = (
+    'get', 'set', 'add', 'delete', 'touch', 'has_key', 'incr', 'decr',
+    'get_many', 'set_many', 'delete_many', 'get_or_set',
+)
+
+_current = contextvars.ContextVar('request_profile', default=None)
+
+
+def make_profile_token():
+    """Токен для заголовка X-Profile (действует PROFILING['token_ttl'] секунд)"""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign('profile')
+
+
+def check_profile_token(token):
+    try:
+        value = signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            token, max_age=settings.PROFILING['token_ttl']
+        )
+    except signing.BadSignature:
+        return False
+    return value == 'profile'
+
+
+def should_profile(request):
+    token = request.META.get(PROFILE_HEADER)
+    if token:
+        return check_profile_token(token)
+    rate = settings.PROFILING['sample_rate']
+    return rate > 0 and random.random() < rate
+
+
+class RequestProfile:
+    """SQL запросы и обращения к кешу одного запроса (с ограничением числа записей)"""
+
+    def __init__(self):
+        config = settings.PROFILING
+        self.max_queries = config['max_queries']
+        self.max_cache_calls = config['max_cache_calls']
+        self.queries = []
+        self.query_count = 0
+        self.query_time = 0.0
+        self.cache_calls = []
+        self.cache_count = 0
+        self.cache_time = 0.0
+        self.in_cache_call = False
+
+    def record_query(self, execute, sql, params, many, context):
+        """execute_wrapper: время каждого SQL запроса"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.query_count += 1
+            self.query_time += elapsed
+            if len(self.queries) < self.max_queries:
+                self.queries.append({'sql': sql, 'ms': round(elapsed * 1000, 3), 'many': many})
+
+    def record_cache(self, operation, key, elapsed, hit):
+        self.cache_count += 1
+        self.cache_time += elapsed
+        if len(self.cache_calls) < self.max_cache_calls:
+            self.cache_calls.append({
+                'op': operation, 'key': str(key)[:200], 'ms': round(elapsed * 1000, 3), 'hit': hit,
+            })
+
+
+def _instrument(operation, method):
+    """Оборачивает метод кеша: запись ведется, только если текущий запрос профилируется"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        profile = _current.get()
+        if profile is None or profile.in_cache_call:
+            return method(self, *args, **kwargs)
+
+        # Вложенные вызовы (get_or_set -> get/add) не учитываем повторно
+        profile.in_cache_call = True
+        start = time.perf_counter()
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            profile.in_cache_call = False
+        hit = (result is not None) if operation in ('get', 'get_or_set') else None
+        if operation == 'get_many':
+            hit = len(result)
+        key = args[0] if args else kwargs.get('key', kwargs.get('keys'))
+        profile.record_cache(operation, key, time.perf_counter() - start, hit)
+        return result
+
+    wrapper._profiling_wrapped = True
+    return wrapper
+
+
+def install_cache_instrumentation():
+    """Один раз оборачивает методы класса кеша по умолчанию"""
+    backend_class = type(caches['default'])
+    for operation in CACHE_METHODS:
+        method = getattr(backend_class, operation, None)
+        if method is not None and not getattr(method, '_profiling_wrapped', False):
+            setattr(backend_class, operation, _instrument(operation, method))
+
+
+def _format_stats(profiler):
+    if profiler is None:
+        return ''
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(settings.PROFILING['top_functions'])
+    return stream.getvalue()
+
+
+def _profile_path(request):
+    """Путь с параметрами запроса; значения REDACTED_PARAMS заменены на ***"""
+    if not request.GET:
+        return request.path[:500]
+    params = [
+        (name, '***' if name in REDACTED_PARAMS else value)
+        for name, values in request.GET.lists() for value in values
+    ]
+    return f'{request.path}?{urlencode(params, safe="*")}'[:500]
+
+
+def profile_request(request, get_response):
+    """Выполняет запрос под профилировщиком и сохраняет результат в буфер"""
+    profile = RequestProfile()
+    profiler = cProfile.Profile()
+    token = _current.set(profile)
+    start = time.perf_counter()
+    try:
+        with connection.execute_wrapper(profile.record_query):
+            try:
+                profiler.enable()
+            except ValueError:
+                # Уже активен другой профилировщик (например, coverage)
+                profiler = None
+            try:
+                response = get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+    finally:
+        _current.reset(token)
+    duration = time.perf_counter() - start
+
+    match = getattr(request, 'resolver_match', None)
+    record_id = store_profile({
+        'created_at': timezone.now(),
+        'method': request.method,
+        'path': _profile_path(request),
+        'view': match.view_name if match else '',
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 3),
+        'trigger': 'header' if request.META.get(PROFILE_HEADER) else 'sample',
+        'query_count': profile.query_count,
+        'query_ms': round(profile.query_time * 1000, 3),
+        'queries': profile.queries,
+        'cache_count': profile.cache_count,
+        'cache_ms': round(profile.cache_time * 1000, 3),
+        'cache_calls': profile.cache_calls,
+        'stats': _format_stats(profiler),
+    })
+    response['X-Profile-Id'] = str(record_id)
+    return response
+
+
+def _slot_key(record_id):
+    return f'profiling_slot_{record_id % settings.PROFILING["buffer_size"]}'
+
+
+def store_profile(record):
+    """Записывает профиль в кольцевой буфер, вытесняя самый старый. Возвращает id."""
+    cache.add(RING_SEQ_KEY, 0, timeout=None)
+    record_id = cache.incr(RING_SEQ_KEY)
+    record['id'] = record_id
+    cache.set(_slot_key(record_id), record, timeout=settings.PROFILING['ttl'])
+    return record_id
+
+
+def list_profiles():
+    """Профили из буфера, новые первыми"""
+    keys = [f'profiling_slot_{slot}' for slot in range(settings.PROFILING['buffer_size'])]
+    return sorted(cache.get_many(keys).values(), key=lambda record: record['id'], reverse=True)
+
+
+def get_profile(record_id):
+    record = cache.get(_slot_key(record_id))
+    if record is None or record['id'] != record_id:
+        return None
+    return record
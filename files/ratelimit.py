@@ -0,0 +1,307 @@
+"""
+Rate limiting по алгоритму GCRA (generic cell rate algorithm).
+
+Состояние лимита для пары (политика, IP) - одно число в кеше: теоретическое
+время прибытия (TAT, мс). С Redis проверка и обновление выполняются одним
+вызовом Lua скрипта (один round trip, атомарно для всех воркеров и узлов).
+Без Redis (разработка, тесты) то же состояние хранится через API кеша Django.
+
+Перед обращением к Redis запрос проходит локальный token bucket процесса:
+если IP уже исчерпал лимит только на запросах к этому процессу, он заведомо
+превышает общий лимит, и запрос отклоняется без обращения к Redis.
+
+scan_rate_limits() и unblock() просматривают состояние лимитов для
+security_monitor: в Redis через инкрементальный SCAN MATCH пачками с одним
+MGET/UNLINK на пачку, без KEYS и без блокировки сервера.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'rate_limit_'
+
+GCRA_SCRIPT = """
+local period = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local interval = period / limit
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if not tat or tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - period
+if allow_at > now then
+    return {0, math.ceil(allow_at - now)}
+end
+redis.call('SET', KEYS[1], string.format('%.0f', new_tat), 'PX', math.ceil(new_tat - now))
+return {1, 0}
+"""
+
+
+@dataclass(frozen=True)
+class Policy:
+    """Политика лимита: limit запросов за period секунд для указанных методов"""
+    bucket: str
+    limit: int
+    period: int
+    methods: tuple = ('GET', 'POST')
+
+
+def get_policies():
+    """
+    Политики по имени маршрута. Значения по умолчанию берутся из
+    RATE_LIMIT_* настроек, RATE_LIMIT_POLICIES может их переопределить.
+    """
+    window = settings.RATE_LIMIT_WINDOW
+    policies = {
+        'files:home': Policy('upload', settings.RATE_LIMIT_UPLOAD, window, ('POST',)),
+        'files:api_upload': Policy('api', settings.RATE_LIMIT_API, window, ('POST',)),
+        'files:download_file': Policy('download', settings.RATE_LIMIT_DOWNLOAD, window, ('GET',)),
+        'files:view_file': Policy('view', settings.RATE_LIMIT_DOWNLOAD, window, ('GET',)),
+    }
+    for route, params in getattr(settings, 'RATE_LIMIT_POLICIES', {}).items():
+        params = dict(params)
+        params['methods'] = tuple(params.get('methods', ('GET', 'POST')))
+        policies[route] = Policy(**params)
+    return policies
+
+
+def get_client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def make_key(policy, ip):
+    # Имя bucket может содержать '_', адрес IPv4/IPv6 - нет: разбор по последнему '_' (_parse_key)
+    return f'{KEY_PREFIX}{policy.bucket}_{ip}'
+
+
+def get_redis_client():
+    """
+    Возвращает клиент redis-py для кеша по умолчанию или None, если кеш не Redis.
+    """
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        pass
+
+    from django.core.cache.backends.redis import RedisCache
+    if isinstance(cache, RedisCache):
+        return cache._cache.get_client(write=True)
+    return None
+
+
+class LocalTokenBucket:
+    """
+    Token bucket в памяти процесса с ограниченным числом отслеживаемых IP (LRU).
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def allow(self, key, limit, period):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (float(limit), now))
+            tokens = min(float(limit), tokens + (now - updated) * limit / period)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_entries:
+                self.buckets.popitem(last=False)
+        return allowed
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class RateLimiter:
+    """
+    Проверяет запрос по GCRA. check() возвращает (allowed, retry_after_seconds).
+    """
+
+    def __init__(self):
+        self.local = LocalTokenBucket()
+        self._script = None
+        self._client = None
+
+    def check(self, policy, ip):
+        key = make_key(policy, ip)
+
+        try:
+            client = self._get_client()
+            if client is None:
+                return self._check_cache(key, policy)
+
+            # Локальный предфильтр: отклоняем заведомо превысивших лимит без обращения к Redis
+            if not self.local.allow(key, policy.limit, policy.period):
+                return False, policy.period / policy.limit
+            return self._check_redis(client, key, policy)
+        except Exception as e:
+            # Недоступность хранилища не должна ронять сайт
+            logger.warning(f'Rate limiter недоступен, запрос пропущен: {e}')
+            return True, 0
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = get_redis_client() or False
+            if self._client:
+                self._script = self._client.register_script(GCRA_SCRIPT)
+        return self._client or None
+
+    def _check_redis(self, client, key, policy):
+        allowed, retry_after_ms = self._script(
+            keys=[cache.make_and_validate_key(key)],
+            args=[policy.period * 1000, policy.limit],
+        )
+        return bool(allowed), retry_after_ms / 1000
+
+    def _check_cache(self, key, policy):
+        """Тот же GCRA через API кеша Django (неатомарно, для разработки и тестов)"""
+        period_ms = policy.period * 1000
+        interval = period_ms / policy.limit
+        now = time.time() * 1000
+
+        tat = max(cache.get(key) or now, now)
+        new_tat = tat + interval
+        allow_at = new_tat - period_ms
+        if allow_at > now:
+            return False, (allow_at - now) / 1000
+
+        cache.set(key, int(new_tat), timeout=max(1, int((new_tat - now) / 1000) + 1))
+        return True, 0
+
+    def reset(self):
+        """Сбрасывает локальное состояние (выбор клиента и token bucket)"""
+        self.local.clear()
+        self._client = None
+        self._script = None
+
+
+limiter = RateLimiter()
+
+
+@dataclass
+class LimitState:
+    """
+    Состояние лимита (bucket, IP). used - сколько запросов из limit израсходовано
+    с учетом восстановления, ttl - через сколько секунд лимит полностью восстановится.
+    """
+    bucket: str
+    ip: str
+    used: int
+    ttl: float
+    blocked: bool
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _parse_key(raw_key, prefix):
+    """':1:rate_limit_api_search_1.2.3.4' -> ('api_search', '1.2.3.4')"""
+    if isinstance(raw_key, bytes):
+        raw_key = raw_key.decode()
+    bucket, _, ip = raw_key[len(prefix) + len(KEY_PREFIX):].rpartition('_')
+    return bucket, ip
+
+
+def _local_keys(prefix):
+    """Ключи лимитов в LocMemCache (только для разработки)"""
+    keys = getattr(cache, '_cache', None)
+    if not isinstance(keys, dict):
+        raise NotImplementedError('Просмотр ключей поддерживается только для Redis и LocMemCache')
+    return [key for key in list(keys) if key.startswith(prefix + KEY_PREFIX)]
+
+
+def _iter_raw(batch_size):
+    """Выдает пачки (prefix, ключи, значения, now_ms): один SCAN и один MGET на пачку"""
+    prefix = str(cache.make_key(''))
+    client = get_redis_client()
+    if client is not None:
+        pattern = f'{prefix}{KEY_PREFIX}*'
+        for keys in _batched(client.scan_iter(match=pattern, count=batch_size), batch_size):
+            values = client.mget(keys)
+            seconds, microseconds = client.time()
+            yield prefix, keys, values, seconds * 1000 + microseconds / 1000
+        return
+
+    for keys in _batched(_local_keys(prefix), batch_size):
+        found = cache.get_many([key[len(prefix):] for key in keys])
+        values = [found.get(key[len(prefix):]) for key in keys]
+        yield prefix, keys, values, time.time() * 1000
+
+
+def scan_rate_limits(batch_size=500):
+    """
+    Потоково перебирает состояние лимитов. Память не зависит от числа ключей.
+    """
+    policies = {policy.bucket: policy for policy in get_policies().values()}
+    for prefix, keys, values, now in _iter_raw(batch_size):
+        for key, value in zip(keys, values):
+            if value is None:
+                continue
+            bucket, ip = _parse_key(key, prefix)
+            backlog = max(0.0, float(value) - now)
+            policy = policies.get(bucket)
+            if policy is None:
+                yield LimitState(bucket, ip, 0, backlog / 1000, False)
+                continue
+            interval = policy.period * 1000 / policy.limit
+            yield LimitState(
+                bucket=bucket,
+                ip=ip,
+                used=min(policy.limit, math.ceil(backlog / interval)),
+                ttl=backlog / 1000,
+                blocked=backlog + interval > policy.period * 1000,
+            )
+
+
+def unblock(ips=None, buckets=None, batch_size=500):
+    """
+    Удаляет состояние лимитов для указанных IP и/или bucket (все, если не указано).
+    Возвращает число удаленных ключей. Локальные token bucket воркеров
+    восстанавливаются сами не позже чем через период политики.
+    """
+    ips = set(ips or ())
+    buckets = set(buckets or ())
+
+    def selected(key, prefix):
+        bucket, ip = _parse_key(key, prefix)
+        return (not ips or ip in ips) and (not buckets or bucket in buckets)
+
+    prefix = str(cache.make_key(''))
+    client = get_redis_client()
+    removed = 0
+    if client is not None:
+        pattern = f'{prefix}{KEY_PREFIX}*'
+        for keys in _batched(client.scan_iter(match=pattern, count=batch_size), batch_size):
+            keys = [key for key in keys if selected(key, prefix)]
+            if keys:
+                # UNLINK освобождает память в фоне и не блокирует Redis
+                removed += client.unlink(*keys)
+        return removed
+
+    for keys in _batched(_local_keys(prefix), batch_size):
+        keys = [key[len(prefix):] for key in keys if selected(key, prefix)]
+        cache.delete_many(keys)
+        removed += len(keys)
+    return removed
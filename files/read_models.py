@@ -0,0 +1,117 @@
+"""
+Облегченные read-модели для списков файлов.
+
+Вместо кеширования экземпляров File (pickle с FieldFile, _state и всеми
+колонками) кешируем компактный JSON-массив только с нужными для
+отображения значениями. Тип файла берется из колонки file_type.
+"""
+
+import json
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import File, FileDisplayMixin, classify_file_type
+from .metrics import record_cache
+
+
+class FileListItem(FileDisplayMixin):
+    """
+    Элемент списка файлов: только поля, которые выводятся в шаблонах.
+    Методы отображения (иконка, цвет, оставшееся время) берутся из FileDisplayMixin.
+    """
+
+    # Порядок полей определяет формат сериализованной строки
+    FIELDS = (
+        'code', 'filename', 'file_size', 'is_protected',
+        'download_count', 'created_at', 'expires_at', 'file_type',
+    )
+    # Поля, выбираемые из БД (file_type хранится в колонке)
+    DB_FIELDS = FIELDS
+
+    __slots__ = FIELDS
+
+    def __init__(self, code, filename, file_size, is_protected,
+                 download_count, created_at, expires_at, file_type):
+        self.code = code
+        self.filename = filename
+        self.file_size = file_size
+        self.is_protected = is_protected
+        self.download_count = download_count
+        self.created_at = created_at
+        self.expires_at = expires_at
+        self.file_type = file_type
+
+    @classmethod
+    def from_row(cls, row):
+        """Строит элемент из словаря QuerySet.values()"""
+        values = {name: row[name] for name in cls.DB_FIELDS}
+        # Старые записи без заполненного типа классифицируем по расширению
+        values['file_type'] = row['file_type'] or classify_file_type(row['filename'])
+        return cls(**values)
+
+    @classmethod
+    def from_list(cls, values):
+        """Восстанавливает элемент из компактного списка значений"""
+        item = cls(*values)
+        item.created_at = _from_timestamp(item.created_at)
+        item.expires_at = _from_timestamp(item.expires_at)
+        return item
+
+    def to_list(self):
+        """Компактное представление: список значений в порядке FIELDS"""
+        return [
+            self.code, self.filename, self.file_size, self.is_protected,
+            self.download_count, self.created_at.timestamp(),
+            self.expires_at.timestamp(), self.file_type,
+        ]
+
+    def get_file_type(self):
+        return self.file_type
+
+
+def _from_timestamp(value):
+    return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+
+
+def dumps(items):
+    """Сериализует список FileListItem в компактную JSON строку"""
+    return json.dumps([item.to_list() for item in items], ensure_ascii=False, separators=(',', ':'))
+
+
+def loads(blob):
+    """Восстанавливает список FileListItem из JSON строки"""
+    return [FileListItem.from_list(values) for values in json.loads(blob)]
+
+
+def recent_files_cache_key(session_id):
+    return f'recent_files_{session_id}'
+
+
+def get_recent_files(session_id, limit=3, timeout=120):
+    """
+    Возвращает последние активные файлы сессии (с кешированием).
+    В кеше хранится JSON строка, а не pickle экземпляров модели.
+    """
+    cache_key = recent_files_cache_key(session_id)
+    blob = cache.get(cache_key)
+    record_cache('recent_files', blob is not None)
+
+    if blob is None:
+        rows = File.objects.filter(
+            session_id=session_id,
+            expires_at__gt=timezone.now(),
+            is_deleted=False
+        ).order_by('-created_at').values(*FileListItem.DB_FIELDS)[:limit]
+        items = [FileListItem.from_row(row) for row in rows]
+        cache.set(cache_key, dumps(items), timeout)
+        return items
+
+    return loads(blob)
+
+
+def invalidate_recent_files(session_id):
+    """Сбрасывает кеш последних файлов сессии (после загрузки/изменения)"""
+    if session_id:
+        cache.delete(recent_files_cache_key(session_id))
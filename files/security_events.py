@@ -0,0 +1,169 @@
+"""
+Журнал событий безопасности без задержек для запросов.
+
+log_event() проверяет уровень и семплирование до какой-либо работы и
+передает в logging сырые поля: строка формируется только если запись
+действительно будет записана. BackgroundFileHandler кладет записи в
+ограниченную очередь, а фоновый поток форматирует их и пишет в файл
+пачками с одним flush на пачку. Медленный диск не задерживает запросы:
+при переполнении очереди записи отбрасываются, и их число пишется в лог.
+
+Формат строк совместим с files.security_log:
+[2025-01-01 12:00:00] WARNING SECURITY_EVENT <event> IP: <ip> key: value ...
+"""
+
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+
+from django.conf import settings
+
+security_logger = logging.getLogger('security')
+
+
+class EventFields:
+    """Поля события, превращаемые в строку только при форматировании записи"""
+    __slots__ = ('fields',)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __str__(self):
+        return ' '.join(f'{key}: {value}' for key, value in self.fields.items())
+
+
+def log_event(event, level=logging.WARNING, **fields):
+    """
+    Записывает событие безопасности. Поля выводятся в порядке передачи
+    (IP первым, как ожидает files.security_log). Для событий из SECURITY_EVENT_SAMPLING пишется доля записей, в строку
+    добавляется sample_rate, чтобы анализатор мог восстановить общее число.
+    """
+    if not security_logger.isEnabledFor(level):
+        return
+
+    rate = getattr(settings, 'SECURITY_EVENT_SAMPLING', {}).get(event, 1.0)
+    if rate < 1.0:
+        if random.random() >= rate:
+            return
+        fields['sample_rate'] = rate
+
+    security_logger.log(level, 'SECURITY_EVENT %s %s', event, EventFields(fields))
+
+
+class BackgroundFileHandler(logging.handlers.QueueHandler):
+    """
+    Handler для settings.LOGGING: запись в файл в фоновом потоке пачками.
+
+    Поток запускается при первой записи в каждом процессе (безопасно для
+    prefork воркеров gunicorn). После ротации лога (logrotate) файл
+    переоткрывается, как в WatchedFileHandler.
+    """
+
+    def __init__(self, filename, max_queue=10000, batch_size=500, encoding='utf-8'):
+        super().__init__(queue.Queue(max_queue))
+        self.filename = os.path.abspath(filename)
+        self.encoding = encoding
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Форматирование выполняется в фоновом потоке, а не в потоке запроса
+        return record
+
+    def enqueue(self, record):
+        self._ensure_writer()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Не блокируем запрос; потеря записей будет отражена в логе
+            self.dropped += 1
+
+    def _ensure_writer(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # После fork очередь могла унаследовать записи родителя
+                self.queue = queue.Queue(self.queue.maxsize)
+                self._thread = threading.Thread(target=self._run, name='security-log-writer', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        return open(self.filename, 'a', encoding=self.encoding)
+
+    def _reopen_if_rotated(self, stream):
+        try:
+            rotated = os.stat(self.filename).st_ino != os.fstat(stream.fileno()).st_ino
+        except FileNotFoundError:
+            rotated = True
+        if rotated:
+            stream.close()
+            stream = self._open()
+        return stream
+
+    def _take_batch(self):
+        """Ждет первую запись и добирает уже накопившиеся, не больше batch_size"""
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        stream = self._open()
+        try:
+            while True:
+                batch = self._take_batch()
+                stream = self._reopen_if_rotated(stream)
+                flushed = []
+                for record in batch:
+                    if record is None:
+                        return
+                    if isinstance(record, threading.Event):
+                        flushed.append(record)
+                        continue
+                    self._write(stream, record)
+                if self.dropped:
+                    dropped, self.dropped = self.dropped, 0
+                    self._write(stream, logging.makeLogRecord({
+                        'name': security_logger.name, 'levelno': logging.ERROR, 'levelname': 'ERROR',
+                        'msg': 'SECURITY_EVENT log_records_dropped count: %s', 'args': (dropped,),
+                    }))
+                stream.flush()
+                for event in flushed:
+                    event.set()
+        finally:
+            stream.close()
+
+    def _write(self, stream, record):
+        try:
+            stream.write(self.format(record) + '\n')
+        except Exception:
+            self.handleError(record)
+
+    def flush(self, timeout=5):
+        """Ждет, пока фоновый поток запишет на диск все уже поставленные записи"""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        """Дописывает очередь при завершении процесса (logging.shutdown)"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout=5)
+        self._thread = None
+        self._pid = None
+        super().close()
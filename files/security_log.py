@@ -0,0 +1,240 @@
+"""
+Потоковый анализ логов безопасности (logs/security.log).
+
+Лог не читается целиком: для окна «последние N минут/часов» файл читается
+блоками с конца до первой строки старше начала окна на ORDER_SLACK, а в инкрементальном
+режиме - вперед от смещения, сохраненного при прошлом запуске. Память
+ограничена размером блока и числом отслеживаемых IP (алгоритм Space-Saving),
+поэтому многогигабайтные логи анализируются за время, пропорциональное окну.
+
+Формат строк задает formatter 'security' в settings.LOGGING:
+[2025-01-01 12:00:00] WARNING SECURITY_EVENT <event> IP: <ip> ...
+"""
+
+import heapq
+import json
+import os
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+BLOCK_SIZE = 64 * 1024
+EVENT_MARKER = b'SECURITY_EVENT '
+SAMPLE_RATE_MARKER = b'sample_rate: '
+IP_RE = re.compile(rb'IP: ([0-9A-Fa-f:.]+)')
+# Строки лога упорядочены по времени только приблизительно: каждый процесс пишет
+# свои записи пачками из своей очереди (BackgroundFileHandler), и строка может
+# оказаться в файле после более новых строк других процессов на время задержки очереди
+ORDER_SLACK = timedelta(minutes=1)
+
+
+def get_log_file():
+    """Путь к логу безопасности из настроек LOGGING"""
+    handler = settings.LOGGING.get('handlers', {}).get('security_file', {})
+    return handler.get('filename', 'logs/security.log')
+
+
+def has_timestamp(line):
+    """Строка начинается с '[YYYY-MM-DD HH:MM:SS]' (а не продолжение, например traceback)"""
+    return line[:1] == b'[' and line[20:21] == b']'
+
+
+def parse_timestamp(line):
+    """Время строки или None для строк продолжения"""
+    if not has_timestamp(line):
+        return None
+    try:
+        return datetime.fromisoformat(line[1:20].decode('ascii'))
+    except ValueError:
+        return None
+
+
+def iter_lines_reverse(path, block_size=BLOCK_SIZE):
+    """Строки файла (bytes) от последней к первой, чтение блоками с конца"""
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        remainder = b''
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + remainder).split(b'\n')
+            remainder = lines[0]
+            for line in reversed(lines[1:]):
+                if line:
+                    yield line
+        if remainder:
+            yield remainder
+
+
+def iter_lines_forward(path, offset=0):
+    """
+    Полные строки файла начиная со смещения offset. Выдает (line, end_offset);
+    незавершенная последняя строка не выдается и будет прочитана в следующий раз.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                return
+            offset += len(line)
+            yield line.rstrip(b'\n'), offset
+
+
+class TopCounter:
+    """
+    Приблизительный топ самых частых значений в ограниченной памяти (Space-Saving).
+    Точен, пока число различных значений не превышает capacity.
+
+    Кандидаты на вытеснение - в min-куче (счетчик, значение) с ленивым
+    обновлением: увеличение счетчика кучу не трогает, устаревшая запись
+    обновляется, только когда доходит до вершины. Вытеснение - амортизированно
+    O(log capacity), а не просмотр всех счетчиков.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = {}
+        self._heap = []
+
+    def add(self, key, count=1):
+        if key in self.counts:
+            self.counts[key] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = count
+            heapq.heappush(self._heap, (count, key))
+            return
+        # Вытесняем самое редкое значение, новое наследует его счетчик
+        while True:
+            smallest, victim = self._heap[0]
+            actual = self.counts[victim]
+            if actual == smallest:
+                break
+            heapq.heapreplace(self._heap, (actual, victim))
+        del self.counts[victim]
+        self.counts[key] = smallest + count
+        heapq.heapreplace(self._heap, (smallest + count, key))
+
+    def most_common(self, n):
+        return Counter(self.counts).most_common(n)
+
+
+class SecurityLogStats:
+    """Агрегаты по строкам лога"""
+
+    def __init__(self, ip_capacity=1000):
+        self.lines = 0
+        self.levels = Counter()
+        self.events = Counter()
+        self.ips = TopCounter(ip_capacity)
+        # Время как bytes 'YYYY-MM-DD HH:MM:SS': лексикографический порядок совпадает с хронологическим
+        self._first = None
+        self._last = None
+
+    @property
+    def first(self):
+        return datetime.fromisoformat(self._first.decode('ascii')) if self._first else None
+
+    @property
+    def last(self):
+        return datetime.fromisoformat(self._last.decode('ascii')) if self._last else None
+
+    def add(self, line):
+        """Учитывает строку с временем (has_timestamp(line) == True)"""
+        self.lines += 1
+        timestamp = line[1:20]
+        if self._first is None or timestamp < self._first:
+            self._first = timestamp
+        if self._last is None or timestamp > self._last:
+            self._last = timestamp
+        self.levels[line[22:].split(b' ', 1)[0].decode('ascii', 'replace')] += 1
+
+        # Разбираем только строки событий безопасности
+        marker = line.find(EVENT_MARKER)
+        if marker == -1:
+            return
+        event = line[marker + len(EVENT_MARKER):].split(b' ', 1)[0]
+        weight = self._sample_weight(line, marker)
+        self.events[event.decode('utf-8', 'replace')] += weight
+        ip_match = IP_RE.search(line, marker)
+        if ip_match:
+            self.ips.add(ip_match.group(1).decode('ascii'), weight)
+
+    @staticmethod
+    def _sample_weight(line, start):
+        """Семплированная запись (sample_rate: 0.1) представляет 1 / rate событий"""
+        position = line.find(SAMPLE_RATE_MARKER, start)
+        if position == -1:
+            return 1
+        try:
+            rate = float(line[position + len(SAMPLE_RATE_MARKER):].split(b' ', 1)[0])
+            return max(1, round(1 / rate))
+        except (ValueError, ZeroDivisionError):
+            return 1
+
+    @property
+    def total_events(self):
+        return sum(self.events.values())
+
+
+def analyze_window(path, since=None, until=None, ip_capacity=1000, slack=ORDER_SLACK):
+    """
+    Агрегирует строки с since <= время < until, читая файл с конца.
+    Чтение останавливается на первой строке старше since - slack: строки окна,
+    записанные с задержкой до slack (см. ORDER_SLACK), тоже учитываются.
+    """
+    stats = SecurityLogStats(ip_capacity)
+    stop = since - slack if since is not None else None
+    for line in iter_lines_reverse(path):
+        timestamp = parse_timestamp(line)
+        if timestamp is None:
+            continue
+        if stop is not None and timestamp < stop:
+            break
+        if since is not None and timestamp < since:
+            continue
+        if until is not None and timestamp >= until:
+            continue
+        stats.add(line)
+    return stats
+
+
+def checkpoint_path(path):
+    return f'{path}.checkpoint'
+
+
+def load_checkpoint(path):
+    """
+    Смещение, на котором остановился прошлый запуск. При ротации лога
+    (другой inode или файл стал короче) анализ начинается с начала.
+    """
+    try:
+        with open(checkpoint_path(path), encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    stat = os.stat(path)
+    if checkpoint.get('inode') != stat.st_ino or checkpoint.get('offset', 0) > stat.st_size:
+        return 0
+    return checkpoint.get('offset', 0)
+
+
+def save_checkpoint(path, offset):
+    tmp_path = f'{checkpoint_path(path)}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'inode': os.stat(path).st_ino, 'offset': offset}, f)
+    os.replace(tmp_path, checkpoint_path(path))
+
+
+def analyze_incremental(path, ip_capacity=1000):
+    """Агрегирует строки, добавленные с прошлого запуска, и сохраняет новое смещение"""
+    offset = load_checkpoint(path)
+    stats = SecurityLogStats(ip_capacity)
+    for line, offset in iter_lines_forward(path, offset):
+        if has_timestamp(line):
+            stats.add(line)
+    save_checkpoint(path, offset)
+    return stats
@@ -0,0 +1,271 @@
+"""
+Агрегация SQL запросов по отпечаткам (fingerprint).
+
+Отпечаток - текст запроса без значений: строковые и числовые литералы
+заменяются на ?, списки IN (%s, %s, ...) сворачиваются в IN (...). Для
+каждой пары (view, отпечаток) считаются число запросов, суммарное и
+максимальное время. Если внутри одного HTTP запроса (или задачи) один и
+тот же отпечаток выполнен SQL_STATS['n_plus_one_threshold'] раз и больше,
+это отмечается как N+1.
+
+Где смотреть результаты:
+- /metrics: filehost_sql_queries, filehost_sql_query_seconds,
+  filehost_sql_query_max_seconds, filehost_sql_n_plus_one (метка
+  fingerprint - короткий хеш отпечатка);
+- команда sql_report: таблица с текстом отпечатков, суммированная по
+  всем процессам.
+
+Каждый процесс копит агрегаты в памяти и раз в SQL_STATS['flush_interval']
+секунд записывает накопленный итог в свой слот кеша. Слот пишет только его
+процесс, поэтому гонок между воркерами нет; слоты завершившихся процессов
+истекают через SQL_STATS['ttl'].
+"""
+
+import functools
+import hashlib
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from .metrics import SQL_N_PLUS_ONE, SQL_QUERIES, SQL_QUERY_MAX, SQL_QUERY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SEQ_KEY = 'sqlstats_seq'
+EPOCH_KEY = 'sqlstats_epoch'
+OTHER = 'other'
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)', re.IGNORECASE)
+_VALUES_RE = re.compile(r'\bVALUES\s*(\((?:[^()]|\([^()]*\))*\))(?:\s*,\s*\((?:[^()]|\([^()]*\))*\))+', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """
+    Нормализованный текст запроса. SQL от ORM с плейсхолдерами %s почти всегда
+    совпадает для одной формы запроса, поэтому результат кешируется.
+    """
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _VALUES_RE.sub(r'VALUES \1, ...', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint_id(text):
+    """Короткий идентификатор отпечатка для меток метрик"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=6).hexdigest()
+
+
+class QueryStats:
+    """
+    execute_wrapper: время и отпечатки SQL запросов одного HTTP запроса или задачи.
+    Атрибут count - общее число запросов.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.fingerprints = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.total_time += elapsed
+            entry = self.fingerprints.get(sql)
+            if entry is None:
+                # Ключ - исходный SQL: отпечаток считается один раз на форму запроса
+                self.fingerprints[sql] = [1, elapsed, elapsed, many]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+                if elapsed > entry[2]:
+                    entry[2] = elapsed
+
+    def grouped(self):
+        """{отпечаток: [count, total, max, many]} с объединением SQL, дающих один отпечаток"""
+        result = {}
+        for sql, (count, total, maximum, many) in self.fingerprints.items():
+            text = fingerprint(sql)
+            entry = result.get(text)
+            if entry is None:
+                result[text] = [count, total, maximum, many]
+            else:
+                entry[0] += count
+                entry[1] += total
+                entry[2] = max(entry[2], maximum)
+                entry[3] = entry[3] and many
+        return result
+
+
+class Aggregator:
+    """Накопленные в процессе агрегаты по (view, отпечаток) и их сброс в кеш"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.sql = {}
+        self.epoch = None
+        self.slot = None
+        self.pid = None
+        self.last_flush = time.monotonic()
+
+    def add(self, view, stats, flush=False):
+        """Добавляет запросы одного HTTP запроса или задачи; flush=True - сразу сохранить в кеш"""
+        config = settings.SQL_STATS
+        threshold = config['n_plus_one_threshold']
+        due = flush or time.monotonic() - self.last_flush >= config['flush_interval']
+        if due:
+            # Эпоха проверяется до добавления, чтобы sql_report --reset не стер новые данные
+            self._sync()
+        with self.lock:
+            for text, (count, total, maximum, many) in stats.grouped().items():
+                fid = fingerprint_id(text)
+                if fid not in self.sql:
+                    if len(self.sql) >= config['max_fingerprints']:
+                        fid, text = OTHER, OTHER
+                    self.sql[fid] = text
+                # executemany (bulk) - один вызов, а не N+1
+                n_plus_one = count >= threshold and not many
+
+                entry = self.entries.get((view, fid))
+                if entry is None:
+                    entry = self.entries[(view, fid)] = [0, 0.0, 0.0, 0]
+                entry[0] += count
+                entry[1] += total
+                entry[2] = max(entry[2], maximum)
+                entry[3] += n_plus_one
+
+                SQL_QUERIES.labels(view, fid).inc(count)
+                SQL_QUERY_SECONDS.labels(view, fid).inc(total)
+                SQL_QUERY_MAX.labels(view, fid).set(entry[2])
+                if n_plus_one:
+                    SQL_N_PLUS_ONE.labels(view, fid).inc()
+                    logger.info('N+1 в %s: %d раз %s', view, count, text[:300])
+        if due:
+            self._write()
+
+    def _sync(self):
+        """Слот процесса и эпоха: после sql_report --reset накопленные агрегаты обнуляются"""
+        try:
+            state = cache.get_many([EPOCH_KEY, SEQ_KEY])
+            epoch = state.get(EPOCH_KEY, 0)
+            with self.lock:
+                if self.pid != os.getpid() or state.get(SEQ_KEY, 0) < self.slot:
+                    # Новый процесс (в т.ч. после fork) или кеш был очищен - берем новый слот
+                    cache.add(SEQ_KEY, 0, timeout=None)
+                    self.slot = cache.incr(SEQ_KEY)
+                    self.pid = os.getpid()
+                if epoch != self.epoch:
+                    if self.epoch is not None:
+                        self.entries.clear()
+                        self.sql.clear()
+                    self.epoch = epoch
+        except Exception as e:
+            # Статистика не должна ломать запросы
+            logger.error('Ошибка синхронизации статистики SQL: %s', e)
+
+    def _write(self):
+        """Записывает итог процесса в его слот кеша"""
+        with self.lock:
+            if self.slot is None:
+                return
+            snapshot = {
+                'host': socket.gethostname(),
+                'pid': self.pid,
+                'epoch': self.epoch,
+                'updated_at': timezone.now(),
+                'entries': {key: list(value) for key, value in self.entries.items()},
+                'sql': dict(self.sql),
+            }
+            self.last_flush = time.monotonic()
+        try:
+            cache.set(slot_key(self.slot), snapshot, timeout=settings.SQL_STATS['ttl'])
+        except Exception as e:
+            logger.error('Ошибка сохранения статистики SQL: %s', e)
+
+
+aggregator = Aggregator()
+
+
+def slot_key(slot):
+    return f'sqlstats_proc_{slot}'
+
+
+@contextmanager
+def track_queries(view):
+    """
+    Учитывает SQL запросы блока (или функции, как декоратор) под именем view,
+    например 'task:cleanup_expired_files', и сразу сохраняет агрегаты: блок может
+    выполняться в короткоживущем процессе (cron). Для HTTP запросов это делает
+    MetricsMiddleware.
+    """
+    if not settings.SQL_STATS['enabled']:
+        yield None
+        return
+    stats = QueryStats()
+    with connection.execute_wrapper(stats):
+        try:
+            yield stats
+        finally:
+            aggregator.add(view, stats, flush=True)
+
+
+def collect_stats(batch_size=500):
+    """
+    Суммирует слоты всех процессов текущей эпохи.
+    Возвращает список словарей по (view, отпечаток).
+    """
+    seq = cache.get(SEQ_KEY, 0)
+    epoch = cache.get(EPOCH_KEY, 0)
+    merged = {}
+    sql = {}
+    for start in range(1, seq + 1, batch_size):
+        keys = [slot_key(slot) for slot in range(start, min(start + batch_size, seq + 1))]
+        for snapshot in cache.get_many(keys).values():
+            if snapshot['epoch'] != epoch:
+                continue
+            sql.update(snapshot['sql'])
+            for key, (count, total, maximum, n_plus_one) in snapshot['entries'].items():
+                entry = merged.setdefault(key, [0, 0.0, 0.0, 0])
+                entry[0] += count
+                entry[1] += total
+                entry[2] = max(entry[2], maximum)
+                entry[3] += n_plus_one
+
+    return [
+        {
+            'view': view,
+            'fingerprint_id': fid,
+            'sql': sql.get(fid, ''),
+            'count': count,
+            'total': total,
+            'max': maximum,
+            'avg': total / count if count else 0.0,
+            'n_plus_one': n_plus_one,
+        }
+        for (view, fid), (count, total, maximum, n_plus_one) in merged.items()
+    ]
+
+
+def reset_stats():
+    """Начинает новую эпоху: процессы обнулят агрегаты при следующем сбросе в кеш"""
+    cache.add(EPOCH_KEY, 0, timeout=None)
+    cache.incr(EPOCH_KEY)
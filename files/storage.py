@@ -0,0 +1,17 @@
+"""
+Хранилище загруженных файлов
+"""
+
+from django.core.files.storage import FileSystemStorage
+
+from .tracing import start_span
+
+
+class TracedFileSystemStorage(FileSystemStorage):
+    """FileSystemStorage, в котором запись файла выполняется в спане трассировки"""
+
+    def _save(self, name, content):
+        with start_span('storage.save', attributes={'storage.name': name, 'storage.size': content.size or 0}) as span:
+            name = super()._save(name, content)
+            span.set_attribute('storage.saved_name', name)
+            return name
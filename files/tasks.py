@@ -3,73 +3,127 @@ Celery tasks for 0123.ru file hosting
 """
 import os
 import logging
-from celery import shared_task
+from datetime import datetime
+from io import StringIO
+from celery import group, shared_task
 from django.utils import timezone
 from django.conf import settings
 from django.core.cache import cache
+from django.core.management import call_command
 from django.db import connection
 from .models import File
-from .management.commands.generate_sitemap import generate_sitemap
+from .partitions import maintain_partitions
+from .expiry import drain
+from .deletion import process_queue
+from .leases import Lease
+from .media_gc import gc_media
+from .metrics import CLEANUP_DURATION
+from .cleanup import cleanup_range, run_cleanup
+from .sqlstats import track_queries
+from . import tracing  # noqa: F401 - спаны задач и передача контекста трассировки (сигналы Celery)
 
 logger = logging.getLogger(__name__)
 
 @shared_task(bind=True, name='files.tasks.cleanup_expired_files')
+@CLEANUP_DURATION.labels('celery').time()
+@track_queries('task:cleanup_expired_files')
 def cleanup_expired_files(self):
     """
-    Асинхронная задача для удаления истекших файлов.
-    Заменяет cron задачу.
+    Координатор очистки истекших файлов: под арендой (один на все узлы и
+    cron) раздает диапазоны id задачам cleanup_expired_range на очереди maintenance.
     """
     try:
-        logger.info("Начинаем очистку истекших файлов...")
-        
-        # Находим истекшие файлы
-        expired_files = File.objects.filter(
-            expires_at__lt=timezone.now(),
-            is_deleted=False
-        )
-        
-        count = expired_files.count()
-        
-        if count == 0:
+        result = run_cleanup('celery', dispatch=dispatch_cleanup_ranges)
+        if result is None:
+            logger.info("Очистку координирует другой процесс, пропуск")
+            return "Пропущено: аренда у другого процесса"
+        if result['run'] is None:
             logger.info("Нет истекших файлов для удаления")
-            return f"Удалено файлов: 0"
-        
-        logger.info(f"Найдено {count} истекших файлов для удаления")
-        
-        # Удаляем файлы
-        deleted_count = 0
-        for file in expired_files:
-            try:
-                # Удаляем физический файл
-                if file.file and os.path.exists(file.file.path):
-                    os.remove(file.file.path)
-                    logger.debug(f"Удален физический файл: {file.file.path}")
-                
-                # Удаляем QR код
-                if file.qr_code and os.path.exists(file.qr_code.path):
-                    os.remove(file.qr_code.path)
-                    logger.debug(f"Удален QR код: {file.qr_code.path}")
-                
-                # Помечаем как удаленный
-                file.is_deleted = True
-                file.save()
-                
-                deleted_count += 1
-                logger.debug(f"Удален файл: {file.filename} (код: {file.code})")
-                
-            except Exception as e:
-                logger.error(f"Ошибка при удалении {file.filename}: {e}")
-        
-        # Очищаем кеш
-        cache.clear()
-        
-        logger.info(f"Успешно удалено {deleted_count} из {count} истекших файлов")
-        return f"Удалено файлов: {deleted_count}"
+            return "Удалено файлов: 0"
+        
+        logger.info(f"Проход очистки {result['run']}: выдано диапазонов {result['ranges']}")
+        return f"Выдано диапазонов: {result['ranges']}"
         
     except Exception as e:
         logger.error(f"Ошибка в задаче очистки файлов: {e}")
         raise
 
+def dispatch_cleanup_ranges(run, ranges):
+    cutoff = run['cutoff'].isoformat()
+    group(
+        cleanup_expired_range.s(run['id'], start, end, cutoff) for start, end in ranges
+    ).apply_async(queue='maintenance')
+
+@shared_task(bind=True, name='files.tasks.cleanup_expired_range')
+@track_queries('task:cleanup_expired_range')
+def cleanup_expired_range(self, run_id, start, end, cutoff):
+    """
+    Удаление истекших файлов одного диапазона id с контрольными точками.
+    """
+    counts = cleanup_range(run_id, start, end, datetime.fromisoformat(cutoff), 'celery')
+    if counts is None:
+        return f"Диапазон {start}-{end} обрабатывает другой воркер"
+    logger.info(f"Диапазон {start}-{end}: удалено {counts[0]}, ошибок {counts[1]}")
+    return f"Удалено файлов: {counts[0]}"
+
+@shared_task(bind=True, name='files.tasks.drain_expiry_wheel')
+@CLEANUP_DURATION.labels('wheel').time()
+def drain_expiry_wheel(self):
+    """
+    Асинхронная задача удаления файлов, срок которых наступил (колесо истечения).
+    Выполняется каждые EXPIRY_WHEEL['interval'] секунд небольшими пачками.
+    """
+    deleted = drain()
+    if deleted:
+        logger.info(f"Удалено истекших файлов: {deleted}")
+    return f"Удалено файлов: {deleted}"
+
+@shared_task(bind=True, name='files.tasks.process_deletion_queue')
+def process_deletion_queue(self):
+    """
+    Асинхронная задача физического удаления файлов, удаленных пользователями,
+    пачками из очереди с повторами.
+    """
+    deleted, failed = process_queue()
+    if deleted or failed:
+        logger.info(f"Очередь удаления: удалено {deleted}, ошибок {failed}")
+    return f"Удалено файлов: {deleted}, ошибок: {failed}"
+
+@shared_task(bind=True, name='files.tasks.gc_media')
+def gc_media_task(self):
+    """
+    Асинхронная задача сборки мусора в MEDIA_ROOT (файлы без записи File).
+    Под арендой: общий MEDIA_ROOT обходит один узел.
+    """
+    lease = Lease('media_gc', settings.MEDIA_GC['lease_ttl'])
+    if not lease.acquire():
+        return "Пропущено: сборку мусора выполняет другой процесс"
+    try:
+        results = gc_media(lease=lease)
+    finally:
+        lease.release()
+    deleted = sum(stats.deleted for stats in results)
+    reclaimed = sum(stats.reclaimed_bytes for stats in results)
+    logger.info(f"Сборка мусора media: удалено {deleted} файлов, освобождено {reclaimed} байт")
+    return [stats.to_dict() for stats in results]
+
+@shared_task(bind=True, name='files.tasks.maintain_file_partitions')
+def maintain_file_partitions(self):
+    """
+    Асинхронная задача обслуживания секций files_file (PostgreSQL):
+    секции вперед и отсоединение истекших.
+    """
+    try:
+        result = maintain_partitions()
+        if result is None:
+            return "Таблица не секционирована"
+        message = f"Создано секций: {len(result['created'])}, отсоединено: {len(result['retired'])}"
+        logger.info(message)
+        return message
+    except Exception as e:
+        logger.error(f"Ошибка обслуживания секций: {e}")
+        raise
+
 @shared_task(bind=True, name='files.tasks.generate_sitemap')
 def generate_sitemap_task(self):
     """
@@ -77,7 +131,9 @@ def generate_sitemap_task(self):
     """
     try:
         logger.info("Начинаем генерацию sitemap...")
-        result = generate_sitemap()
+        output = StringIO()
+        call_command('generate_sitemap', stdout=output)
+        result = output.getvalue().strip()
         logger.info(f"Sitemap сгенерирован: {result}")
         return result
     except Exception as e:
@@ -0,0 +1,105 @@
+"""
+Тесты очистки истекших файлов с арендой координатора и диапазонами id (files.cleanup)
+"""
+
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from ..cleanup import (
+    COORDINATOR_LEASE, RUN_KEY, _checkpoint_key, _range_name, cleanup_range, plan_ranges, run_cleanup,
+)
+from ..leases import Lease, held
+from ..models import File
+
+CLEANUP = {'lease_ttl': 60, 'range_size': 4, 'batch_size': 2, 'state_ttl': 600}
+
+
+class LeaseTestCase(SimpleTestCase):
+    """Тесты аренды через API кеша"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_single_owner(self):
+        """Аренду получает один владелец; чужой release ее не снимает"""
+        first, second = Lease('job', 60), Lease('job', 60)
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        self.assertFalse(second.renew())
+        second.release()
+        self.assertEqual(held(['job', 'other']), {'job'})
+        self.assertTrue(first.renew())
+        first.release()
+        self.assertTrue(second.acquire())
+        second.release()
+
+    def test_plan_ranges(self):
+        """Диапазоны покрывают min..max без пересечений"""
+        self.assertEqual(plan_ranges(3, 12, 4), [(3, 7), (7, 11), (11, 13)])
+        self.assertEqual(plan_ranges(5, 5, 4), [(5, 6)])
+
+
+@override_settings(CLEANUP=CLEANUP)
+class CleanupTestCase(TestCase):
+    """Тесты прохода координатора и обработки диапазонов"""
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp(prefix='cleanup_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.addCleanup(cache.clear)
+        now = timezone.now()
+        self.expired = [
+            File.objects.create(
+                filename=f'e{i}.txt', file_size=1, code=f'EX{i:04d}', expires_at=now - timedelta(minutes=1),
+            )
+            for i in range(9)
+        ]
+        File.objects.create(filename='live.txt', file_size=1, code='LIVE01', expires_at=now + timedelta(hours=1))
+
+    def test_run_in_process(self):
+        """Без Celery координатор сам обрабатывает все диапазоны и завершает проход"""
+        result = run_cleanup('test')
+        self.assertEqual((result['ranges'], result['deleted'], result['failed']), (3, 9, 0))
+        self.assertEqual(File.objects.filter(is_deleted=False).count(), 1)
+        self.assertIsNone(cache.get(RUN_KEY))
+        self.assertEqual(run_cleanup('test')['run'], None)
+
+    def test_single_coordinator(self):
+        """Пока аренду координатора держит другой процесс, проход пропускается"""
+        lease = Lease(COORDINATOR_LEASE, 60)
+        self.assertTrue(lease.acquire())
+        self.assertIsNone(run_cleanup('test'))
+        lease.release()
+        self.assertEqual(File.objects.filter(is_deleted=True).count(), 0)
+
+    def test_dispatch_skips_busy_and_resumes(self):
+        """Занятый диапазон повторно не выдается; прерванный продолжается с контрольной точки"""
+        dispatched = []
+        result = run_cleanup('test', dispatch=lambda run, ranges: dispatched.append((run, ranges)))
+        run, ranges = dispatched[0]
+        self.assertEqual(result['ranges'], 3)
+
+        # Первый диапазон обрабатывает живой воркер, второй прерван после контрольной точки
+        (first, first_end), (second, second_end), _ = ranges
+        busy = Lease(_range_name(run['id'], first), 60)
+        busy.acquire()
+        cache.set(_checkpoint_key(run['id'], second), second + 1, 600)
+        run_cleanup('test', dispatch=lambda run, ranges: dispatched.append((run, ranges)))
+        self.assertEqual(dispatched[1][0]['id'], run['id'])
+        self.assertEqual(dispatched[1][1], ranges[1:])
+        self.assertIsNone(cleanup_range(run['id'], first, first_end, run['cutoff'], 'test'))
+        busy.release()
+
+        self.assertEqual(cleanup_range(run['id'], second, second_end, run['cutoff'], 'test'), (2, 0))
+        # Строки до контрольной точки не тронуты
+        self.assertFalse(File.objects.get(pk=second).is_deleted)
+        self.assertFalse(File.objects.get(pk=second + 1).is_deleted)
@@ -0,0 +1,85 @@
+"""
+Тесты логического удаления и очереди физического удаления файлов (files.deletion)
+"""
+
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ..deletion import process_queue
+from ..models import File, PendingDeletion
+
+
+class DeletionQueueTestCase(TestCase):
+    """Тесты удаления файла пользователем и обработки очереди"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='deletion_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.file_instance = File(
+            filename='doc.txt', file_size=4, code='DEL001', expires_at=timezone.now() + timedelta(hours=1),
+        )
+        self.file_instance.file.save('doc.txt', ContentFile(b'data'), save=False)
+        self.file_instance.save()
+
+    def test_delete_is_tombstone(self):
+        """Удаление из интерфейса не трогает хранилище: пометка и очередь, два запроса"""
+        client = Client()
+        client.get(reverse('files:delete_file', kwargs={'code': 'DEL001'}))
+        with CaptureQueriesContext(connection) as captured:
+            response = client.post(reverse('files:delete_file', kwargs={'code': 'DEL001'}))
+        self.assertEqual(response.status_code, 302)
+        self.file_instance.refresh_from_db()
+        self.assertTrue(self.file_instance.is_deleted)
+        self.assertTrue(os.path.exists(self.file_instance.file.path))
+        names = set(PendingDeletion.objects.values_list('name', flat=True))
+        self.assertEqual(names, {self.file_instance.file.name, self.file_instance.qr_code.name})
+        writes = [query['sql'] for query in captured.captured_queries if not query['sql'].startswith('SELECT')]
+        self.assertEqual(len([sql for sql in writes if 'files_' in sql]), 2)
+
+        self.assertEqual(process_queue(), (2, 0))
+        self.assertFalse(os.path.exists(self.file_instance.file.path))
+        self.assertFalse(os.path.exists(self.file_instance.qr_code.path))
+        self.assertFalse(PendingDeletion.objects.exists())
+
+    def test_retry_with_backoff(self):
+        """Ошибка хранилища - повтор позже с растущей задержкой, после max_attempts - остается в очереди"""
+        # Непустой каталог на месте файла: storage.delete падает
+        blocked = os.path.join(self.media_root, 'blocked')
+        os.makedirs(os.path.join(blocked, 'inner'))
+        PendingDeletion.objects.create(name='blocked')
+        now = timezone.now()
+
+        with self.assertLogs('files.deletion', 'WARNING'):
+            self.assertEqual(process_queue(now), (0, 1))
+        item = PendingDeletion.objects.get()
+        self.assertEqual(item.attempts, 1)
+        self.assertEqual(item.next_attempt_at, now + timedelta(seconds=30))
+        self.assertEqual(process_queue(now), (0, 0))
+
+        with self.assertLogs('files.deletion', 'WARNING'):
+            self.assertEqual(process_queue(now + timedelta(seconds=30)), (0, 1))
+        item.refresh_from_db()
+        self.assertEqual(item.next_attempt_at, now + timedelta(seconds=90))
+        self.assertTrue(item.last_error)
+
+        with override_settings(DELETION_QUEUE=dict(
+            interval=30, batch_size=200, max_batches=10, max_attempts=2, retry_delay=30, max_retry_delay=3600,
+        )):
+            self.assertEqual(process_queue(now + timedelta(days=1)), (0, 0))
+            out = StringIO()
+            call_command('process_deletion_queue', stats=True, stdout=out)
+            self.assertIn('исчерпали попытки: 1', out.getvalue())
@@ -0,0 +1,172 @@
+"""
+Тесты стратегий отдачи файлов и бенчмарка benchmark_delivery
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import skipIf
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import Client, LiveServerTestCase, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from load_engine import aiohttp
+
+from ..delivery import HotFileCache
+from ..management.commands.benchmark_delivery import cpu_seconds
+from ..models import File
+
+BENCHMARK_DELIVERY = dict(settings.FILE_DELIVERY, benchmark=True, memory_max_file_size=1024)
+
+
+class HotFileCacheTestCase(SimpleTestCase):
+    """Тесты LRU кеша файлов в памяти"""
+
+    def test_lru_eviction_by_bytes(self):
+        """Давно не использованные файлы вытесняются при превышении лимита байт"""
+        class FakeFile:
+            def __init__(self, name, content):
+                self.name, self.content = name, content
+                self.reads = 0
+
+            def open(self, mode):
+                self.reads += 1
+                from io import BytesIO
+                return BytesIO(self.content)
+
+        cache_ = HotFileCache(max_bytes=250, max_file_size=100)
+        files = [FakeFile(f'f{i}', bytes([i]) * 100) for i in range(3)]
+        cache_.get(files[0], 100)
+        cache_.get(files[1], 100)
+        self.assertEqual(cache_.get(files[0], 100), files[0].content)  # f0 - недавно использованный
+        cache_.get(files[2], 100)
+        self.assertEqual(cache_.size, 200)
+        cache_.get(files[0], 100)
+        cache_.get(files[1], 100)
+        self.assertEqual((files[0].reads, files[1].reads), (1, 2))
+
+    def test_cpu_seconds(self):
+        """CPU процесса читается из /proc"""
+        if not os.path.isdir('/proc'):
+            self.skipTest('нет /proc')
+        self.assertGreater(cpu_seconds([os.getpid()]), 0)
+        self.assertIsNone(cpu_seconds([]))
+
+
+@override_settings(FILE_DELIVERY=BENCHMARK_DELIVERY, RATELIMIT_ENABLE=False)
+class DeliveryStrategyTestCase(TestCase):
+    """Тесты ответов разных стратегий скачивания"""
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp(prefix='delivery_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.small = self.create_file('SMALL1', 'small.txt', b'small content')
+        self.large = self.create_file('LARGE1', 'large.bin', b'x' * 4096)
+        self.client = Client()
+
+    def tearDown(self):
+        cache.clear()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def create_file(self, code, filename, content):
+        file_instance = File(
+            filename=filename, file_size=len(content), code=code, expires_at=timezone.now() + timedelta(hours=1),
+        )
+        file_instance.file.save(filename, ContentFile(content), save=False)
+        file_instance.save()
+        return file_instance
+
+    def download(self, file_instance, strategy):
+        response = self.client.get(
+            reverse('files:download_file', kwargs={'code': file_instance.code}), HTTP_X_DELIVERY_STRATEGY=strategy,
+        )
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, content
+
+    def test_strategies_return_same_file(self):
+        """sendfile, iterate и memory отдают одно и то же содержимое с одинаковыми заголовками"""
+        for strategy in ('sendfile', 'iterate', 'memory'):
+            response, content = self.download(self.small, strategy)
+            self.assertEqual(response['X-Delivery-Strategy'], strategy)
+            self.assertEqual(content, b'small content', strategy)
+            self.assertEqual(response['Content-Length'], str(self.small.file_size), strategy)
+            self.assertEqual(response['Content-Disposition'], 'attachment; filename="small.txt"', strategy)
+
+    def test_memory_falls_back_for_large_files(self):
+        """Файлы больше memory_max_file_size отдаются через sendfile"""
+        response, content = self.download(self.large, 'memory')
+        self.assertEqual(response['X-Delivery-Strategy'], 'sendfile')
+        self.assertEqual(len(content), 4096)
+
+    def test_accel_redirect(self):
+        """accel: пустое тело и X-Accel-Redirect на internal location nginx"""
+        response, content = self.download(self.small, 'accel')
+        self.assertEqual(content, b'')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.small.file.name)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="small.txt"')
+
+    def test_header_ignored_without_benchmark(self):
+        """Без FILE_DELIVERY['benchmark'] заголовок запроса не меняет стратегию"""
+        with override_settings(FILE_DELIVERY=dict(BENCHMARK_DELIVERY, benchmark=False)):
+            response, content = self.download(self.small, 'accel')
+        self.assertEqual(content, b'small content')
+        self.assertNotIn('X-Accel-Redirect', response)
+
+
+@skipIf(aiohttp is None, 'aiohttp не установлен')
+@override_settings(FILE_DELIVERY=BENCHMARK_DELIVERY, RATELIMIT_ENABLE=False)
+class BenchmarkDeliveryLiveTestCase(LiveServerTestCase):
+    """Прогон benchmark_delivery против тестового сервера"""
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp(prefix='delivery_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def tearDown(self):
+        cache.clear()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_sweep(self):
+        """Для каждой стратегии, размера и параллельности есть результат без ошибок"""
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            output = f.name
+        try:
+            out = StringIO()
+            call_command(
+                'benchmark_delivery', url=self.live_server_url, strategies='sendfile,iterate,memory',
+                sizes='1K,8K', concurrency='1,2', min_requests=4, max_requests=4,
+                server_pid=[os.getpid()], output=output, stdout=out,
+            )
+            with open(output, encoding='utf-8') as f:
+                results = json.load(f)
+        finally:
+            os.remove(output)
+
+        self.assertEqual(len(results), 3 * 2 * 2)
+        for result in results:
+            self.assertEqual(result['errors'], {})
+            self.assertEqual(result['latency']['count'], 4)
+            self.assertGreater(result['mb_per_second'], 0)
+        # memory до memory_max_file_size (1K) из кеша, больше - sendfile
+        actual = {(r['strategy'], r['size']): r['actual_strategy'] for r in results}
+        self.assertEqual(actual[('memory', 1024)], 'memory')
+        self.assertEqual(actual[('memory', 8192)], 'sendfile')
+        self.assertFalse(File.objects.filter(code__startswith='DLV').exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads')), [])
+        self.assertIn('memory>sendfile', out.getvalue())
@@ -0,0 +1,139 @@
+"""
+Тесты подписанных токенов доступа к защищенным файлам
+"""
+
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+import shutil
+import subprocess
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from ..models import File
+from ..tokens import make_download_token, check_download_token
+
+
+class DownloadTokenTestCase(TestCase):
+    """Тесты выдачи и проверки токенов"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='tokens_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.client = Client()
+        self.file_instance = File(
+            filename='secret.txt',
+            file_size=len(b'secret content'),
+            code='TOKEN1',
+            password=make_password('secret123'),
+            is_protected=True,
+            expires_at=timezone.now() + timedelta(hours=24)
+        )
+        self.file_instance.file.save('secret.txt', ContentFile(b'secret content'), save=False)
+        self.file_instance.save()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_token_roundtrip(self):
+        """Выданный токен проходит проверку только для своего файла"""
+        token = make_download_token(self.file_instance)
+        self.assertTrue(check_download_token(self.file_instance, token))
+        self.assertFalse(check_download_token(self.file_instance, token + 'x'))
+        self.assertFalse(check_download_token(self.file_instance, ''))
+
+        other = File(code='OTHER', password=self.file_instance.password)
+        self.assertFalse(check_download_token(other, token))
+
+    def test_password_change_revokes_token(self):
+        """Смена пароля делает старые токены недействительными"""
+        token = make_download_token(self.file_instance)
+        self.file_instance.password = make_password('new-password')
+        self.assertFalse(check_download_token(self.file_instance, token))
+
+    @override_settings(DOWNLOAD_TOKEN_TTL=60)
+    def test_token_expires(self):
+        """Токен истекает через DOWNLOAD_TOKEN_TTL секунд"""
+        token = make_download_token(self.file_instance)
+        with mock.patch('django.core.signing.time.time', return_value=timezone.now().timestamp() + 120):
+            self.assertFalse(check_download_token(self.file_instance, token))
+
+    def test_download_with_token_skips_password_hashing(self):
+        """Скачивание по токену не вычисляет хеш пароля и не пишет сессию"""
+        token = make_download_token(self.file_instance)
+        url = reverse('files:download_file', kwargs={'code': 'TOKEN1'})
+
+        with mock.patch('files.passwords.verify_password') as verify_password:
+            response = self.client.get(url, {'token': token})
+            verify_password.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'secret content')
+        self.assertNotIn('sessionid', response.cookies)
+
+    def test_download_without_token_redirects(self):
+        """Без токена защищенный файл не отдается"""
+        url = reverse('files:download_file', kwargs={'code': 'TOKEN1'})
+        response = self.client.get(url)
+        self.assertRedirects(
+            response,
+            reverse('files:file_detail', kwargs={'code': 'TOKEN1'}),
+            fetch_redirect_response=False
+        )
+
+    def test_password_query_redirects_to_token_url(self):
+        """?password= проверяется один раз и меняется на ссылку с токеном"""
+        url = reverse('files:download_file', kwargs={'code': 'TOKEN1'})
+        response = self.client.get(url, {'password': 'secret123'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('token=', response['Location'])
+
+        response = self.client.get(response['Location'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_password_form_issues_token_links(self):
+        """После ввода пароля карточка файла содержит ссылки с токеном"""
+        response = self.client.post(
+            reverse('files:file_detail', kwargs={'code': 'TOKEN1'}),
+            {'password': 'secret123'}
+        )
+        self.assertEqual(response.status_code, 200)
+        token = response.context['download_token']
+        # Пароль мог быть перехеширован при проверке - токен привязан к актуальному хешу
+        self.file_instance.refresh_from_db()
+        self.assertTrue(check_download_token(self.file_instance, token))
+
+    def test_office_preview_fallback_keeps_token(self):
+        """Если превью не сделать, защищенный документ отдается по ссылке с токеном, а не через форму пароля"""
+        document = File(
+            filename='report.docx',
+            file_size=4,
+            code='TOKDOC',
+            password=self.file_instance.password,
+            is_protected=True,
+            expires_at=timezone.now() + timedelta(hours=24)
+        )
+        document.file.save('report.docx', ContentFile(b'docx'), save=False)
+        document.save()
+        url = reverse('files:view_file', kwargs={'code': 'TOKDOC'})
+        token = make_download_token(document)
+
+        failed = subprocess.CalledProcessError(1, 'libreoffice')
+        with mock.patch('files.views.shutil.which', return_value='/usr/bin/libreoffice'), \
+                mock.patch('files.views.subprocess.check_call', side_effect=failed):
+            converted = self.client.get(url, {'token': token})
+        with mock.patch('files.views.shutil.which', return_value=None):
+            missing = self.client.get(url, {'token': token})
+
+        for response in (converted, missing):
+            self.assertEqual(response.status_code, 302)
+            self.assertIn('token=', response['Location'])
+            download = self.client.get(response['Location'])
+            self.assertEqual(download.status_code, 200)
+            self.assertEqual(b''.join(download.streaming_content), b'docx')
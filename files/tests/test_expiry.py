@@ -0,0 +1,77 @@
+"""
+Тесты удаления истекших файлов по расписанию (files.expiry)
+"""
+
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..expiry import DatabaseWheel, drain, get_wheel, reset_wheel
+from ..models import File
+
+
+class ExpiryWheelTestCase(TestCase):
+    """Тесты прохода колеса истечения (расписание в БД)"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='expiry_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        reset_wheel()
+        self.addCleanup(reset_wheel)
+
+    def create_file(self, code, expires_in):
+        file_instance = File(
+            filename=f'{code}.txt', file_size=4, code=code, expires_at=timezone.now() + expires_in,
+        )
+        file_instance.file.save(f'{code}.txt', ContentFile(b'data'), save=False)
+        file_instance.save()
+        return file_instance
+
+    def test_backend_without_redis(self):
+        """Без Redis расписание - индекс в БД"""
+        self.assertIsInstance(get_wheel(), DatabaseWheel)
+
+    def test_drain_deletes_only_expired(self):
+        """Проход удаляет истекшие файлы с диска и не трогает живые"""
+        expired = self.create_file('EXP001', -timedelta(seconds=5))
+        live = self.create_file('LIVE01', timedelta(hours=1))
+
+        self.assertEqual(drain(), 1)
+        expired.refresh_from_db()
+        self.assertTrue(expired.is_deleted)
+        self.assertFalse(os.path.exists(expired.file.path))
+        self.assertFalse(os.path.exists(expired.qr_code.path))
+        live.refresh_from_db()
+        self.assertFalse(live.is_deleted)
+        self.assertTrue(os.path.exists(live.file.path))
+        self.assertEqual(drain(), 0)
+
+    def test_drain_in_batches(self):
+        """За проход не больше batch_size * max_batches файлов, остальные - в следующих проходах"""
+        for index in range(5):
+            self.create_file(f'BAT{index:03d}', -timedelta(seconds=index + 1))
+        config = {'backend': 'db', 'interval': 1, 'batch_size': 2, 'max_batches': 2, 'retry_delay': 60}
+        with override_settings(EXPIRY_WHEEL=config):
+            self.assertEqual(drain(), 4)
+            # Первыми удаляются истекшие раньше всех
+            self.assertEqual(list(File.objects.filter(is_deleted=False).values_list('code', flat=True)), ['BAT000'])
+            self.assertEqual(drain(), 1)
+
+    def test_command_stats(self):
+        """--stats показывает размер расписания"""
+        self.create_file('EXP002', -timedelta(seconds=5))
+        out = StringIO()
+        call_command('drain_expiry_wheel', stats=True, stdout=out)
+        self.assertIn('DatabaseWheel: в расписании 1, наступило 1', out.getvalue())
+        call_command('drain_expiry_wheel', stdout=out)
+        self.assertIn('Удалено файлов: 1', out.getvalue())
@@ -0,0 +1,74 @@
+"""
+Тесты сохраненной классификации типа файла
+"""
+
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from ..models import File, classify_file_type
+
+
+SESSION_ID = 'd' * 64
+
+
+class FileTypeTestCase(TestCase):
+    """Тесты колонок file_type/mime_type и фильтрации по типу"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='file_types_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.client = Client()
+        self.client.cookies['anonymous_session_id'] = SESSION_ID
+        for code, filename in [('TYPE1', 'photo.JPG'), ('TYPE2', 'notes.txt'), ('TYPE3', 'clip.mp4')]:
+            File.objects.create(
+                file=f'uploads/{filename}',
+                filename=filename,
+                file_size=10,
+                code=code,
+                session_id=SESSION_ID,
+                expires_at=timezone.now() + timedelta(hours=24)
+            )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_classification(self):
+        """Классификация по расширению без учета регистра"""
+        self.assertEqual(classify_file_type('a.PNG'), 'image')
+        self.assertEqual(classify_file_type('archive.tar.gz'), 'archive')
+        self.assertEqual(classify_file_type('noext'), 'other')
+
+    def test_type_stored_on_create(self):
+        """Тип и MIME тип вычисляются при создании записи"""
+        file = File.objects.get(code='TYPE1')
+        self.assertEqual(file.file_type, 'image')
+        self.assertEqual(file.mime_type, 'image/jpeg')
+
+    def test_filter_by_type(self):
+        """Фильтрация по типу выполняется в запросе к БД"""
+        response = self.client.get(reverse('files:api_recent_files'), {'type': 'image'})
+        codes = [item['code'] for item in response.json()['results']]
+        self.assertEqual(codes, ['TYPE1'])
+
+        # Неизвестный тип игнорируется
+        response = self.client.get(reverse('files:api_recent_files'), {'type': 'bogus'})
+        self.assertEqual(len(response.json()['results']), 3)
+
+    def test_backfill_command(self):
+        """Команда заполняет тип для старых записей"""
+        File.objects.update(file_type='', mime_type='')
+        call_command('backfill_file_types', batch_size=2, stdout=StringIO())
+
+        types = dict(File.objects.values_list('code', 'file_type'))
+        self.assertEqual(types, {'TYPE1': 'image', 'TYPE2': 'document', 'TYPE3': 'video'})
+        self.assertEqual(File.objects.get(code='TYPE2').mime_type, 'text/plain')
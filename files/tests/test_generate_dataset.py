@@ -0,0 +1,68 @@
+"""
+Тесты генератора синтетического набора файлов (manage.py generate_dataset)
+"""
+
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import Count
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from ..management.commands.generate_dataset import CODE_PREFIX, copy_value
+from ..models import File
+
+
+class CopyValueTestCase(SimpleTestCase):
+    """Тесты форматирования значений для COPY"""
+
+    def test_copy_value(self):
+        """NULL, логические значения, даты и спецсимволы в текстовом формате COPY"""
+        self.assertEqual(copy_value(None), '\\N')
+        self.assertEqual(copy_value(True), 't')
+        self.assertEqual(copy_value(datetime(2025, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc)), '2025-01-02T03:04:05+00:00')
+        self.assertEqual(copy_value('a\tb\\c\n'), 'a\\tb\\\\c\\n')
+        self.assertEqual(copy_value(42), '42')
+
+
+class GenerateDatasetTestCase(TestCase):
+    """Тесты генерации записей"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='dataset_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_generate_and_purge(self):
+        """Записи с реалистичными распределениями, разреженные файлы и удаление набора"""
+        call_command('generate_dataset', count=1000, batch_size=300, payloads=True, stdout=StringIO())
+
+        files = File.objects.filter(code__startswith=CODE_PREFIX)
+        self.assertEqual(files.count(), 1000)
+        now = timezone.now()
+        # Даты создания распределены по истории, удалены только истекшие
+        self.assertLess(files.order_by('created_at').first().created_at, now - timezone.timedelta(days=20))
+        self.assertFalse(files.filter(is_deleted=True, expires_at__gt=now).exists())
+        expired = files.filter(expires_at__lte=now)
+        self.assertGreater(expired.filter(is_deleted=True).count(), expired.count() * 0.85)
+        self.assertAlmostEqual(files.filter(is_protected=True).count() / 1000, 0.1, delta=0.04)
+        # Сессии по Ципфу: у самой активной сессии много файлов, у большинства - мало
+        per_session = list(files.values('session_id').annotate(n=Count('id')).order_by('-n').values_list('n', flat=True))
+        self.assertGreater(per_session[0], 20)
+        self.assertLessEqual(per_session[len(per_session) // 2], 2)
+
+        live = files.filter(is_deleted=False).first()
+        path = os.path.join(self.media_root, live.file.name)
+        self.assertEqual(os.path.getsize(path), live.file_size)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, files.filter(is_deleted=True).first().file.name)))
+
+        call_command('generate_dataset', purge=True, stdout=StringIO())
+        self.assertFalse(File.objects.filter(code__startswith=CODE_PREFIX).exists())
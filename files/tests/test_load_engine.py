@@ -0,0 +1,140 @@
+"""
+Тесты генератора нагрузки (load_engine.py в корне проекта)
+"""
+
+import random
+import shutil
+import tempfile
+from collections import Counter
+from unittest import skipIf
+
+from django.core.cache import cache
+from django.test import LiveServerTestCase, SimpleTestCase, override_settings
+
+from load_engine import (
+    SCENARIO_ENDPOINTS, LatencyHistogram, LoadConfig, Scenario, ZipfSampler, aiohttp, arrival_times, run_load,
+)
+
+
+class LatencyHistogramTestCase(SimpleTestCase):
+    """Тесты гистограммы задержек"""
+
+    def test_percentiles_within_precision(self):
+        """Перцентили совпадают с точными в пределах точности гистограммы"""
+        rng = random.Random(1)
+        values = sorted(rng.lognormvariate(-3, 1) for _ in range(20000))
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+
+        for q in (50, 95, 99, 99.9):
+            exact = values[int(len(values) * q / 100) - 1]
+            self.assertAlmostEqual(histogram.percentile(q) / exact, 1, delta=0.015, msg=f'p{q}')
+        self.assertEqual(histogram.max, values[-1])
+
+    def test_merge(self):
+        """Сумма гистограмм процессов равна гистограмме всех значений"""
+        first, second, combined = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+        for i in range(1, 1001):
+            (first if i % 2 else second).record(i / 1000)
+            combined.record(i / 1000)
+        first.merge(LatencyHistogram.from_dict(second.to_dict()))
+        self.assertEqual(first.counts, combined.counts)
+        self.assertEqual(first.percentile(99), combined.percentile(99))
+
+
+class ArrivalTimesTestCase(SimpleTestCase):
+    """Тесты расписания прибытия запросов"""
+
+    def test_constant_and_poisson_rates(self):
+        """Число запросов соответствует rate * duration"""
+        self.assertEqual(len(list(arrival_times(5, 2, 'constant'))), 10)
+        count = len(list(arrival_times(100, 100, 'poisson', random.Random(2))))
+        self.assertAlmostEqual(count / 10000, 1, delta=0.05)
+        with self.assertRaises(ValueError):
+            list(arrival_times(1, 1, 'bursty'))
+
+
+class ScenarioTestCase(SimpleTestCase):
+    """Тесты декларативных сценариев трафика"""
+
+    def test_zipf_popularity(self):
+        """Частота файла убывает с рангом как 1 / rank ** s"""
+        sampler = ZipfSampler(100, 1.0)
+        rng = random.Random(3)
+        counts = Counter(sampler.sample(rng) for _ in range(50000))
+        self.assertEqual(set(counts) - set(range(100)), set())
+        self.assertAlmostEqual(counts[0] / counts[1], 2, delta=0.2)
+        self.assertAlmostEqual(counts[0] / counts[9], 10, delta=2)
+
+    def test_file_sizes_and_types(self):
+        """Размеры попадают в корзины, имена содержат поисковое слово и расширение типа"""
+        scenario = Scenario(
+            'sizes', mix={'upload': 1}, sizes=[(3, 1, 10), (1, 100, 200)], file_types={'pdf': 1, 'jpg': 1},
+            search_terms=['invoice'],
+        )
+        rng = random.Random(4)
+        samples = [scenario.sample_file(rng) for _ in range(2000)]
+        small = [size for _, size in samples if size <= 10 * 1024]
+        self.assertTrue(all(1024 <= size <= 10 * 1024 or 100 * 1024 <= size <= 200 * 1024 for _, size in samples))
+        self.assertAlmostEqual(len(small) / len(samples), 0.75, delta=0.05)
+        self.assertEqual({name.split('_')[0] for name, _ in samples}, {'invoice'})
+        self.assertEqual({name.rsplit('.', 1)[1] for name, _ in samples}, {'pdf', 'jpg'})
+
+    def test_invalid_scenario(self):
+        """Неизвестный эндпоинт и некорректные корзины размеров отклоняются"""
+        with self.assertRaises(ValueError):
+            Scenario('bad', mix={'admin': 1}, sizes=[(1, 1, 2)], file_types={'txt': 1})
+        with self.assertRaises(ValueError):
+            Scenario('bad', mix={'detail': 1}, sizes=[(1, 0, 2)], file_types={'txt': 1})
+
+
+@skipIf(aiohttp is None, 'aiohttp не установлен')
+class OpenLoopLiveTestCase(LiveServerTestCase):
+    """Прогон открытой нагрузки против тестового сервера"""
+
+    def test_open_loop_run(self):
+        """Все запланированные запросы выполнены, задержки и пропускная способность посчитаны"""
+        result = run_load(LoadConfig(self.live_server_url, 'home', rate=20, duration=1, arrival='constant'))
+        summary = result.summary()
+        self.assertEqual(summary['scheduled'], 20)
+        self.assertEqual(summary['completed'], 20)
+        self.assertEqual(summary['statuses'], {'200': 20})
+        self.assertGreater(summary['latency']['p99'], 0)
+        self.assertGreater(summary['achieved_rps'], 0)
+
+
+@skipIf(aiohttp is None, 'aiohttp не установлен')
+@override_settings(RATELIMIT_ENABLE=False)
+class ScenarioLiveTestCase(LiveServerTestCase):
+    """Прогон сценария со всеми эндпоинтами против тестового сервера"""
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp(prefix='scenario_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def tearDown(self):
+        cache.clear()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_scenario_per_endpoint_stats(self):
+        """Пул засеян, все эндпоинты сценария отвечают без ошибок, статистика по каждому"""
+        scenario = Scenario(
+            'all', mix={endpoint: 1 for endpoint in SCENARIO_ENDPOINTS}, sizes=[(1, 1, 20)],
+            file_types={'pdf': 2, 'txt': 1}, protected_ratio=0.3, seed_files=15, sessions=3,
+        )
+        result = run_load(LoadConfig(
+            self.live_server_url, rate=70, duration=1, arrival='constant', seed=5, scenario=scenario,
+        ))
+        summary = result.summary()
+        self.assertEqual(summary['action'], 'scenario:all')
+        self.assertEqual(summary['completed'], 70)
+        self.assertEqual(summary['errors'], {})
+        self.assertEqual(set(summary['endpoints']), set(SCENARIO_ENDPOINTS))
+        for name, endpoint in summary['endpoints'].items():
+            self.assertEqual(set(endpoint['statuses']), {'200'}, name)
+            self.assertGreater(endpoint['latency']['p50'], 0, name)
+        self.assertEqual(sum(endpoint['count'] for endpoint in summary['endpoints'].values()), 70)
@@ -0,0 +1,102 @@
+"""
+Тесты сборки мусора в MEDIA_ROOT (files.media_gc)
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..media_gc import gc_media, live_names
+from ..models import File
+
+
+class MediaGCTestCase(TestCase):
+    """Тесты поиска и удаления файлов без записи в БД"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='gc_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.live = self.create_file('LIVE01')
+        self.deleted = self.create_file('GONE01')
+        File.objects.filter(pk=self.deleted.pk).update(is_deleted=True)
+        self.preview_live = self.write('previews/LIVE01.pdf', b'pdf')
+        self.preview_orphan = self.write('previews/GONE01.pdf', b'pdf!')
+        self.stray = self.write('uploads/2024/01/01/stray.bin', b'x' * 100)
+        self.age(self.media_root)
+
+    def create_file(self, code):
+        file_instance = File(
+            filename=f'{code}.txt', file_size=4, code=code, expires_at=timezone.now() + timedelta(hours=1),
+        )
+        file_instance.file.save(f'{code}.txt', ContentFile(b'data'), save=False)
+        file_instance.save()
+        return file_instance
+
+    def write(self, name, content):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def age(self, root, seconds=7200):
+        past = time.time() - seconds
+        for directory, _, names in os.walk(root):
+            for name in names:
+                os.utime(os.path.join(directory, name), (past, past))
+
+    def test_removes_orphans_keeps_live(self):
+        """Удаляются файлы удаленных записей, превью и бесхозные загрузки; файлы живых записей остаются"""
+        orphaned = 4 + 100 + 4 + os.path.getsize(self.deleted.qr_code.path)
+        results = {stats.directory: stats for stats in gc_media(chunk_size=2, workers=2)}
+        self.assertEqual(results['uploads'].deleted, 2)
+        self.assertEqual(results['qr_codes'].deleted, 1)
+        self.assertEqual(results['previews'].deleted, 1)
+        self.assertEqual(sum(stats.failed for stats in results.values()), 0)
+        self.assertEqual(sum(stats.reclaimed_bytes for stats in results.values()), orphaned)
+
+        for path in (self.live.file.path, self.live.qr_code.path, self.preview_live):
+            self.assertTrue(os.path.exists(path), path)
+        for path in (self.deleted.file.path, self.deleted.qr_code.path, self.preview_orphan, self.stray):
+            self.assertFalse(os.path.exists(path), path)
+
+    def test_skips_recent_files(self):
+        """Файлы моложе min_age не трогаются: запись могла еще не сохраниться"""
+        fresh = self.write('uploads/fresh.bin', b'new')
+        results = gc_media(directories=['uploads'], min_age=600)
+        self.assertEqual(results[0].deleted, 2)
+        self.assertTrue(os.path.exists(fresh))
+
+    def test_dry_run(self):
+        """В режиме dry-run ничего не удаляется, но объем подсчитывается"""
+        out = StringIO()
+        call_command('gc_media', '--dry-run', '--directory', 'previews', stdout=out)
+        self.assertTrue(os.path.exists(self.preview_orphan))
+        self.assertIn('previews', out.getvalue())
+        self.assertNotIn('uploads', out.getvalue())
+
+        results = gc_media(directories=['uploads'], dry_run=True)
+        self.assertEqual((results[0].orphans, results[0].deleted), (2, 0))
+        self.assertEqual(results[0].reclaimed_bytes, 104)
+        self.assertTrue(os.path.exists(self.stray))
+
+    @skipUnless(connection.vendor == 'sqlite', 'план запроса проверяется для SQLite')
+    def test_lookups_use_index(self):
+        """Пачка имен ищется по индексу, а не полным просмотром files_file"""
+        self.assertEqual(live_names('file', [self.live.file.name, 'uploads/stray.bin']), {self.live.file.name})
+        for field, index in (('file', 'files_file_live_file_idx'), ('qr_code', 'files_file_live_qr_idx')):
+            plan = File.objects.filter(is_deleted=False, **{f'{field}__in': ['a', 'b']}).explain()
+            self.assertIn(index, plan)
@@ -0,0 +1,92 @@
+"""
+Тесты метрик Prometheus
+"""
+
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import skipIf
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..metrics import prometheus_client
+from ..models import File
+
+
+def sample(name, **labels):
+    return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0
+
+
+@skipIf(prometheus_client is None, 'prometheus_client не установлен')
+class MetricsTestCase(TestCase):
+    """Тесты сбора и отдачи метрик"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='metrics_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.client = Client()
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_request_latency_and_queries_per_view(self):
+        """Запрос учитывается в гистограммах своего view"""
+        labels = {'view': 'files:recent_files', 'method': 'GET', 'status': '200'}
+        before = sample('filehost_request_duration_seconds_count', **labels)
+        self.client.get(reverse('files:recent_files'))
+        self.assertEqual(sample('filehost_request_duration_seconds_count', **labels), before + 1)
+        self.assertGreater(sample('filehost_request_db_queries_count', view='files:recent_files'), 0)
+
+    def test_served_bytes_and_cache_families(self):
+        """Отданные байты файла и промахи/попадания кеша учитываются"""
+        file_instance = File(
+            filename='metrics.txt',
+            file_size=len(b'metrics content'),
+            code='METRIC1',
+            expires_at=timezone.now() + timedelta(hours=24)
+        )
+        file_instance.file.save('metrics.txt', ContentFile(b'metrics content'), save=False)
+        file_instance.save()
+        try:
+            before = sample('filehost_served_bytes_total', view='files:download_file')
+            response = self.client.get(reverse('files:download_file', kwargs={'code': 'METRIC1'}))
+            b''.join(response.streaming_content)
+            self.assertEqual(
+                sample('filehost_served_bytes_total', view='files:download_file'),
+                before + len(b'metrics content')
+            )
+        finally:
+            file_instance.file.delete(save=False)
+
+        misses = sample('filehost_cache_requests_total', family='home_stats', result='miss')
+        hits = sample('filehost_cache_requests_total', family='home_stats', result='hit')
+        self.client.get(reverse('files:home'))
+        self.client.get(reverse('files:home'))
+        self.assertEqual(sample('filehost_cache_requests_total', family='home_stats', result='miss'), misses + 1)
+        self.assertEqual(sample('filehost_cache_requests_total', family='home_stats', result='hit'), hits + 1)
+
+    def test_metrics_endpoint(self):
+        """/metrics отдает текстовый формат только разрешенным адресам"""
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'filehost_request_duration_seconds', response.content)
+
+        response = self.client.get('/metrics', REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_token(self):
+        """С METRICS_TOKEN адрес не учитывается (за прокси он всегда 127.0.0.1), нужен токен"""
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret', REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,126 @@
+"""
+Тесты keyset пагинации списков файлов
+"""
+
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.core.cache import cache
+from django.utils import timezone
+import shutil
+import tempfile
+from datetime import timedelta
+
+from ..models import File
+from ..pagination import paginate_keyset, encode_cursor, decode_cursor
+
+
+SESSION_ID = 'a' * 64
+
+
+class KeysetPaginationTestCase(TestCase):
+    """Тесты курсорной пагинации"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='pagination_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.client = Client()
+        self.client.cookies['anonymous_session_id'] = SESSION_ID
+
+        # Одинаковое время создания у части файлов проверяет сортировку по id
+        created_at = timezone.now()
+        for i in range(25):
+            File.objects.create(
+                file='uploads/test.txt',
+                filename=f'report_{i}.txt',
+                file_size=100,
+                code=f'PAGE{i}',
+                session_id=SESSION_ID,
+                expires_at=timezone.now() + timedelta(hours=24)
+            )
+        File.objects.filter(code__in=['PAGE10', 'PAGE11', 'PAGE12']).update(created_at=created_at)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_cursor_roundtrip(self):
+        """Курсор кодируется и декодируется без потерь"""
+        now = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(now, 42)), (now, 42))
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+
+    def test_pages_cover_all_rows_once(self):
+        """Страницы не пересекаются и покрывают все файлы"""
+        queryset = File.objects.filter(session_id=SESSION_ID)
+        seen = []
+        cursor = None
+        while True:
+            page = paginate_keyset(queryset, cursor=cursor, per_page=7)
+            seen.extend(f.pk for f in page)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+
+        expected = list(queryset.order_by('-created_at', '-id').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_one_query_per_page(self):
+        """Каждая страница - один запрос к БД"""
+        queryset = File.objects.filter(session_id=SESSION_ID)
+        first = paginate_keyset(queryset, per_page=10)
+        with self.assertNumQueries(1):
+            paginate_keyset(queryset, cursor=first.next_cursor, per_page=10)
+
+    def test_api_recent_files(self):
+        """JSON API отдает страницы по курсору"""
+        response = self.client.get(reverse('files:api_recent_files'))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['results']), 20)
+        self.assertTrue(data['has_next'])
+
+        response = self.client.get(reverse('files:api_recent_files'), {'cursor': data['next_cursor']})
+        data = response.json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertFalse(data['has_next'])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_api_search_files(self):
+        """JSON API поиска фильтрует по запросу"""
+        response = self.client.get(reverse('files:api_search_files'), {'q': 'report_2'})
+        data = response.json()
+        codes = {item['code'] for item in data['results']}
+        self.assertEqual(codes, {'PAGE2', 'PAGE20', 'PAGE21', 'PAGE22', 'PAGE23', 'PAGE24'})
+
+        response = self.client.get(reverse('files:api_search_files'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_api_one_query_per_page(self):
+        """JSON API: страница - один запрос, без догрузки отложенных колонок по каждой строке"""
+        for url, params in (
+            (reverse('files:api_recent_files'), {}),
+            (reverse('files:api_search_files'), {'q': 'report'}),
+        ):
+            self.client.get(url, params)
+            with self.assertNumQueries(1):
+                data = self.client.get(url, params).json()
+            self.assertGreater(len(data['results']), 1)
+            self.assertIn('mime_type', data['results'][0])
+
+    def test_other_session_files_hidden(self):
+        """Файлы другой сессии не попадают в выдачу"""
+        self.client.cookies['anonymous_session_id'] = 'b' * 64
+        response = self.client.get(reverse('files:api_recent_files'))
+        self.assertEqual(response.json()['results'], [])
+
+    def test_html_pages_render(self):
+        """HTML страницы выводят ссылку на следующую страницу по курсору"""
+        response = self.client.get(reverse('files:recent_files'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '?cursor=')
+
+        response = self.client.get(reverse('files:search_files'), {'q': 'report'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '&cursor=')
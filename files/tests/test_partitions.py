@@ -0,0 +1,101 @@
+"""
+Тесты секционирования files_file по дням (files.partitions)
+"""
+
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import ArchivedPartition, File
+from ..partitions import (
+    Partition, create_partition_sql, day_start, expired_partitions, horizon_days, maintain_partitions,
+    missing_days, parse_bound, partition_name,
+)
+
+DAY = timedelta(days=1)
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+class PartitionPlanTestCase(SimpleTestCase):
+    """Тесты расчета границ, недостающих и истекших секций"""
+
+    def test_parse_bound(self):
+        """Границы из pg_get_expr, включая MINVALUE архивной секции"""
+        self.assertEqual(
+            parse_bound("FOR VALUES FROM ('2026-10-19 00:00:00+00') TO ('2026-10-20 00:00:00+00')"),
+            (utc(2026, 10, 19), utc(2026, 10, 20)),
+        )
+        self.assertEqual(parse_bound("FOR VALUES FROM (MINVALUE) TO ('2026-10-19 03:00:00+03')")[0], None)
+        with self.assertRaises(ValueError):
+            parse_bound('DEFAULT')
+
+    def test_missing_and_expired(self):
+        """Недостающие дни не пересекаются с существующими секциями; истекшие - с концом до now - grace"""
+        today = day_start(utc(2026, 10, 19, 15, 30))
+        self.assertEqual(today, utc(2026, 10, 19))
+        partitions = [
+            Partition('files_file_archive', None, today - DAY),
+            Partition(partition_name(today - DAY), today - DAY, today),
+            Partition(partition_name(today + DAY), today + DAY, today + 2 * DAY),
+        ]
+        self.assertEqual(partition_name(today), 'files_file_p20261019')
+        self.assertEqual(
+            missing_days(partitions, today - 2 * DAY, today + 3 * DAY), [today, today + 2 * DAY, today + 3 * DAY],
+        )
+        expired = expired_partitions(partitions, today + timedelta(minutes=30), timedelta(hours=1))
+        self.assertEqual([partition.name for partition in expired], ['files_file_archive'])
+        expired = expired_partitions(partitions, today + timedelta(hours=1), timedelta(hours=1))
+        self.assertEqual(len(expired), 2)
+
+    def test_create_sql_and_horizon(self):
+        """DDL дневной секции и горизонт не меньше срока жизни файла"""
+        sql = create_partition_sql(connection.ops.quote_name, utc(2026, 10, 19))
+        self.assertIn('PARTITION OF "files_file"', sql)
+        self.assertIn("FROM ('2026-10-19 00:00:00+00:00') TO ('2026-10-20 00:00:00+00:00')", sql)
+        with override_settings(FILE_EXPIRY_HOURS=24 * 10):
+            self.assertEqual(horizon_days(), 11)
+
+
+class PartitionMaintenanceTestCase(TestCase):
+    """Обслуживание секций на несекционированной таблице и статистика отсоединенных секций"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='partitions_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def test_maintain_without_partitioning(self):
+        """На SQLite обслуживание ничего не делает"""
+        self.assertIsNone(maintain_partitions())
+        out = StringIO()
+        call_command('maintain_partitions', stdout=out)
+        self.assertIn('не секционирована', out.getvalue())
+
+    def test_home_counts_archived_partitions(self):
+        """Общая статистика главной страницы учитывает отсоединенные секции"""
+        cache.clear()
+        File.objects.create(
+            filename='live.txt', file_size=1, code='LIVE01', download_count=2,
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+        ArchivedPartition.objects.create(
+            name='files_file_p20261001', range_start=utc(2026, 10, 1), range_end=utc(2026, 10, 2),
+            files_count=10, download_count=5, total_size=100,
+        )
+        response = Client().get(reverse('files:home'))
+        self.assertEqual(response.context['total_files'], 11)
+        self.assertEqual(response.context['total_downloads'], 7)
+        cache.clear()
@@ -0,0 +1,64 @@
+"""
+Тесты хеширования паролей защищенных файлов
+"""
+
+from django.test import TestCase, override_settings
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+import shutil
+import tempfile
+from datetime import timedelta
+
+from ..models import File
+from ..forms import PasswordForm
+from ..passwords import hash_password, verify_password, check_file_password, get_file_hasher
+
+
+class FilePasswordTestCase(TestCase):
+    """Тесты хешера паролей файлов и перехеширования старых значений"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='passwords_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def create_file(self, password):
+        return File.objects.create(
+            file='uploads/test.txt',
+            filename='test.txt',
+            file_size=10,
+            code='PASS1',
+            password=password,
+            is_protected=True,
+            expires_at=timezone.now() + timedelta(hours=24)
+        )
+
+    def test_hash_uses_file_hasher(self):
+        """Новые пароли хешируются настроенным алгоритмом"""
+        encoded = hash_password('secret123')
+        self.assertTrue(encoded.startswith(get_file_hasher().algorithm + '$'))
+        self.assertEqual(verify_password('secret123', encoded), (True, False))
+        self.assertEqual(verify_password('wrong', encoded), (False, False))
+
+    def test_plaintext_is_rehashed(self):
+        """Незахешированный пароль перехешируется при успешной проверке"""
+        file_instance = self.create_file('legacy-plain')
+        self.assertFalse(check_file_password(file_instance, 'wrong'))
+        self.assertEqual(File.objects.get(pk=file_instance.pk).password, 'legacy-plain')
+
+        self.assertTrue(check_file_password(file_instance, 'legacy-plain'))
+        stored = File.objects.get(pk=file_instance.pk).password
+        self.assertTrue(stored.startswith(get_file_hasher().algorithm + '$'))
+        self.assertTrue(check_file_password(file_instance, 'legacy-plain'))
+
+    def test_pbkdf2_is_rehashed(self):
+        """PBKDF2 хеши перехешируются через форму пароля"""
+        file_instance = self.create_file(make_password('secret123'))
+        form = PasswordForm(file_instance, {'password': 'secret123'})
+        self.assertTrue(form.is_valid())
+
+        stored = File.objects.get(pk=file_instance.pk).password
+        self.assertFalse(stored.startswith('pbkdf2_'))
+        self.assertEqual(verify_password('secret123', stored), (True, False))
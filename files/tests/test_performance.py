@@ -0,0 +1,280 @@
+"""
+Регрессионные тесты производительности: бюджеты SQL запросов и времени.
+
+Базовые значения хранятся в performance_baselines.json рядом с тестом:
+- queries: число SQL запросов view - превышение всегда ошибка;
+- timings: время view и микробенчмарков в единицах калибровочного цикла
+  (чистый Python), чтобы значения переносились между машинами; ошибка,
+  если время больше базового в PERF_TOLERANCE раз (по умолчанию 2).
+
+После намеренного изменения (новый запрос, оптимизация) базовые значения
+обновляются запуском:
+PERF_UPDATE_BASELINES=1 python manage.py test files.tests.test_performance
+"""
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+from unittest import skipIf
+
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import cron
+from ..models import File, classify_file_type
+from ..sqlstats import fingerprint
+from ..views import generate_unique_code
+
+try:
+    from .. import tasks
+except ImportError:
+    tasks = None
+
+BASELINES_PATH = Path(__file__).with_name('performance_baselines.json')
+UPDATE_BASELINES = os.getenv('PERF_UPDATE_BASELINES') == '1'
+TOLERANCE = float(os.getenv('PERF_TOLERANCE', 2.0))
+REPEAT = 5
+
+SESSION_ID = 'p' * 64
+SEED_SESSION_FILES = 200
+SEED_OTHER_FILES = 100
+SEED_EXPIRED_FILES = 50
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='perf_media_')
+
+
+def load_baselines():
+    try:
+        with open(BASELINES_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'queries': {}, 'timings': {}}
+
+
+BASELINES = load_baselines()
+MEASURED = {'queries': {}, 'timings': {}}
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+    if UPDATE_BASELINES:
+        for kind, values in MEASURED.items():
+            BASELINES.setdefault(kind, {}).update(values)
+        with open(BASELINES_PATH, 'w', encoding='utf-8') as f:
+            json.dump(BASELINES, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+def best_time(func, setup=None, repeat=REPEAT):
+    """Минимальное время func() из repeat запусков; setup() выполняется перед каждым и не учитывается"""
+    best = float('inf')
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _calibration_loop():
+    total = 0
+    for i in range(100000):
+        total += i * i % 7
+    return total
+
+
+_calibration = None
+
+
+def calibration():
+    """Время эталонного цикла на этой машине (единица измерения timings)"""
+    global _calibration
+    if _calibration is None:
+        _calibration = best_time(_calibration_loop, repeat=REPEAT * 2)
+    return _calibration
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RATELIMIT_ENABLE=False)
+class PerformanceTestCase(TestCase):
+    """Базовый класс: засеянный набор данных и проверка бюджетов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        kinds = ['report.pdf', 'photo.jpg', 'notes.txt', 'archive.zip', 'table.xlsx']
+        files = []
+        for i in range(SEED_SESSION_FILES):
+            files.append(File(
+                file=f'uploads/perf{i}.txt', filename=kinds[i % len(kinds)], file_size=1024 + i,
+                code=f'PS{i:05d}', session_id=SESSION_ID, file_type=classify_file_type(kinds[i % len(kinds)]),
+                is_protected=i % 10 == 0, expires_at=now + timedelta(hours=24), download_count=i,
+            ))
+        for i in range(SEED_OTHER_FILES):
+            files.append(File(
+                file=f'uploads/other{i}.txt', filename=f'other{i}.txt', file_size=2048,
+                code=f'PO{i:05d}', session_id='o' * 64, expires_at=now + timedelta(hours=24),
+            ))
+        for i in range(SEED_EXPIRED_FILES):
+            files.append(File(
+                file=f'uploads/expired{i}.txt', filename=f'expired{i}.txt', file_size=512,
+                code=f'PE{i:05d}', session_id='e' * 64, expires_at=now - timedelta(hours=1),
+            ))
+        File.objects.bulk_create(files, batch_size=500)
+
+        cls.public_file = File(
+            filename='public.txt', file_size=len(b'public content'), code='PUBLIC1',
+            session_id=SESSION_ID, expires_at=now + timedelta(hours=24),
+        )
+        cls.public_file.file.save('public.txt', ContentFile(b'public content'), save=False)
+        cls.public_file.save()
+
+    def setUp(self):
+        cache.clear()
+        Site.objects.clear_cache()
+
+    def tearDown(self):
+        cache.clear()
+
+    def check_queries(self, name, captured):
+        count = len(captured)
+        if UPDATE_BASELINES:
+            MEASURED['queries'][name] = count
+            return
+        budget = BASELINES['queries'].get(name)
+        if budget is None:
+            self.fail(f'Нет базового числа запросов для {name}: запустите с PERF_UPDATE_BASELINES=1')
+        if count > budget:
+            shapes = Counter(fingerprint(query['sql']) for query in captured.captured_queries)
+            details = '\n'.join(f'  {n} x {sql[:200]}' for sql, n in shapes.most_common())
+            self.fail(f'{name}: {count} SQL запросов при бюджете {budget}:\n{details}')
+
+    def check_time(self, name, seconds):
+        units = seconds / calibration()
+        if UPDATE_BASELINES:
+            MEASURED['timings'][name] = round(units, 3)
+            return
+        baseline = BASELINES['timings'].get(name)
+        if baseline is None:
+            self.fail(f'Нет базового времени для {name}: запустите с PERF_UPDATE_BASELINES=1')
+        self.assertLessEqual(
+            units, baseline * TOLERANCE,
+            f'{name}: {seconds * 1000:.2f} мс ({units:.2f} ед.) - медленнее базового {baseline:.2f} ед. '
+            f'больше чем в {TOLERANCE} раза'
+        )
+
+
+class ViewBudgetTestCase(PerformanceTestCase):
+    """Бюджеты SQL запросов и времени ответа основных страниц (холодный кеш)"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        self.client.cookies['anonymous_session_id'] = SESSION_ID
+
+    def get(self, path):
+        response = self.client.get(path)
+        if hasattr(response, 'streaming_content'):
+            b''.join(response.streaming_content)
+            response.close()
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def check_view(self, name, path):
+        # Прогрев: шаблоны, URL резолвер, кеш Site
+        self.get(path)
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            self.get(path)
+        self.check_queries(name, captured)
+        self.check_time(f'view:{name}', best_time(lambda: self.get(path), setup=cache.clear))
+
+    def test_home(self):
+        self.check_view('home', reverse('files:home'))
+
+    def test_file_detail(self):
+        self.check_view('file_detail', reverse('files:file_detail', kwargs={'code': 'PUBLIC1'}))
+
+    def test_download_file(self):
+        self.check_view('download_file', reverse('files:download_file', kwargs={'code': 'PUBLIC1'}))
+
+    def test_recent_files(self):
+        self.check_view('recent_files', reverse('files:recent_files'))
+
+    def test_search_files(self):
+        self.check_view('search_files', reverse('files:search_files') + '?q=report')
+
+    def test_sitemap_xml(self):
+        self.check_view('sitemap_xml', reverse('sitemap'))
+
+
+class MicrobenchmarkTestCase(PerformanceTestCase):
+    """Микробенчмарки сохранения файла, генерации кода и очистки истекших файлов"""
+
+    def test_file_save(self):
+        """File.save нового файла: классификация типа и генерация QR кода"""
+        counter = iter(range(10 ** 6))
+
+        def save():
+            File(
+                filename='bench.pdf', file_size=1, code=f'BS{next(counter):05d}',
+                expires_at=timezone.now() + timedelta(hours=1),
+            ).save()
+
+        with CaptureQueriesContext(connection) as captured:
+            save()
+        self.check_queries('File.save', captured)
+        self.check_time('File.save', best_time(save))
+
+    def test_generate_unique_code(self):
+        """generate_unique_code при засеянной таблице (20 вызовов)"""
+        def generate():
+            for _ in range(20):
+                generate_unique_code()
+
+        self.check_time('generate_unique_code', best_time(generate))
+
+    def reset_expired(self):
+        File.objects.filter(code__startswith='PE').update(is_deleted=False)
+
+    def test_cron_cleanup(self):
+        """files.cron.cleanup_expired_files на SEED_EXPIRED_FILES истекших файлах"""
+        def cleanup():
+            with contextlib.redirect_stdout(io.StringIO()):
+                cron.cleanup_expired_files()
+
+        self.reset_expired()
+        with CaptureQueriesContext(connection) as captured:
+            cleanup()
+        self.assertEqual(File.objects.filter(code__startswith='PE', is_deleted=True).count(), SEED_EXPIRED_FILES)
+        self.check_queries('cron.cleanup_expired_files', captured)
+        self.check_time('cron.cleanup_expired_files', best_time(cleanup, setup=self.reset_expired))
+
+    @skipIf(tasks is None, 'celery не установлен')
+    def test_celery_cleanup(self):
+        """files.tasks.cleanup_expired_files на SEED_EXPIRED_FILES истекших файлах"""
+        from filehost.celery import app
+
+        # Диапазоны выполняются сразу в этом процессе, без брокера
+        eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, 'task_always_eager', eager)
+        self.reset_expired()
+        with CaptureQueriesContext(connection) as captured:
+            tasks.cleanup_expired_files()
+        self.assertEqual(File.objects.filter(code__startswith='PE', is_deleted=True).count(), SEED_EXPIRED_FILES)
+        self.check_queries('tasks.cleanup_expired_files', captured)
+        self.check_time('tasks.cleanup_expired_files', best_time(tasks.cleanup_expired_files, setup=self.reset_expired))
@@ -0,0 +1,76 @@
+"""
+Тесты профилирования запросов
+"""
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from ..profiling import get_profile, list_profiles, make_profile_token, store_profile
+
+
+class ProfilingTestCase(TestCase):
+    """Тесты ProfilingMiddleware, кольцевого буфера и страниц админки"""
+
+    def setUp(self):
+        self.client = Client()
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_signed_header_profiles_request(self):
+        """Запрос с токеном X-Profile профилируется: SQL, кеш и cProfile"""
+        response = self.client.get(reverse('files:home'), HTTP_X_PROFILE=make_profile_token())
+        record_id = int(response['X-Profile-Id'])
+
+        profile = get_profile(record_id)
+        self.assertEqual(profile['view'], 'files:home')
+        self.assertEqual(profile['trigger'], 'header')
+        self.assertGreater(profile['query_count'], 0)
+        self.assertTrue(any(call['key'].startswith('home_stats_') for call in profile['cache_calls']))
+
+    def test_secrets_not_recorded(self):
+        """Токен скачивания и пароль из параметров запроса не сохраняются в профиле"""
+        url = reverse('files:home')
+        response = self.client.get(
+            url, {'token': 'secret-token', 'password': 'secret-pass', 'q': 'x'},
+            HTTP_X_PROFILE=make_profile_token(),
+        )
+        path = get_profile(int(response['X-Profile-Id']))['path']
+        self.assertEqual(path, f'{url}?token=***&password=***&q=x')
+
+    def test_not_profiled_without_token(self):
+        """Без выборки и с поддельным токеном профиль не создается"""
+        response = self.client.get(reverse('files:home'))
+        self.assertNotIn('X-Profile-Id', response)
+        response = self.client.get(reverse('files:home'), HTTP_X_PROFILE='profile:forged:token')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(list_profiles(), [])
+
+    def test_sampling(self):
+        """sample_rate=1 профилирует каждый запрос"""
+        with override_settings(PROFILING={**settings.PROFILING, 'sample_rate': 1.0}):
+            response = self.client.get(reverse('files:recent_files'))
+        self.assertEqual(get_profile(int(response['X-Profile-Id']))['trigger'], 'sample')
+
+    def test_ring_buffer_is_bounded(self):
+        """Буфер хранит не больше buffer_size профилей, старые вытесняются"""
+        with override_settings(PROFILING={**settings.PROFILING, 'buffer_size': 2}):
+            ids = [store_profile({'n': n}) for n in range(3)]
+            self.assertEqual([record['id'] for record in list_profiles()], ids[:0:-1])
+            self.assertIsNone(get_profile(ids[0]))
+
+    def test_admin_pages(self):
+        """Профили видны в админке"""
+        response = self.client.get(reverse('files:home'), HTTP_X_PROFILE=make_profile_token())
+        record_id = int(response['X-Profile-Id'])
+
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.get(reverse('admin:files_request_profiles'))
+        self.assertContains(response, reverse('admin:files_request_profile', args=[record_id]))
+        response = self.client.get(reverse('admin:files_request_profile', args=[record_id]))
+        self.assertContains(response, 'cProfile')
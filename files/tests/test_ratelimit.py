@@ -0,0 +1,190 @@
+"""
+Тесты GCRA rate limiter и RateLimitMiddleware
+"""
+
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.utils import timezone
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from ..models import File
+from ..ratelimit import LocalTokenBucket, Policy, get_policies, limiter, scan_rate_limits, unblock
+
+
+class RateLimiterTestCase(TestCase):
+    """Тесты алгоритма и политик"""
+
+    def setUp(self):
+        cache.clear()
+        limiter.reset()
+
+    def tearDown(self):
+        cache.clear()
+        limiter.reset()
+
+    def test_gcra_allows_limit_then_blocks(self):
+        """Пропускается ровно limit запросов за период, затем сообщается время ожидания"""
+        policy = Policy('test', 3, 60)
+        results = [limiter.check(policy, '10.0.0.1')[0] for _ in range(3)]
+        self.assertEqual(results, [True, True, True])
+
+        allowed, retry_after = limiter.check(policy, '10.0.0.1')
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 0)
+        self.assertLessEqual(retry_after, 20)
+
+        # Другой IP считается отдельно
+        self.assertTrue(limiter.check(policy, '10.0.0.2')[0])
+
+    def test_gcra_refills_over_time(self):
+        """После interval = period / limit снова доступен один запрос"""
+        policy = Policy('test', 2, 60)
+        with mock.patch('files.ratelimit.time.time', return_value=1000.0):
+            limiter.check(policy, '10.0.0.1')
+            limiter.check(policy, '10.0.0.1')
+            self.assertFalse(limiter.check(policy, '10.0.0.1')[0])
+        with mock.patch('files.ratelimit.time.time', return_value=1031.0):
+            self.assertTrue(limiter.check(policy, '10.0.0.1')[0])
+            self.assertFalse(limiter.check(policy, '10.0.0.1')[0])
+
+    def test_local_token_bucket(self):
+        """Локальный предфильтр пропускает limit запросов и ограничивает число IP"""
+        bucket = LocalTokenBucket(max_entries=2)
+        self.assertTrue(bucket.allow('a', 2, 60))
+        self.assertTrue(bucket.allow('a', 2, 60))
+        self.assertFalse(bucket.allow('a', 2, 60))
+
+        bucket.allow('b', 2, 60)
+        bucket.allow('c', 2, 60)
+        self.assertEqual(list(bucket.buckets), ['b', 'c'])
+
+    @override_settings(RATE_LIMIT_POLICIES={
+        'files:search_files': {'bucket': 'search', 'limit': 5, 'period': 10, 'methods': ['GET']},
+    })
+    def test_policies_from_settings(self):
+        """RATE_LIMIT_POLICIES добавляет и переопределяет политики маршрутов"""
+        policies = get_policies()
+        self.assertEqual(policies['files:search_files'], Policy('search', 5, 10, ('GET',)))
+        self.assertEqual(policies['files:home'].methods, ('POST',))
+
+
+class RateLimitMiddlewareTestCase(TestCase):
+    """Тесты ответа middleware"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='ratelimit_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.client = Client()
+        cache.clear()
+        limiter.reset()
+        self.file_instance = File(
+            filename='public.txt',
+            file_size=len(b'content'),
+            code='LIMIT1',
+            expires_at=timezone.now() + timedelta(hours=24)
+        )
+        self.file_instance.file.save('public.txt', ContentFile(b'content'), save=False)
+        self.file_instance.save()
+        self.url = reverse('files:download_file', kwargs={'code': 'LIMIT1'})
+
+    def tearDown(self):
+        cache.clear()
+        limiter.reset()
+
+    @override_settings(RATE_LIMIT_API=2)
+    def test_api_returns_json_429_with_retry_after(self):
+        """API получает JSON 429 с заголовком Retry-After"""
+        url = reverse('files:api_upload')
+        for _ in range(2):
+            self.assertNotEqual(self.client.post(url).status_code, 429)
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(response.json()['success'])
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    @override_settings(RATE_LIMIT_DOWNLOAD=1)
+    def test_policy_applies_only_to_listed_methods(self):
+        """Политика скачивания не считает запросы других методов и маршрутов"""
+        self.client.post(self.url)
+        self.client.get(reverse('files:recent_files'))
+        self.assertNotEqual(self.client.get(self.url).status_code, 429)
+        self.assertEqual(self.client.get(self.url).status_code, 429)
+
+    @override_settings(RATELIMIT_ENABLE=False, RATE_LIMIT_DOWNLOAD=1)
+    def test_disabled(self):
+        """RATELIMIT_ENABLE=False отключает проверку"""
+        for _ in range(3):
+            self.assertNotEqual(self.client.get(self.url).status_code, 429)
+
+
+class RateLimitIntrospectionTestCase(TestCase):
+    """Тесты просмотра и снятия лимитов (security_monitor)"""
+
+    def setUp(self):
+        cache.clear()
+        limiter.reset()
+        download = get_policies()['files:download_file']
+        for _ in range(download.limit):
+            limiter.check(download, '10.0.0.1')
+        limiter.check(download, '10.0.0.2')
+        limiter.check(get_policies()['files:home'], '10.0.0.1')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_scan_rate_limits(self):
+        """Состояние восстанавливается из значений GCRA"""
+        states = {(s.bucket, s.ip): s for s in scan_rate_limits(batch_size=1)}
+        self.assertEqual(set(states), {
+            ('download', '10.0.0.1'), ('download', '10.0.0.2'), ('upload', '10.0.0.1'),
+        })
+        self.assertTrue(states[('download', '10.0.0.1')].blocked)
+        self.assertEqual(states[('download', '10.0.0.1')].used, 20)
+        self.assertFalse(states[('download', '10.0.0.2')].blocked)
+        self.assertEqual(states[('download', '10.0.0.2')].used, 1)
+
+    def test_unblock_ip_and_bucket(self):
+        """Снятие лимитов по IP и bucket"""
+        self.assertEqual(unblock(ips=['10.0.0.1'], buckets=['download']), 1)
+        self.assertTrue(limiter.check(get_policies()['files:download_file'], '10.0.0.1')[0])
+        self.assertEqual(unblock(), 3)
+        self.assertEqual(list(scan_rate_limits()), [])
+
+    @override_settings(RATE_LIMIT_POLICIES={
+        'files:search_files': {'bucket': 'api_search', 'limit': 2, 'period': 60, 'methods': ['GET']},
+    })
+    def test_bucket_name_with_underscore(self):
+        """Имя bucket с '_' не смешивается с адресом (IPv4 и IPv6)"""
+        search = get_policies()['files:search_files']
+        for ip in ('10.0.0.3', '2001:db8::1'):
+            for _ in range(search.limit):
+                limiter.check(search, ip)
+        states = {(s.bucket, s.ip): s for s in scan_rate_limits() if s.bucket == 'api_search'}
+        self.assertEqual(set(states), {('api_search', '10.0.0.3'), ('api_search', '2001:db8::1')})
+        self.assertTrue(states[('api_search', '10.0.0.3')].blocked)
+
+        self.assertEqual(unblock(buckets=['api_search']), 2)
+        self.assertEqual(unblock(ips=['10.0.0.1'], buckets=['api']), 0)
+        self.assertTrue(limiter.check(search, '10.0.0.3')[0])
+
+    def test_security_monitor_command(self):
+        """security_monitor работает через слой просмотра, а не cache._cache.keys()"""
+        out = StringIO()
+        call_command('security_monitor', '--check-rate-limits', stdout=out)
+        self.assertIn('DOWNLOAD: отслеживается IP: 2, заблокировано: 1', out.getvalue())
+        self.assertIn('10.0.0.1: 21 запросов (заблокирован: download)', out.getvalue())
+
+        out = StringIO()
+        call_command('security_monitor', '--unblock-ip', '10.0.0.2', stdout=out)
+        self.assertIn('Очищено 1 rate limits', out.getvalue())
@@ -0,0 +1,75 @@
+"""
+Тесты компактных read-моделей списков файлов
+"""
+
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.core.cache import cache
+from django.utils import timezone
+import shutil
+import tempfile
+from datetime import timedelta
+
+from ..models import File
+from ..read_models import FileListItem, dumps, loads, get_recent_files, recent_files_cache_key
+
+
+SESSION_ID = 'c' * 64
+
+
+class FileListItemTestCase(TestCase):
+    """Тесты FileListItem и кеша последних файлов"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='read_models_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.file_instance = File.objects.create(
+            file='uploads/photo.png',
+            filename='photo.png',
+            file_size=2048,
+            code='READ1',
+            session_id=SESSION_ID,
+            expires_at=timezone.now() + timedelta(hours=2)
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_roundtrip_preserves_display_fields(self):
+        """Сериализация не теряет отображаемые значения"""
+        item = get_recent_files(SESSION_ID)[0]
+        restored = loads(dumps([item]))[0]
+
+        self.assertEqual(restored.code, 'READ1')
+        self.assertEqual(restored.expires_at, self.file_instance.expires_at)
+        self.assertEqual(restored.get_file_type_icon(), self.file_instance.get_file_type_icon())
+        self.assertEqual(restored.get_file_type_name(), 'Изображение')
+        self.assertEqual(restored.get_remaining_time(), self.file_instance.get_remaining_time())
+
+    def test_cache_stores_json_not_model(self):
+        """В кеше хранится строка, а не экземпляры File"""
+        get_recent_files(SESSION_ID)
+        blob = cache.get(recent_files_cache_key(SESSION_ID))
+        self.assertIsInstance(blob, str)
+
+        with self.assertNumQueries(0):
+            items = get_recent_files(SESSION_ID)
+        self.assertIsInstance(items[0], FileListItem)
+
+    def test_item_has_no_instance_dict(self):
+        """Элемент списка использует __slots__"""
+        item = get_recent_files(SESSION_ID)[0]
+        self.assertFalse(hasattr(item, '__dict__'))
+
+    def test_home_renders_cached_items(self):
+        """Главная страница отображает файлы из кеша"""
+        client = Client()
+        client.cookies['anonymous_session_id'] = SESSION_ID
+        get_recent_files(SESSION_ID)
+
+        response = client.get(reverse('files:home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'photo.png')
@@ -0,0 +1,90 @@
+"""
+Тесты воспроизведения access лога (manage.py replay_access_log)
+"""
+
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import skipIf
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import LiveServerTestCase, SimpleTestCase, override_settings
+
+from load_engine import aiohttp
+
+from ..management.commands.replay_access_log import parse_line, route_of, schedule_offsets
+from ..models import File
+
+GUNICORN_LOG = '''\
+127.0.0.1 - - [10/Oct/2025:13:55:36 +0300] "GET /REPLAY1/detail/ HTTP/1.0" 200 5120 "-" "Mozilla/5.0" 35120
+127.0.0.1 - - [10/Oct/2025:13:55:36 +0300] "GET /REPLAY1/download/ HTTP/1.0" 200 2048 "-" "Mozilla/5.0" 8100
+127.0.0.1 - - [10/Oct/2025:13:55:37 +0300] "GET /REPLAY2/ HTTP/1.0" 200 4096 "-" "Mozilla/5.0" 9000
+127.0.0.1 - - [10/Oct/2025:13:55:37 +0300] "POST /REPLAY1/delete/ HTTP/1.0" 302 0 "-" "Mozilla/5.0" 3000
+127.0.0.1 - - [10/Oct/2025:13:55:38 +0300] "GET /static/css/style.css HTTP/1.0" 200 900 "-" "Mozilla/5.0" 500
+garbage line
+'''
+
+
+class ParseAccessLogTestCase(SimpleTestCase):
+    """Тесты разбора строк access лога"""
+
+    def test_gunicorn_and_nginx_durations(self):
+        """%(D)s gunicorn - микросекунды, $request_time nginx - секунды"""
+        entry = parse_line(GUNICORN_LOG.splitlines()[0])
+        self.assertEqual((entry['method'], entry['path'], entry['status'], entry['bytes']), ('GET', '/REPLAY1/detail/', 200, 5120))
+        self.assertAlmostEqual(entry['duration'], 0.03512)
+
+        nginx = parse_line(
+            '10.0.0.1 - - [10/Oct/2025:13:55:36 +0300] "GET /search/?q=a HTTP/1.1" 200 - "-" "curl/8.0" 0.120'
+        )
+        self.assertAlmostEqual(nginx['duration'], 0.12)
+        self.assertEqual(nginx['bytes'], 0)
+        self.assertIsNone(parse_line('10.0.0.1 - - [10/Oct/2025:13:55:36 +0300] "GET / HTTP/1.1" 200 5 "-" "curl/8.0"')['duration'])
+        self.assertIsNone(parse_line('garbage line'))
+
+    def test_routes_and_schedule(self):
+        """Маршрут и код из пути; запросы одной секунды распределены внутри нее"""
+        self.assertEqual(route_of('/ABC123/download/?token=x'), ('files:download_file', 'ABC123'))
+        self.assertEqual(route_of('/recent/'), ('files:recent_files', None))
+        entries = [parse_line(line) for line in GUNICORN_LOG.splitlines()[:3]]
+        offsets = schedule_offsets(entries)
+        self.assertEqual(min(offsets), 0)
+        self.assertLess(offsets[0], offsets[1])
+        self.assertAlmostEqual(offsets[2] - offsets[1], 0.75 - 0.009 + 0.0081, places=6)
+
+
+@skipIf(aiohttp is None, 'aiohttp не установлен')
+@override_settings(RATELIMIT_ENABLE=False)
+class ReplayLiveTestCase(LiveServerTestCase):
+    """Воспроизведение лога против тестового сервера"""
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp(prefix='replay_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        with tempfile.NamedTemporaryFile('w', suffix='.log', delete=False) as f:
+            f.write(GUNICORN_LOG)
+        self.log_path = f.name
+
+    def tearDown(self):
+        cache.clear()
+        os.remove(self.log_path)
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_replay_synthesizes_files_and_compares(self):
+        """Файлы созданы для существовавших кодов, запросы воспроизведены, задержки сравнены по маршрутам"""
+        out = StringIO()
+        call_command('replay_access_log', self.log_path, url=self.live_server_url, speed=10, force=True, stdout=out)
+        output = out.getvalue()
+
+        self.assertEqual(sorted(File.objects.values_list('code', flat=True)), ['REPLAY1', 'REPLAY2'])
+        self.assertEqual(File.objects.get(code='REPLAY1').file_size, 2048)
+        self.assertTrue(File.objects.get(code='REPLAY2').filename.endswith('.pdf'))
+        self.assertIn('к воспроизведению: 3, пропущено: 2, не разобрано: 1', output)
+        self.assertIn('Запланировано: 3, завершено: 3', output)
+        for route in ('files:file_detail', 'files:download_file', 'files:direct_pdf_view'):
+            self.assertIn(route, output)
@@ -0,0 +1,61 @@
+"""
+Тесты журнала событий безопасности
+"""
+
+import logging
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from ..security_events import BackgroundFileHandler, log_event, security_logger
+from ..security_log import analyze_window
+
+
+class SecurityEventsTestCase(SimpleTestCase):
+    """Тесты ленивой записи, семплирования и фонового handler"""
+
+    def test_disabled_level_does_no_work(self):
+        """Событие ниже уровня логгера не передается в logging"""
+        with mock.patch.object(security_logger, 'log') as log:
+            log_event('download_attempt', logging.DEBUG, IP='10.0.0.1')
+        log.assert_not_called()
+
+    @override_settings(SECURITY_EVENT_SAMPLING={'download_attempt': 0.25})
+    def test_sampling(self):
+        """Семплированные события пишутся с долей sample_rate"""
+        with mock.patch.object(security_logger, 'log') as log:
+            with mock.patch('files.security_events.random.random', return_value=0.9):
+                log_event('download_attempt', IP='10.0.0.1')
+            log.assert_not_called()
+
+            with mock.patch('files.security_events.random.random', return_value=0.1):
+                log_event('download_attempt', IP='10.0.0.1')
+        (level, message, event, fields), _ = log.call_args
+        self.assertEqual(message % (event, fields), 'SECURITY_EVENT download_attempt IP: 10.0.0.1 sample_rate: 0.25')
+
+    def test_background_handler_writes_batches(self):
+        """Фоновый handler пишет записи в формате, понятном анализатору"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'logs', 'security.log')
+            handler = BackgroundFileHandler(path)
+            handler.setFormatter(logging.Formatter(
+                '[{asctime}] {levelname} {message}', style='{', datefmt='%Y-%m-%d %H:%M:%S'
+            ))
+            logger = logging.getLogger('security.test_background')
+            logger.addHandler(handler)
+            logger.propagate = False
+            try:
+                for i in range(50):
+                    logger.warning('SECURITY_EVENT %s %s', 'rate_limit_exceeded', f'IP: 10.0.0.{i % 2}')
+                logger.warning('SECURITY_EVENT %s %s', 'download_attempt', 'IP: 10.0.0.9 sample_rate: 0.1')
+                handler.flush()
+
+                stats = analyze_window(path)
+                self.assertEqual(stats.events['rate_limit_exceeded'], 50)
+                self.assertEqual(stats.events['download_attempt'], 10)
+            finally:
+                logger.removeHandler(handler)
+                handler.close()
+            self.assertFalse(handler._thread)
@@ -0,0 +1,109 @@
+"""
+Тесты потокового анализа логов безопасности
+"""
+
+import os
+import random
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.test import SimpleTestCase
+
+from ..security_log import (
+    TopCounter, analyze_incremental, analyze_window, iter_lines_reverse,
+)
+
+
+class SecurityLogTestCase(SimpleTestCase):
+    """Тесты чтения с конца, окон времени и контрольной точки"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'security.log')
+        self.write([
+            '[2025-01-01 10:00:00] WARNING SECURITY_EVENT rate_limit_exceeded IP: 10.0.0.1 route: files:home',
+            'Traceback (most recent call last):',
+            '[2025-01-01 11:00:00] WARNING SECURITY_EVENT suspicious_request IP: 10.0.0.2',
+            '[2025-01-01 12:00:00] ERROR SECURITY_EVENT rate_limit_exceeded IP: 10.0.0.1 route: files:home',
+        ])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, lines):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def test_reverse_lines_across_blocks(self):
+        """Чтение с конца малыми блоками возвращает строки в обратном порядке"""
+        with open(self.path, 'rb') as f:
+            expected = f.read().split(b'\n')[:-1]
+        self.assertEqual(list(iter_lines_reverse(self.path, block_size=7)), expected[::-1])
+
+    def test_time_window(self):
+        """Учитываются только строки внутри окна"""
+        stats = analyze_window(self.path, since=datetime(2025, 1, 1, 10, 30), until=datetime(2025, 1, 1, 12))
+        self.assertEqual(stats.lines, 1)
+        self.assertEqual(stats.events['suspicious_request'], 1)
+
+        stats = analyze_window(self.path, since=datetime(2025, 1, 1))
+        self.assertEqual(stats.total_events, 3)
+        self.assertEqual(stats.events['rate_limit_exceeded'], 2)
+        self.assertEqual(stats.ips.most_common(1), [('10.0.0.1', 2)])
+        self.assertEqual(stats.levels['ERROR'], 1)
+
+    def test_time_window_tolerates_interleaved_writers(self):
+        """Строки окна, записанные другим процессом после более старых, не теряются"""
+        self.write([
+            '[2025-01-01 12:59:30] WARNING SECURITY_EVENT suspicious_request IP: 10.0.0.5',
+            '[2025-01-01 13:00:10] WARNING SECURITY_EVENT upload_too_large IP: 10.0.0.6',
+            '[2025-01-01 12:59:50] WARNING SECURITY_EVENT upload_too_large IP: 10.0.0.7',
+            '[2025-01-01 13:00:20] WARNING SECURITY_EVENT upload_too_large IP: 10.0.0.8',
+        ])
+        stats = analyze_window(self.path, since=datetime(2025, 1, 1, 13))
+        self.assertEqual(dict(stats.events), {'upload_too_large': 2})
+
+        # Без запаса чтение останавливается на строке 12:59:50 и теряет 13:00:10
+        stats = analyze_window(self.path, since=datetime(2025, 1, 1, 13), slack=timedelta(0))
+        self.assertEqual(stats.ips.most_common(5), [('10.0.0.8', 1)])
+
+    def test_incremental_checkpoint(self):
+        """Повторный запуск видит только новые строки, ротация сбрасывает смещение"""
+        self.assertEqual(analyze_incremental(self.path).total_events, 3)
+        self.assertEqual(analyze_incremental(self.path).total_events, 0)
+
+        self.write(['[2025-01-01 13:00:00] WARNING SECURITY_EVENT upload_too_large IP: 10.0.0.3'])
+        stats = analyze_incremental(self.path)
+        self.assertEqual(dict(stats.events), {'upload_too_large': 1})
+
+        # Ротация: файл заменен более коротким
+        os.remove(self.path)
+        self.write(['[2025-01-02 00:00:00] WARNING SECURITY_EVENT suspicious_request IP: 10.0.0.4'])
+        self.assertEqual(analyze_incremental(self.path).total_events, 1)
+
+    def test_top_counter_bounded(self):
+        """Счетчик IP не растет сверх capacity и сохраняет частые значения"""
+        counter = TopCounter(capacity=2)
+        for key in ['a', 'a', 'a', 'b', 'c', 'd']:
+            counter.add(key)
+        self.assertEqual(len(counter.counts), 2)
+        self.assertEqual(counter.most_common(1), [('a', 3)])
+
+    def test_top_counter_matches_space_saving(self):
+        """Куча дает те же счетчики, что и вытеснение минимума полным просмотром"""
+        rng = random.Random(7)
+        keys = [f'10.0.{rng.randint(0, 3)}.{rng.randint(0, 60)}' for _ in range(5000)]
+        counter = TopCounter(capacity=50)
+        reference = {}
+        for key in keys:
+            counter.add(key)
+            if key in reference:
+                reference[key] += 1
+            elif len(reference) < 50:
+                reference[key] = 1
+            else:
+                victim = min(reference, key=lambda k: (reference[k], k))
+                reference[key] = reference.pop(victim) + 1
+        self.assertEqual(counter.counts, reference)
+        self.assertEqual(counter.most_common(3), Counter(reference).most_common(3))
@@ -0,0 +1,89 @@
+"""
+Тесты агрегации SQL запросов по отпечаткам
+"""
+
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import File
+from ..sqlstats import collect_stats, fingerprint, track_queries
+
+
+class FingerprintTestCase(SimpleTestCase):
+    """Тесты нормализации SQL"""
+
+    def test_literals_and_lists_normalized(self):
+        """Литералы и списки значений не влияют на отпечаток"""
+        self.assertEqual(
+            fingerprint("SELECT * FROM files_file WHERE code = 'ABC'  AND id IN (%s, %s, %s) LIMIT 21"),
+            'SELECT * FROM files_file WHERE code = ? AND id IN (...) LIMIT ?',
+        )
+        self.assertEqual(
+            fingerprint('SELECT "t1"."id" FROM "t1" WHERE "t1"."id" IN (%s)'),
+            fingerprint('SELECT "t1"."id" FROM "t1" WHERE "t1"."id" IN (%s, %s)'),
+        )
+        self.assertEqual(
+            fingerprint('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)'),
+            'INSERT INTO t (a, b) VALUES (%s, %s), ...',
+        )
+
+
+@override_settings(SQL_STATS={
+    'enabled': True, 'n_plus_one_threshold': 3, 'flush_interval': 0, 'ttl': 60, 'max_fingerprints': 500,
+})
+class SQLStatsTestCase(TestCase):
+    """Тесты агрегации, поиска N+1 и команды sql_report"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='sqlstats_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.client = Client()
+        cache.clear()
+        call_command('sql_report', reset=True, stdout=StringIO())
+        expires_at = timezone.now() + timedelta(hours=1)
+        self.files = [
+            File.objects.create(filename=f'f{i}.txt', file_size=1, code=f'SQLST{i}', expires_at=expires_at)
+            for i in range(4)
+        ]
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_n_plus_one_detected(self):
+        """Повторение одного отпечатка в блоке отмечается как N+1"""
+        with track_queries('test:loop'):
+            for file in self.files:
+                File.objects.get(pk=file.pk)
+
+        rows = [row for row in collect_stats() if row['view'] == 'test:loop']
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['count'], 4)
+        self.assertEqual(rows[0]['n_plus_one'], 1)
+        self.assertIn('FROM "files_file"', rows[0]['sql'])
+
+    def test_requests_aggregated_per_view(self):
+        """Запросы HTTP учитываются под именем view и попадают в отчет"""
+        self.client.get(reverse('files:recent_files'))
+        views = {row['view'] for row in collect_stats()}
+        self.assertIn('files:recent_files', views)
+
+        out = StringIO()
+        call_command('sql_report', view='files:recent_files', stdout=out)
+        self.assertIn('files:recent_files', out.getvalue())
+        self.assertIn('Топ', out.getvalue())
+
+        call_command('sql_report', reset=True, stdout=StringIO())
+        with track_queries('test:after_reset'):
+            File.objects.count()
+        self.assertEqual({row['view'] for row in collect_stats()}, {'test:after_reset'})
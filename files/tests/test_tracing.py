@@ -0,0 +1,117 @@
+"""
+Тесты трассировки запросов
+"""
+
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import File
+from ..tracing import extract, inject, start_span
+
+TRACING = {'enabled': True, 'sample_rate': 1.0, 'service_name': 'test', 'trust_incoming': False}
+
+
+def exported_spans(logs):
+    return [
+        json.loads(record.getMessage())['resourceSpans'][0]['scopeSpans'][0]['spans'][0]
+        for record in logs.records
+    ]
+
+
+class TraceContextTestCase(SimpleTestCase):
+    """Тесты передачи контекста (W3C traceparent)"""
+
+    @override_settings(TRACING=TRACING)
+    def test_inject_extract_roundtrip(self):
+        """Контекст текущего спана передается заголовком и восстанавливается"""
+        with self.assertLogs('tracing', 'INFO'):
+            with start_span('outer') as span:
+                headers = inject({})
+        context = extract(headers['traceparent'])
+        self.assertEqual(context.trace_id, span.context.trace_id)
+        self.assertEqual(context.span_id, span.context.span_id)
+        self.assertTrue(context.sampled)
+
+        self.assertIsNone(extract('garbage'))
+        self.assertIsNone(extract(f'00-{"0" * 32}-{"1" * 16}-01'))
+
+    @override_settings(TRACING=dict(TRACING, sample_rate=0.0))
+    def test_unsampled_trace_not_exported(self):
+        """Трейс вне выборки не пишется, но контекст (без флага sampled) передается дальше"""
+        with self.assertNoLogs('tracing', 'INFO'):
+            with start_span('outer'):
+                with start_span('inner'):
+                    headers = inject({})
+        self.assertFalse(extract(headers['traceparent']).sampled)
+
+
+@override_settings(TRACING=TRACING, RATELIMIT_ENABLE=False)
+class UploadTracingTestCase(TestCase):
+    """Тесты спанов загрузки файла"""
+
+    def setUp(self):
+        self.client = Client()
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+        for file_instance in File.objects.all():
+            file_instance.file.delete(save=False)
+            file_instance.qr_code.delete(save=False)
+
+    def test_upload_broken_down_into_spans(self):
+        """Загрузка: middleware, форма, File.save, QR и запись в хранилище - в одном трейсе"""
+        with self.assertLogs('tracing', 'INFO') as logs:
+            response = self.client.post(reverse('files:api_upload'), {
+                'file': SimpleUploadedFile('traced.txt', b'traced content'),
+            })
+        self.assertEqual(response.status_code, 200)
+
+        spans = exported_spans(logs)
+        by_name = {span['name']: span for span in spans}
+        root = by_name['HTTP POST files:api_upload']
+        self.assertEqual(response['X-Trace-Id'], root['traceId'])
+        self.assertEqual({span['traceId'] for span in spans}, {root['traceId']})
+        for name in (
+            'AnonymousSessionMiddleware.process_request', 'SecurityMonitoringMiddleware.process_request',
+            'FileUploadForm.full_clean', 'File.save',
+        ):
+            self.assertEqual(by_name[name]['parentSpanId'], root['spanId'], name)
+        self.assertEqual(by_name['File.generate_qr_code']['parentSpanId'], by_name['File.save']['spanId'])
+        storage_parents = {
+            span['attributes'][0]['value']['stringValue'].split('/')[0]: span['parentSpanId']
+            for span in spans if span['name'] == 'storage.save'
+        }
+        self.assertEqual(storage_parents, {
+            'uploads': by_name['File.save']['spanId'],
+            'qr_codes': by_name['File.generate_qr_code']['spanId'],
+        })
+
+    def test_trace_report(self):
+        """trace_report показывает медленные запросы и дерево спанов трейса"""
+        with self.assertLogs('tracing', 'INFO') as logs:
+            response = self.client.post(reverse('files:api_upload'), {
+                'file': SimpleUploadedFile('report.txt', b'report content'),
+            })
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write(''.join(record.getMessage() + '\n' for record in logs.records))
+        try:
+            out = StringIO()
+            call_command('trace_report', file=f.name, stdout=out)
+            self.assertIn(response['X-Trace-Id'], out.getvalue())
+
+            out = StringIO()
+            call_command('trace_report', file=f.name, trace_id=response['X-Trace-Id'], stdout=out)
+            tree = out.getvalue()
+            self.assertIn('HTTP POST files:api_upload', tree)
+            self.assertIn('    File.generate_qr_code', tree)
+        finally:
+            os.remove(f.name)
@@ -0,0 +1,129 @@
+"""
+Тесты допуска загрузок до чтения тела запроса
+"""
+
+import os
+import secrets
+import shutil
+import tempfile
+
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.urls import reverse
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest import mock
+
+from ..middleware import AnonymousSessionMiddleware, UploadAdmissionMiddleware
+from ..ratelimit import limiter
+
+
+@override_settings(MAX_FILE_SIZE=1024, UPLOAD_BODY_OVERHEAD=0, RATELIMIT_ENABLE=False)
+class UploadAdmissionTestCase(TestCase):
+    """Тесты UploadAdmissionMiddleware"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='admission_media_')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.client = Client()
+        cache.clear()
+        limiter.reset()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_oversize_rejected_without_parsing_body(self):
+        """Большой Content-Length отклоняется с 413 без разбора multipart"""
+        with mock.patch('django.http.request.HttpRequest._load_post_and_files') as load:
+            response = self.client.post(reverse('files:api_upload'), {
+                'file': SimpleUploadedFile('big.bin', b'x' * 2048),
+            })
+            load.assert_not_called()
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(response.json()['success'])
+
+    def test_concurrent_uploads_limited_per_session(self):
+        """Сверх UPLOAD_MAX_CONCURRENT_PER_SESSION активных загрузок получаем 429"""
+        session_id = 'a' * 64
+        self.client.cookies['anonymous_session_id'] = session_id
+        cache.set(f'upload_slots_{session_id}', 2)
+
+        with override_settings(UPLOAD_MAX_CONCURRENT_PER_SESSION=2):
+            response = self.client.post(reverse('files:api_upload'), {
+                'file': SimpleUploadedFile('small.txt', b'data'),
+            })
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        # Отклоненный запрос не занимает слот
+        self.assertEqual(cache.get(f'upload_slots_{session_id}'), 2)
+
+    def admit_concurrently(self, count, cookie=None):
+        """Статусы допуска count одновременных загрузок (слоты не освобождаются, как у незавершенных)"""
+        factory = RequestFactory()
+        sessions = AnonymousSessionMiddleware(lambda request: None)
+        admission = UploadAdmissionMiddleware(lambda request: None)
+        statuses = []
+        for _ in range(count):
+            request = factory.post(reverse('files:api_upload'), {'file': SimpleUploadedFile('small.txt', b'data')})
+            if cookie is not None:
+                request.COOKIES['anonymous_session_id'] = cookie()
+            sessions.process_request(request)
+            response = admission.process_request(request)
+            statuses.append(response.status_code if response else 200)
+        return statuses
+
+    @override_settings(UPLOAD_MAX_CONCURRENT_PER_SESSION=2)
+    def test_concurrent_uploads_without_cookie(self):
+        """Без cookie каждая загрузка получает новую сессию - лимит сессии считается по IP"""
+        self.assertEqual(self.admit_concurrently(3), [200, 200, 429])
+
+    @override_settings(UPLOAD_MAX_CONCURRENT_PER_SESSION=2, UPLOAD_MAX_CONCURRENT_PER_IP=3)
+    def test_concurrent_uploads_per_ip(self):
+        """Новая cookie на каждую загрузку не обходит общий лимит адреса"""
+        statuses = self.admit_concurrently(4, cookie=lambda: secrets.token_hex(32))
+        self.assertEqual(statuses, [200, 200, 200, 429])
+        # Отклоненная загрузка не занимает слот адреса
+        self.assertEqual(cache.get('upload_slots_ip_127.0.0.1'), 3)
+
+    def test_slot_released_after_upload(self):
+        """После завершения загрузки слот сессии освобождается"""
+        session_id = 'b' * 64
+        self.client.cookies['anonymous_session_id'] = session_id
+        self.client.post(reverse('files:api_upload'), {
+            'file': SimpleUploadedFile('small.txt', b'data'),
+        })
+        self.assertEqual(cache.get(f'upload_slots_{session_id}'), 0)
+
+    @override_settings(UPLOAD_MIN_FREE_SPACE=2 ** 62)
+    def test_low_disk_space(self):
+        """При нехватке места в MEDIA_ROOT загрузка отклоняется с 507"""
+        response = self.client.post(reverse('files:api_upload'), {
+            'file': SimpleUploadedFile('small.txt', b'data'),
+        })
+        self.assertEqual(response.status_code, 507)
+
+    def test_missing_media_root(self):
+        """До первой загрузки MEDIA_ROOT еще нет: место проверяется по родительскому каталогу"""
+        parent = tempfile.mkdtemp(prefix='admission_')
+        self.addCleanup(shutil.rmtree, parent, ignore_errors=True)
+        media_root = os.path.join(parent, 'media')
+        with override_settings(MEDIA_ROOT=media_root):
+            response = self.client.post(reverse('files:api_upload'), {
+                'file': SimpleUploadedFile('small.txt', b'data'),
+            })
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(os.path.isdir(media_root))
+
+            shutil.rmtree(media_root)
+            with override_settings(UPLOAD_MIN_FREE_SPACE=2 ** 62):
+                response = self.client.post(reverse('files:api_upload'), {
+                    'file': SimpleUploadedFile('small.txt', b'data'),
+                })
+            self.assertEqual(response.status_code, 507)
+
+    def test_other_requests_not_affected(self):
+        """GET и не загрузочные маршруты не проверяются"""
+        with override_settings(UPLOAD_MIN_FREE_SPACE=2 ** 62):
+            self.assertEqual(self.client.get(reverse('files:home')).status_code, 200)
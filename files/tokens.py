@@ -0,0 +1,39 @@
+"""
+Короткоживущие подписанные токены доступа к защищенным файлам.
+
+Токен выдается после одной успешной проверки пароля и проверяется
+по HMAC (сравнение за постоянное время) без обращения к сессии и без
+повторного вычисления хеша пароля. В соль подписи входит сохраненный
+хеш пароля, поэтому смена или снятие пароля отзывает все выданные токены.
+"""
+
+from django.conf import settings
+from django.core import signing
+
+
+TOKEN_SALT = 'files.download-token'
+
+
+def _signer(file_instance):
+    return signing.TimestampSigner(salt=f'{TOKEN_SALT}:{file_instance.password or ""}')
+
+
+def make_download_token(file_instance):
+    """
+    Выдает токен доступа к файлу на DOWNLOAD_TOKEN_TTL секунд.
+    """
+    return _signer(file_instance).sign(file_instance.code)
+
+
+def check_download_token(file_instance, token):
+    """
+    Проверяет токен: подпись, срок действия и соответствие коду файла.
+    """
+    if not token:
+        return False
+    try:
+        code = _signer(file_instance).unsign(token, max_age=settings.DOWNLOAD_TOKEN_TTL)
+    except signing.BadSignature:
+        # SignatureExpired - подкласс BadSignature
+        return False
+    return code == file_instance.code
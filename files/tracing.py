@@ -0,0 +1,249 @@
+"""
+Трассировка запросов: спаны, совместимые с OpenTelemetry.
+
+Корневой спан HTTP запроса создает TracingMiddleware (первым в MIDDLEWARE),
+вложенные - start_span()/traced() вокруг этапов: middleware, валидация форм,
+File.save и генерация QR кода, запись в хранилище, конвертация LibreOffice.
+Контекст передается в задачи Celery заголовком traceparent (W3C Trace
+Context), поэтому задача, поставленная из запроса, попадает в тот же трейс.
+Входящий заголовок traceparent (от балансировщика или клиента) продолжает
+внешний трейс.
+
+Завершенные спаны пишутся логгером 'tracing' через BackgroundFileHandler
+(сериализация и запись в фоновом потоке) в logs/traces.jsonl: одна строка -
+один запрос экспорта OTLP/JSON (ExportTraceServiceRequest). Такой файл читает
+receiver otlpjsonfile коллектора OpenTelemetry, а локально - команда
+trace_report, которая показывает дерево спанов трейса с длительностями.
+
+Выключено по умолчанию (TRACING['enabled']). В выключенном состоянии и для
+запросов вне выборки TRACING['sample_rate'] спаны не создаются.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    from celery import signals as celery_signals
+except ImportError:
+    celery_signals = None
+
+trace_logger = logging.getLogger('tracing')
+
+TRACEPARENT = 'traceparent'
+KIND_INTERNAL = 'SPAN_KIND_INTERNAL'
+KIND_SERVER = 'SPAN_KIND_SERVER'
+KIND_CONSUMER = 'SPAN_KIND_CONSUMER'
+
+_current = contextvars.ContextVar('trace_span', default=None)
+
+
+class SpanContext:
+    """Идентификаторы спана для наследования и передачи между процессами"""
+    __slots__ = ('trace_id', 'span_id', 'sampled')
+
+    def __init__(self, trace_id, span_id, sampled):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+
+class Span:
+    __slots__ = ('name', 'kind', 'context', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, name, kind, context, parent_id, attributes):
+        self.name = name
+        self.kind = kind
+        self.context = context
+        self.parent_id = parent_id
+        self.attributes = dict(attributes) if attributes else {}
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_error(self, error):
+        self.error = f'{type(error).__name__}: {error}'
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.context.trace_id,
+            'spanId': self.context.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': 'STATUS_CODE_ERROR', 'message': self.error} if self.error else {},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """Спан вне выборки: атрибуты и ошибки игнорируются"""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def record_error(self, error):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+class ExportRequest:
+    """Спан в формате OTLP/JSON, сериализуемый только при записи (в фоновом потоке)"""
+    __slots__ = ('span',)
+
+    def __init__(self, span):
+        self.span = span
+
+    def __str__(self):
+        return json.dumps({'resourceSpans': [{
+            'resource': {'attributes': [
+                _attribute('service.name', settings.TRACING['service_name']),
+                _attribute('process.pid', os.getpid()),
+            ]},
+            'scopeSpans': [{'scope': {'name': 'filehost'}, 'spans': [self.span.to_otlp()]}],
+        }]}, ensure_ascii=False)
+
+
+def current_context():
+    return _current.get()
+
+
+def begin_span(name, kind=KIND_INTERNAL, attributes=None, parent=None):
+    """
+    Начинает спан и делает его текущим. Возвращает (span, token) для end_span;
+    span - NOOP_SPAN, если трассировка выключена или трейс вне выборки.
+    Для спанов, которые начинаются и заканчиваются в разных функциях (задачи Celery).
+    """
+    config = settings.TRACING
+    if not config['enabled']:
+        return NOOP_SPAN, None
+    parent = parent or _current.get()
+    if parent is None:
+        # Решение о выборке принимается для корня и наследуется всем трейсом
+        sampled = random.random() < config['sample_rate']
+        trace_id = os.urandom(16).hex()
+        parent_id = None
+    else:
+        sampled = parent.sampled
+        trace_id = parent.trace_id
+        parent_id = parent.span_id
+
+    if not sampled:
+        # Вложенные спаны трейса вне выборки не создаются
+        return NOOP_SPAN, _current.set(SpanContext(trace_id, parent_id or os.urandom(8).hex(), False))
+
+    span = Span(name, kind, SpanContext(trace_id, os.urandom(8).hex(), True), parent_id, attributes)
+    return span, _current.set(span.context)
+
+
+def end_span(span, token, error=None):
+    if token is not None:
+        _current.reset(token)
+    if span is NOOP_SPAN:
+        return
+    if error is not None:
+        span.record_error(error)
+    span.end_ns = time.time_ns()
+    trace_logger.info('%s', ExportRequest(span))
+
+
+@contextmanager
+def start_span(name, kind=KIND_INTERNAL, attributes=None, parent=None):
+    """Спан вокруг блока; исключение отмечается в статусе спана и пробрасывается дальше"""
+    span, token = begin_span(name, kind, attributes, parent)
+    error = None
+    try:
+        yield span
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        end_span(span, token, error)
+
+
+def traced(name, **attributes):
+    """Декоратор: функция выполняется внутри спана name"""
+    return start_span(name, attributes=attributes)
+
+
+def inject(carrier):
+    """Добавляет traceparent текущего спана в заголовки (dict)"""
+    context = _current.get()
+    if context is not None:
+        carrier[TRACEPARENT] = f'00-{context.trace_id}-{context.span_id}-{"01" if context.sampled else "00"}'
+    return carrier
+
+
+def extract(traceparent):
+    """SpanContext из заголовка traceparent или None, если он отсутствует или неверен"""
+    if not traceparent:
+        return None
+    parts = traceparent.strip().split('-')
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3][:2], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == '0' * 32 or parts[2] == '0' * 16:
+        return None
+    return SpanContext(parts[1], parts[2], bool(flags & 1))
+
+
+if celery_signals is not None:
+    _task_spans = {}
+
+    @celery_signals.before_task_publish.connect(weak=False)
+    def _inject_task_context(headers=None, **kwargs):
+        if headers is not None:
+            inject(headers)
+
+    @celery_signals.task_prerun.connect(weak=False)
+    def _start_task_span(task_id=None, task=None, **kwargs):
+        parent = extract(getattr(task.request, TRACEPARENT, None))
+        _task_spans[task_id] = begin_span(
+            f'celery {task.name}', KIND_CONSUMER, {'celery.task_id': task_id, 'celery.task': task.name}, parent,
+        )
+
+    @celery_signals.task_failure.connect(weak=False)
+    def _fail_task_span(task_id=None, exception=None, **kwargs):
+        span, _ = _task_spans.get(task_id, (NOOP_SPAN, None))
+        span.record_error(exception)
+
+    @celery_signals.task_postrun.connect(weak=False)
+    def _end_task_span(task_id=None, state=None, **kwargs):
+        span, token = _task_spans.pop(task_id, (NOOP_SPAN, None))
+        span.set_attribute('celery.state', state or '')
+        try:
+            end_span(span, token)
+        except ValueError:
+            # Токен создан в другом контексте (пул потоков/gevent): просто завершаем спан
+            end_span(span, None)
@@ -16,6 +16,10 @@ urlpatterns = [
     # API для загрузки файлов
     path('api/upload/', views.api_upload, name='api_upload'),
     
+    # JSON API для постраничной подгрузки (keyset пагинация)
+    path('api/files/recent/', views.api_recent_files, name='api_recent_files'),
+    path('api/files/search/', views.api_search_files, name='api_search_files'),
+    
     # Проверка доступности кода
     path('check-code/', views.check_code_availability, name='check_code_availability'),
     
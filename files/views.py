@@ -2,28 +2,35 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.http import HttpResponse, Http404, JsonResponse, FileResponse
 from django.contrib import messages
 from django.utils.translation import gettext as _
-from django.contrib.auth.hashers import make_password
 from django.utils import timezone
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.core.paginator import Paginator
-from django.db.models import Q, Sum
+from django.db.models import Count, Q, Sum
 from django.urls import reverse
-from django_ratelimit.decorators import ratelimit
 from django.contrib.sitemaps import Sitemap
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
 import random
 import string
 from datetime import timedelta
 import os
 import subprocess
 import shutil
+import time
 import mimetypes
+from urllib.parse import urlencode
 
-from .models import File
+from .models import ArchivedPartition, File, FILE_TYPE_CHOICES, FILE_TYPE_NAMES
 from .forms import FileUploadForm, PasswordForm, FileEditForm
+from .pagination import paginate_keyset
+from .passwords import hash_password, hash_password_async, check_file_password
+from .tokens import make_download_token, check_download_token
+from .read_models import FileListItem, get_recent_files, invalidate_recent_files
+from .metrics import PREVIEW_GENERATION, record_cache, render_metrics
+from .tracing import start_span
+from .delivery import file_response
 
 
 def generate_unique_code():
@@ -39,7 +46,6 @@ def generate_unique_code():
             return code
 
 
-@ratelimit(key='ip', rate='10/m', method=['POST'])
 def home(request):
     """
     Главная страница с формой загрузки файлов.
@@ -59,6 +65,10 @@ def home(request):
             # Создаем новый файл
             file_instance = form.save(commit=False)
             
+            # Хеш пароля считается в пуле потоков параллельно с подготовкой записи
+            password = form.cleaned_data.get('password')
+            password_hash = hash_password_async(password) if password else None
+            
             # Устанавливаем имя файла и размер
             file_instance.filename = form.cleaned_data['file'].name
             file_instance.file_size = form.cleaned_data['file'].size
@@ -70,12 +80,9 @@ def home(request):
             else:
                 file_instance.code = generate_unique_code()
             
-            # Устанавливаем пароль и защиту
-            password = form.cleaned_data.get('password')
-            
             # Если есть пароль, то файл защищен
-            if password:
-                file_instance.password = make_password(password)
+            if password_hash:
+                file_instance.password = password_hash.result()
                 file_instance.is_protected = True
             else:
                 file_instance.is_protected = False
@@ -89,6 +96,7 @@ def home(request):
             
             # Сохраняем файл
             file_instance.save()
+            invalidate_recent_files(file_instance.session_id)
             
             # Возвращаем JSON ответ для показа модального окна
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -129,17 +137,8 @@ def home(request):
     # Получаем последние загруженные файлы для отображения (с кешированием)
     # Показываем только файлы текущего пользователя (если есть session_id)
     if hasattr(request, 'anonymous_session_id') and request.anonymous_session_id:
-        # Кешируем недавние файлы на 2 минуты
-        cache_key = f'recent_files_{request.anonymous_session_id}'
-        recent_files = cache.get(cache_key)
-        
-        if recent_files is None:
-            recent_files = list(File.objects.filter(
-                session_id=request.anonymous_session_id,
-                expires_at__gt=timezone.now(),
-                is_deleted=False
-            ).order_by('-created_at')[:3])
-            cache.set(cache_key, recent_files, 120)  # 2 минуты
+        # Кешируем компактную read-модель на 2 минуты (JSON, а не pickle File)
+        recent_files = get_recent_files(request.anonymous_session_id, limit=3, timeout=120)
     else:
         # Если session_id нет, показываем пустой список
         recent_files = []
@@ -149,10 +148,14 @@ def home(request):
     # Кешируем статистику на 5 минут
     cache_key = f'home_stats_{request.anonymous_session_id or "anonymous"}'
     cached_stats = cache.get(cache_key)
+    record_cache('home_stats', cached_stats is not None)
     
     if cached_stats is None:
-        total_files = File.objects.count()  # Все файлы (включая удаленные)
-        total_downloads = File.objects.aggregate(Sum('download_count')).get('download_count__sum') or 0
+        # Все файлы (включая удаленные и отсоединенные секции PostgreSQL)
+        totals = File.objects.aggregate(files=Count('id'), downloads=Sum('download_count'))
+        archived = ArchivedPartition.objects.aggregate(files=Sum('files_count'), downloads=Sum('download_count'))
+        total_files = totals['files'] + (archived['files'] or 0)
+        total_downloads = (totals['downloads'] or 0) + (archived['downloads'] or 0)
         
         cached_stats = {
             'total_files': total_files,
@@ -201,16 +204,14 @@ def file_detail(request, code):
         messages.error(request, _('Файл истек и больше недоступен.'))
         return redirect('files:home')
     
-    # Если файл защищен паролем, всегда запрашиваем пароль
+    # Если файл защищен паролем, запрашиваем пароль (или действующий токен доступа)
+    download_token = None
     if file_instance.is_protected:
         if request.method == 'POST':
             password_form = PasswordForm(file_instance, request.POST)
             if password_form.is_valid():
-                # Пароль верный — помечаем файл как авторизованный в текущей сессии
-                authorized = request.session.get('authorized_files', {})
-                authorized[file_instance.code] = True
-                request.session['authorized_files'] = authorized
-                request.session.modified = True
+                # Пароль верный — выдаем подписанный токен для ссылок скачивания/просмотра
+                download_token = make_download_token(file_instance)
                 # Продолжаем выполнение (покажем карточку файла)
             else:
                 messages.error(request, _('Неверный пароль.'))
@@ -218,8 +219,10 @@ def file_detail(request, code):
                     'file': file_instance,
                     'form': password_form
                 })
+        elif check_download_token(file_instance, request.GET.get('token')):
+            download_token = request.GET.get('token')
         else:
-            # Всегда показываем форму пароля для защищенных файлов
+            # Без токена показываем форму пароля для защищенных файлов
             password_form = PasswordForm(file_instance)
             return render(request, 'files/password_required.html', {
                 'file': file_instance,
@@ -231,12 +234,20 @@ def file_detail(request, code):
     context = {
         'file': file_instance,
         'file_url': request.build_absolute_uri(reverse('files:file_detail', kwargs={'code': file_instance.code})),
+        'download_token': download_token,
     }
     
     return render(request, 'files/file_detail.html', context)
 
 
-@ratelimit(key='ip', rate='20/m', method=['GET'])
+def _tokenized_url(view_name, file_instance):
+    """
+    Ссылка на view_name для файла с новым токеном доступа в параметре ?token=.
+    """
+    url = reverse(view_name, kwargs={'code': file_instance.code})
+    return f'{url}?{urlencode({"token": make_download_token(file_instance)})}'
+
+
 def download_file(request, code):
     """
     Скачивание файла по коду.
@@ -251,34 +262,25 @@ def download_file(request, code):
     if file_instance.is_expired():
         raise Http404("Файл истек")
     
-    # Если файл защищен паролем, проверяем пароль/авторизацию
-    if file_instance.is_protected:
-        authorized = request.session.get('authorized_files', {})
-        if not authorized.get(file_instance.code):
-            # Дополнительно поддерживаем разовый доступ через параметр ?password=
-            password = request.GET.get('password')
-            if not password:
-                # Перенаправляем на карточку файла для ввода пароля
-                return redirect('files:file_detail', code=file_instance.code)
-            from django.contrib.auth.hashers import check_password
-            if not check_password(password, file_instance.password or ''):
-                raise Http404(_('Неверный пароль'))
-            # Разрешаем и запоминаем в сессии
-            authorized[file_instance.code] = True
-            request.session['authorized_files'] = authorized
-            request.session.modified = True
+    # Если файл защищен паролем, проверяем токен доступа (HMAC, без сессии и БД)
+    if file_instance.is_protected and not check_download_token(file_instance, request.GET.get('token')):
+        # Дополнительно поддерживаем разовый доступ через параметр ?password=
+        password = request.GET.get('password')
+        if not password:
+            # Перенаправляем на карточку файла для ввода пароля
+            return redirect('files:file_detail', code=file_instance.code)
+        if not check_file_password(file_instance, password):
+            raise Http404(_('Неверный пароль'))
+        # Пароль проверяем один раз, дальше (в т.ч. докачка) работает ссылка с токеном
+        return redirect(_tokenized_url('files:download_file', file_instance))
     
     # Увеличиваем счетчик скачиваний
     file_instance.increment_download_count()
 
-    # Потоковая отдача файла
-    file_stream = file_instance.file.open('rb')
-    response = FileResponse(file_stream, as_attachment=True, filename=file_instance.filename)
-    response['Content-Length'] = file_instance.file_size
-    return response
+    # Отдача файла (стратегия - FILE_DELIVERY, см. files/delivery.py)
+    return file_response(request, file_instance, as_attachment=True)
 
 
-@ratelimit(key='ip', rate='20/m', method=['GET'])
 def view_file(request, code):
     """
     Просмотр (inline) файла по коду. Для поддерживаемых браузером типов откроется предпросмотр.
@@ -292,11 +294,15 @@ def view_file(request, code):
         raise Http404(_('Файл истек'))
 
     # Защита паролем
-    if file_instance.is_protected:
-        authorized = request.session.get('authorized_files', {})
-        if not authorized.get(file_instance.code):
-            # Требуем ввод пароля на карточке файла
-            return redirect('files:file_detail', code=file_instance.code)
+    if file_instance.is_protected and not check_download_token(file_instance, request.GET.get('token')):
+        # Требуем ввод пароля на карточке файла
+        return redirect('files:file_detail', code=file_instance.code)
+
+    def download_fallback():
+        # Оригинал на скачивание; защищенный - по ссылке с токеном, иначе снова форма пароля
+        if file_instance.is_protected:
+            return redirect(_tokenized_url('files:download_file', file_instance))
+        return redirect('files:download_file', code=file_instance.code)
 
     # Определяем стратегию предпросмотра
     _, ext = os.path.splitext(file_instance.filename.lower())
@@ -304,10 +310,7 @@ def view_file(request, code):
 
     # Для PDF и изображений — отдаём как есть inline
     if ext in {'.pdf', '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.svg'}:
-        file_stream = file_instance.file.open('rb')
-        response = FileResponse(file_stream, as_attachment=False, filename=file_instance.filename)
-        response['Content-Length'] = file_instance.file_size
-        return response
+        return file_response(request, file_instance, as_attachment=False)
 
     # Для офисных форматов — пробуем конвертировать в PDF (кэшируем)
     if ext in doc_like_exts:
@@ -329,18 +332,29 @@ def view_file(request, code):
             libreoffice = shutil.which('libreoffice') or shutil.which('soffice')
             if not libreoffice:
                 # Нет LibreOffice — fallback: отдаём оригинал на скачивание
-                return redirect('files:download_file', code=file_instance.code)
+                return download_fallback()
+            started = time.perf_counter()
             try:
                 # Конвертируем через LibreOffice в headless режиме
-                subprocess.check_call([
-                    libreoffice,
-                    '--headless',
-                    '--convert-to', 'pdf',
-                    '--outdir', previews_dir,
-                    file_instance.file.path,
-                ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                with start_span('libreoffice.convert', attributes={'file.code': file_instance.code, 'file.ext': ext}):
+                    subprocess.check_call([
+                        libreoffice,
+                        '--headless',
+                        '--convert-to', 'pdf',
+                        '--outdir', previews_dir,
+                        file_instance.file.path,
+                    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             except subprocess.CalledProcessError:
-                return redirect('files:download_file', code=file_instance.code)
+                PREVIEW_GENERATION.labels('error').observe(time.perf_counter() - started)
+                return download_fallback()
+            PREVIEW_GENERATION.labels('ok').observe(time.perf_counter() - started)
+            # LibreOffice называет PDF по имени исходного файла - переименовываем в <код>.pdf
+            # (по этому имени превью находят кеш выше и сборка мусора gc_media)
+            converted_path = os.path.join(
+                previews_dir, os.path.splitext(os.path.basename(file_instance.file.path))[0] + '.pdf'
+            )
+            if converted_path != preview_pdf_path and os.path.exists(converted_path):
+                os.replace(converted_path, preview_pdf_path)
 
         # Отдаём PDF inline
         if os.path.exists(preview_pdf_path):
@@ -393,13 +407,14 @@ def edit_file(request, code):
             new_password = form.cleaned_data.get('new_password')
             if new_password is not None:  # Пустая строка означает убрать пароль
                 if new_password:
-                    file_instance.password = make_password(new_password)
+                    file_instance.password = hash_password(new_password)
                     file_instance.is_protected = True
                 else:
                     file_instance.password = None
                     file_instance.is_protected = False
             
             file_instance.save()
+            invalidate_recent_files(file_instance.session_id)
             messages.success(request, _('Информация о файле обновлена!'))
             return redirect('files:file_detail', code=file_instance.code)
         else:
@@ -439,6 +454,7 @@ def delete_file(request, code):
     if request.method == 'POST':
         # Используем наш кастомный метод удаления
         file_instance.delete()
+        invalidate_recent_files(file_instance.session_id)
         messages.success(request, _('Файл успешно удален!'))
         return redirect('files:home')
     
@@ -498,10 +514,7 @@ def direct_pdf_view(request, code):
         return redirect('files:file_detail', code=file_instance.code)
     
     # Отдаем PDF файл напрямую для просмотра
-    file_stream = file_instance.file.open('rb')
-    response = FileResponse(file_stream, as_attachment=False, filename=file_instance.filename)
-    response['Content-Type'] = 'application/pdf'
-    response['Content-Length'] = file_instance.file_size
+    response = file_response(request, file_instance, as_attachment=False, content_type='application/pdf')
     response['Content-Disposition'] = f'inline; filename="{file_instance.filename}"'
     
     # Увеличиваем счетчик просмотров
@@ -510,6 +523,72 @@ def direct_pdf_view(request, code):
     return response
 
 
+def _requested_file_type(request):
+    """
+    Возвращает тип файла из параметра ?type= (или None, если не указан или неизвестен).
+    """
+    file_type = request.GET.get('type', '').strip()
+    return file_type if file_type in FILE_TYPE_NAMES else None
+
+
+def _session_files(request, query=None, file_type=None):
+    """
+    Базовый queryset активных файлов текущей анонимной сессии.
+    Если указан query - дополнительно фильтрует по коду или имени,
+    если file_type - по сохраненному типу файла (на стороне БД).
+    """
+    if not (hasattr(request, 'anonymous_session_id') and request.anonymous_session_id):
+        return File.objects.none()
+
+    # Для списков выбираем только отображаемые колонки (mime_type - для JSON API)
+    files = File.objects.filter(
+        session_id=request.anonymous_session_id,
+        expires_at__gt=timezone.now(),
+        is_deleted=False
+    ).only(*FileListItem.DB_FIELDS, 'mime_type')
+    if query:
+        files = files.filter(Q(code__icontains=query) | Q(filename__icontains=query))
+    if file_type:
+        files = files.filter(file_type=file_type)
+    return files
+
+
+def _file_list_item(request, file_instance):
+    """
+    Сериализует файл для JSON API списков.
+    """
+    return {
+        'code': file_instance.code,
+        'filename': file_instance.filename,
+        'file_size': file_instance.file_size,
+        'is_protected': file_instance.is_protected,
+        'download_count': file_instance.download_count,
+        'created_at': file_instance.created_at.isoformat(),
+        'expires_at': file_instance.expires_at.isoformat(),
+        'file_type': file_instance.get_file_type(),
+        'file_type_name': file_instance.get_file_type_name(),
+        'file_type_icon': file_instance.get_file_type_icon(),
+        'mime_type': file_instance.mime_type,
+        'url': request.build_absolute_uri(
+            reverse('files:file_detail', kwargs={'code': file_instance.code})
+        ),
+        'download_url': request.build_absolute_uri(
+            reverse('files:download_file', kwargs={'code': file_instance.code})
+        ),
+    }
+
+
+def _file_list_response(request, page_obj):
+    """
+    JSON ответ со страницей файлов и курсором следующей страницы.
+    """
+    return JsonResponse({
+        'results': [_file_list_item(request, f) for f in page_obj],
+        'next_cursor': page_obj.next_cursor,
+        'has_next': page_obj.has_next(),
+    })
+
+
 def search_files(request):
     """
     Поиск файлов по коду или имени.
@@ -520,28 +599,19 @@ def search_files(request):
     if not query:
         return redirect('files:home')
     
-    # Получаем только файлы текущего пользователя
-    if hasattr(request, 'anonymous_session_id') and request.anonymous_session_id:
-        # Ищем файлы по коду или имени только среди файлов пользователя
-        files = File.objects.filter(
-            Q(code__icontains=query) | Q(filename__icontains=query),
-            session_id=request.anonymous_session_id,
-            expires_at__gt=timezone.now(),
-            is_deleted=False
-        ).order_by('-created_at')
-    else:
-        # Если session_id нет, показываем пустой список
-        files = File.objects.none()
+    file_type = _requested_file_type(request)
     
-    # Пагинация
-    paginator = Paginator(files, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Keyset пагинация: одна выборка по индексу на страницу, без COUNT(*)
+    page_obj = paginate_keyset(
+        _session_files(request, query, file_type),
+        cursor=request.GET.get('cursor'),
+        per_page=10
+    )
     
     context = {
         'query': query,
+        'file_type': file_type,
         'page_obj': page_obj,
-        'files_count': files.count(),
         'has_session': hasattr(request, 'anonymous_session_id') and request.anonymous_session_id,
     }
     
@@ -553,42 +623,57 @@ def recent_files(request):
     Страница с последними загруженными файлами.
     Показывает только файлы текущего пользователя.
     """
-    # Получаем только файлы текущего пользователя
-    if hasattr(request, 'anonymous_session_id') and request.anonymous_session_id:
-        files = File.objects.filter(
-            session_id=request.anonymous_session_id,
-            expires_at__gt=timezone.now(),
-            is_deleted=False
-        ).order_by('-created_at')
-        
-        # Проверяем, есть ли активные файлы
-        has_files = files.exists()
-    else:
-        # Если session_id нет, показываем пустой список
-        files = File.objects.none()
-        has_files = False
-    
-    # Пагинация только если есть файлы
-    if has_files:
-        paginator = Paginator(files, 20)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
-    else:
-        page_obj = None
+    file_type = _requested_file_type(request)
+    page_obj = paginate_keyset(
+        _session_files(request, file_type=file_type),
+        cursor=request.GET.get('cursor'),
+        per_page=20
+    )
+    has_files = bool(page_obj) or page_obj.has_previous()
     
     context = {
-        'page_obj': page_obj,
+        'page_obj': page_obj if has_files else None,
+        'file_type': file_type,
+        'file_type_choices': FILE_TYPE_CHOICES,
         'has_session': hasattr(request, 'anonymous_session_id') and request.anonymous_session_id,
         'has_files': has_files,
-        'total_files': files.count() if has_files else 0,
     }
     
     return render(request, 'files/recent_files.html', context)
 
 
+@require_http_methods(["GET"])
+def api_recent_files(request):
+    """
+    JSON API: файлы текущего пользователя постранично (по курсору).
+    """
+    page_obj = paginate_keyset(
+        _session_files(request, file_type=_requested_file_type(request)),
+        cursor=request.GET.get('cursor'),
+        per_page=20
+    )
+    return _file_list_response(request, page_obj)
+
+
+@require_http_methods(["GET"])
+def api_search_files(request):
+    """
+    JSON API: поиск среди файлов текущего пользователя постранично (по курсору).
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'success': False, 'error': _('Пустой запрос')}, status=400)
+
+    page_obj = paginate_keyset(
+        _session_files(request, query, _requested_file_type(request)),
+        cursor=request.GET.get('cursor'),
+        per_page=10
+    )
+    return _file_list_response(request, page_obj)
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
-@ratelimit(key='ip', rate='10/m', method=['POST'])
 def api_upload(request):
     """
     API endpoint для загрузки файлов (для будущего развития).
@@ -598,6 +683,8 @@ def api_upload(request):
         if form.is_valid():
             # Создаем файл аналогично обычной загрузке
             file_instance = form.save(commit=False)
+            password = form.cleaned_data.get('password')
+            password_hash = hash_password_async(password) if password else None
             file_instance.filename = form.cleaned_data['file'].name
             file_instance.file_size = form.cleaned_data['file'].size
             
@@ -607,9 +694,8 @@ def api_upload(request):
             else:
                 file_instance.code = generate_unique_code()
             
-            password = form.cleaned_data.get('password')
-            if password:
-                file_instance.password = make_password(password)
+            if password_hash:
+                file_instance.password = password_hash.result()
                 file_instance.is_protected = True
             
             # Связываем файл с анонимной сессией пользователя
@@ -618,6 +704,7 @@ def api_upload(request):
             
             file_instance.expires_at = timezone.now() + timedelta(hours=settings.FILE_EXPIRY_HOURS)
             file_instance.save()
+            invalidate_recent_files(file_instance.session_id)
             
             return JsonResponse({
                 'success': True,
@@ -686,6 +773,32 @@ sitemaps = {
 }
 
 
+def _metrics_authorized(request):
+    """
+    С METRICS_TOKEN - только с заголовком Authorization: Bearer <токен>.
+    Без него - по адресу METRICS_ALLOWED_IPS (только без обратного прокси:
+    за nginx у всех клиентов REMOTE_ADDR - адрес прокси).
+    """
+    if settings.METRICS_TOKEN:
+        return constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {settings.METRICS_TOKEN}')
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+def metrics(request):
+    """
+    Метрики Prometheus. Доступ - см. _metrics_authorized.
+    """
+    if not _metrics_authorized(request):
+        return HttpResponse(status=403)
+
+    rendered = render_metrics()
+    if rendered is None:
+        return HttpResponse('prometheus_client не установлен', status=501, content_type='text/plain')
+
+    body, content_type = rendered
+    return HttpResponse(body, content_type=content_type)
+
+
 def robots_txt(request):
     """
     Возвращает robots.txt файл.
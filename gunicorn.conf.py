@@ -47,3 +47,19 @@ limit_request_field_size = 8190
 
 # Performance
 worker_tmp_dir = '/dev/shm'  # Use RAM for temporary files
+
+
+# Prometheus: при PROMETHEUS_MULTIPROC_DIR метрики воркеров суммируются в /metrics
+def on_starting(server):
+    """Очищает файлы метрик прошлого запуска"""
+    multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for name in os.listdir(multiproc_dir):
+            os.remove(os.path.join(multiproc_dir, name))
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
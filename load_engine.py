@@ -0,0 +1,846 @@
+#!/usr/bin/env python3
+"""
+Движок нагрузочного тестирования с открытой моделью нагрузки (open-loop).
+
+Запросы отправляются по расписанию прибытия (постоянный интервал или
+пуассоновский поток) независимо от того, ответил ли сервер на предыдущие.
+Задержка считается от запланированного момента отправки, а не от
+фактического, поэтому очередь на сервере и в клиенте не скрывается
+(coordinated omission). Задержки собираются в гистограмму с относительной
+точностью ~1% (как HDR Histogram), что дает корректные p50/p95/p99/p99.9
+без хранения всех значений.
+
+Сценарий (Scenario) описывает реальный трафик декларативно: доли
+эндпоинтов (QR-скан страницы файла, скачивание, просмотр PDF, вход по
+паролю, поиск, недавние файлы, загрузка), распределение размеров и типов
+файлов и популярность файлов по закону Ципфа. Перед прогоном сценарий
+загружает пул файлов; задержки и ошибки считаются по каждому эндпоинту.
+
+Нагрузка делится между несколькими процессами, чтобы сам генератор не был
+узким местом; гистограммы процессов суммируются. Если генератор не успевает
+отправлять запросы вовремя, это видно по max_send_lag и ошибкам
+client_saturated.
+
+Пример:
+    python load_engine.py --url http://localhost:8000 --action home --rate 200 --duration 30 --processes 4
+    python load_engine.py --url http://localhost:8000 --scenario production --rate 50 --duration 60
+"""
+
+import asyncio
+import bisect
+import dataclasses
+import itertools
+import json
+import math
+import random
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import unquote
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек с логарифмическими корзинами: относительная ошибка
+    перцентилей не больше precision при фиксированной памяти. Гистограммы
+    разных процессов складываются (merge).
+    """
+
+    def __init__(self, precision: float = 0.01):
+        self.precision = precision
+        self._log_base = math.log1p(precision)
+        self.counts = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        micros = max(seconds * 1e6, 1.0)
+        self.counts[int(math.log(micros) / self._log_base)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: 'LatencyHistogram'):
+        self.counts.update(other.counts)
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q: float) -> float:
+        """Значение q-го перцентиля (0..100) в секундах"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * q / 100))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                # Середина корзины, но не за пределами наблюдавшихся значений
+                value = math.exp((bucket + 0.5) * self._log_base) / 1e6
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'min': self.min if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'p99.9': self.percentile(99.9),
+            'max': self.max,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'precision': self.precision, 'counts': dict(self.counts), 'count': self.count,
+            'total': self.total, 'min': self.min, 'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LatencyHistogram':
+        histogram = cls(data['precision'])
+        histogram.counts = Counter({int(bucket): n for bucket, n in data['counts'].items()})
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
+
+
+def arrival_times(rate: float, duration: float, arrival: str = 'poisson',
+                  rng: Optional[random.Random] = None, phase: float = 0.0) -> Iterator[float]:
+    """
+    Плановые моменты отправки (секунды от старта) для потока rate запросов/сек.
+    constant - равные интервалы (со сдвигом phase в долях интервала),
+    poisson - экспоненциальные интервалы, как у независимых пользователей.
+    """
+    if rate <= 0:
+        return
+    rng = rng or random.Random()
+    if arrival == 'constant':
+        interval = 1.0 / rate
+        k = 0
+        while (t := (phase + k) * interval) < duration:
+            yield t
+            k += 1
+    elif arrival == 'poisson':
+        t = rng.expovariate(rate)
+        while t < duration:
+            yield t
+            t += rng.expovariate(rate)
+    else:
+        raise ValueError(f'Неизвестная модель прибытия: {arrival}')
+
+
+# Действия: корутины (session, base_url, rng, options) -> (status, число байт ответа)
+
+async def _read(response) -> int:
+    size = 0
+    async for chunk in response.content.iter_chunked(64 * 1024):
+        size += len(chunk)
+    return size
+
+
+async def get_action(session, base_url: str, rng: random.Random, options: Dict[str, Any]):
+    """GET options['path'] (по умолчанию главная страница)"""
+    async with session.get(base_url + options.get('path', '/'), allow_redirects=False) as response:
+        return response.status, await _read(response)
+
+
+async def upload_action(session, base_url: str, rng: random.Random, options: Dict[str, Any]):
+    """Загрузка файла размером options['size_kb'] через API"""
+    size = int(options.get('size_kb', 10) * 1024)
+    data = aiohttp.FormData()
+    data.add_field('file', rng.randbytes(size), filename=f'load_{rng.getrandbits(32):08x}.bin')
+    async with session.post(base_url + '/api/upload/', data=data) as response:
+        return response.status, await _read(response)
+
+
+ACTIONS = {
+    'get': get_action,
+    'home': get_action,
+    'upload': upload_action,
+}
+
+
+# Сценарии реального трафика
+
+SCENARIO_ENDPOINTS = ('detail', 'download', 'pdf_view', 'protected_download', 'search', 'recent', 'upload')
+
+# Сигнатуры начала файлов, чтобы тело выглядело как файл своего типа; остальное - случайные байты
+FILE_MAGIC = {
+    'pdf': b'%PDF-1.7\n',
+    'jpg': b'\xff\xd8\xff\xe0\x00\x10JFIF\x00',
+    'png': b'\x89PNG\r\n\x1a\n',
+    'zip': b'PK\x03\x04',
+    'docx': b'PK\x03\x04',
+}
+TEXT_WORDS = ['файл', 'отчет', 'report', 'data', 'итого', 'счет', 'invoice', 'строка', 'value', '2024']
+
+CSRF_INPUT_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+DOWNLOAD_TOKEN_RE = re.compile(r'/download/\?token=([^"&\s]+)')
+
+
+class ScenarioError(Exception):
+    """Шаг сценария не дал ожидаемого результата (например, пароль не принят)"""
+
+
+def make_payload(ext: str, size: int, rng: random.Random) -> bytes:
+    """Тело файла размером size: текст для txt, иначе сигнатура типа и несжимаемые байты"""
+    if ext == 'txt':
+        block = ' '.join(rng.choices(TEXT_WORDS, k=800)).encode()
+        return (block * (size // len(block) + 1))[:size]
+    magic = FILE_MAGIC.get(ext, b'')[:size]
+    return magic + rng.randbytes(size - len(magic))
+
+
+@dataclass
+class Scenario:
+    """
+    Декларативное описание трафика. mix - веса эндпоинтов: detail - QR-скан
+    (страница файла), download - скачивание публичного файла, pdf_view -
+    просмотр PDF по короткой ссылке, protected_download - ввод пароля на
+    странице файла и скачивание по выданному токену, search и recent -
+    просмотр своих файлов, upload - загрузка нового файла.
+    sizes - корзины [вес, от KB, до KB], внутри корзины размер лог-равномерный.
+    Популярность файлов пула - закон Ципфа с показателем zipf_s.
+    """
+    name: str
+    mix: Dict[str, float]
+    sizes: List[Tuple[float, float, float]]
+    file_types: Dict[str, float]
+    protected_ratio: float = 0.1
+    zipf_s: float = 1.1
+    seed_files: int = 200
+    sessions: int = 20
+    search_terms: List[str] = field(default_factory=lambda: ['report', 'scan', 'photo', 'invoice', 'contract'])
+    password: str = 'load-test'
+
+    def __post_init__(self):
+        unknown = set(self.mix) - set(SCENARIO_ENDPOINTS)
+        if unknown:
+            raise ValueError(f'Неизвестные эндпоинты сценария: {", ".join(sorted(unknown))}')
+        if not any(weight > 0 for weight in self.mix.values()):
+            raise ValueError('В сценарии нет эндпоинтов с положительным весом')
+        if not self.sizes or not self.file_types:
+            raise ValueError('В сценарии не заданы размеры или типы файлов')
+        if any(low <= 0 or high < low for _, low, high in self.sizes):
+            raise ValueError('Корзины размеров должны быть вида [вес, от KB > 0, до KB >= от]')
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Scenario':
+        return cls(**data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dataclasses.asdict(self)
+
+    def sample_size(self, rng: random.Random) -> int:
+        """Размер файла в байтах"""
+        _, low, high = rng.choices(self.sizes, weights=[bucket[0] for bucket in self.sizes])[0]
+        return max(1, int(math.exp(rng.uniform(math.log(low), math.log(high))) * 1024))
+
+    def sample_file(self, rng: random.Random) -> Tuple[str, int]:
+        """Имя (с поисковым словом и расширением по file_types) и размер файла"""
+        ext = rng.choices(list(self.file_types), weights=list(self.file_types.values()))[0]
+        return f'{rng.choice(self.search_terms)}_{rng.getrandbits(32):08x}.{ext}', self.sample_size(rng)
+
+
+# Ориентировочные доли; уточняются по access логу продакшена
+SCENARIOS = {
+    'production': Scenario(
+        name='production',
+        mix={
+            'detail': 45, 'download': 20, 'pdf_view': 12, 'protected_download': 5,
+            'search': 5, 'recent': 8, 'upload': 5,
+        },
+        sizes=[(55, 1, 100), (30, 100, 1024), (12, 1024, 10240), (3, 10240, 24576)],
+        file_types={'pdf': 35, 'jpg': 25, 'png': 10, 'docx': 10, 'zip': 10, 'txt': 10},
+    ),
+    'uploads': Scenario(
+        name='uploads',
+        mix={'upload': 60, 'detail': 30, 'download': 10},
+        sizes=[(55, 1, 100), (30, 100, 1024), (12, 1024, 10240), (3, 10240, 24576)],
+        file_types={'pdf': 35, 'jpg': 25, 'png': 10, 'docx': 10, 'zip': 10, 'txt': 10},
+        seed_files=50,
+    ),
+    'browse': Scenario(
+        name='browse',
+        mix={'search': 40, 'recent': 40, 'detail': 20},
+        sizes=[(1, 1, 50)],
+        file_types={'pdf': 40, 'jpg': 30, 'txt': 30},
+        protected_ratio=0.0,
+        seed_files=500,
+        sessions=5,
+    ),
+}
+
+
+def load_scenario(value: str) -> Scenario:
+    """Сценарий по имени из SCENARIOS или из JSON файла с полями Scenario"""
+    if value in SCENARIOS:
+        return SCENARIOS[value]
+    try:
+        with open(value, encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f'Неизвестный сценарий: {value} (доступны: {", ".join(sorted(SCENARIOS))} или путь к JSON)')
+    data.setdefault('name', value)
+    return Scenario.from_dict(data)
+
+
+class ZipfSampler:
+    """Индекс 0..n-1 с вероятностью, пропорциональной 1 / (индекс + 1) ** s"""
+
+    def __init__(self, n: int, s: float):
+        self.cumulative = list(itertools.accumulate(1 / rank ** s for rank in range(1, n + 1)))
+
+    def sample(self, rng: random.Random) -> int:
+        return bisect.bisect_left(self.cumulative, rng.random() * self.cumulative[-1])
+
+
+def _session_headers(session_id: str) -> Dict[str, str]:
+    return {'Cookie': f'anonymous_session_id={session_id}'}
+
+
+def _upload_form(name: str, size: int, rng: random.Random, password: Optional[str]):
+    data = aiohttp.FormData()
+    data.add_field('file', make_payload(name.rsplit('.', 1)[-1], size, rng), filename=name)
+    if password:
+        data.add_field('is_protected', 'on')
+        data.add_field('password', password)
+    return data
+
+
+async def seed_scenario_files(base_url: str, scenario: Scenario, rng: random.Random,
+                              concurrency: int = 8, timeout: float = 60.0) -> List[Dict[str, Any]]:
+    """
+    Загружает пул файлов сценария (scenario.seed_files) от scenario.sessions
+    анонимных сессий. Возвращает описания файлов для ScenarioRunner.
+    """
+    sessions = [f'{rng.getrandbits(256):064x}' for _ in range(max(1, scenario.sessions))]
+    specs = []
+    for index in range(scenario.seed_files):
+        name, size = scenario.sample_file(rng)
+        specs.append({
+            'filename': name,
+            'size': size,
+            'session': sessions[index % len(sessions)],
+            'password': scenario.password if rng.random() < scenario.protected_ratio else None,
+            'seed': rng.getrandbits(64),
+        })
+
+    semaphore = asyncio.Semaphore(concurrency)
+    files = [None] * len(specs)
+
+    async def upload_session(session, session_id):
+        # Файлы одной сессии загружаются по очереди (лимит одновременных загрузок на сессию)
+        for index, spec in enumerate(specs):
+            if spec['session'] != session_id:
+                continue
+            async with semaphore:
+                data = _upload_form(spec['filename'], spec['size'], random.Random(spec['seed']), spec['password'])
+                async with session.post(base_url + '/api/upload/', data=data, headers=_session_headers(session_id)) as response:
+                    body = await response.json(content_type=None)
+                    status = response.status
+            if not body.get('success'):
+                raise RuntimeError(f'Не удалось загрузить файл пула {spec["filename"]} (HTTP {status}): {body}')
+            files[index] = {
+                'code': body['code'], 'filename': spec['filename'], 'size': spec['size'],
+                'session': session_id, 'password': spec['password'],
+            }
+
+    async with aiohttp.ClientSession(
+        cookie_jar=aiohttp.DummyCookieJar(), timeout=aiohttp.ClientTimeout(total=timeout)
+    ) as session:
+        await asyncio.gather(*(upload_session(session, session_id) for session_id in sessions))
+    return files
+
+
+class ScenarioRunner:
+    """
+    Выбор запросов сценария в процессе-генераторе. Порядок файлов пула - ранг
+    популярности (одинаковый во всех процессах); размеры и типы файлов пула
+    случайны, поэтому популярность от них не зависит. Файлы, загруженные во
+    время прогона, в пул не добавляются - ранги остаются стабильными.
+    """
+
+    def __init__(self, scenario: Scenario, files: List[Dict[str, Any]], rng: random.Random):
+        self.scenario = scenario
+        self.endpoints = [endpoint for endpoint, weight in scenario.mix.items() if weight > 0]
+        self.weights = [scenario.mix[endpoint] for endpoint in self.endpoints]
+        self.sessions = sorted({file['session'] for file in files}) or [f'{rng.getrandbits(256):064x}']
+        public = [file for file in files if not file['password']]
+        candidates = {
+            'detail': files,
+            'download': public,
+            'pdf_view': [file for file in public if file['filename'].lower().endswith('.pdf')],
+            'protected_download': [file for file in files if file['password']],
+        }
+        self.pools = {}
+        for endpoint, pool in candidates.items():
+            self.pools[endpoint] = (pool, ZipfSampler(len(pool), scenario.zipf_s) if pool else None)
+
+    def pick(self, rng: random.Random):
+        """Эндпоинт и действие (корутина с сигнатурой ACTIONS) для очередного запроса"""
+        endpoint = rng.choices(self.endpoints, self.weights)[0]
+        return endpoint, getattr(self, endpoint)
+
+    def choose_file(self, endpoint: str, rng: random.Random) -> Dict[str, Any]:
+        pool, sampler = self.pools[endpoint]
+        if not pool:
+            raise ScenarioError(f'В пуле нет файлов для {endpoint}')
+        return pool[sampler.sample(rng)]
+
+    async def _get(self, session, url: str, **kwargs):
+        async with session.get(url, allow_redirects=False, **kwargs) as response:
+            return response.status, await _read(response)
+
+    async def detail(self, session, base_url, rng, options):
+        file = self.choose_file('detail', rng)
+        return await self._get(session, f'{base_url}/{file["code"]}/detail/')
+
+    async def download(self, session, base_url, rng, options):
+        file = self.choose_file('download', rng)
+        return await self._get(session, f'{base_url}/{file["code"]}/download/')
+
+    async def pdf_view(self, session, base_url, rng, options):
+        file = self.choose_file('pdf_view', rng)
+        return await self._get(session, f'{base_url}/{file["code"]}/')
+
+    async def search(self, session, base_url, rng, options):
+        return await self._get(
+            session, base_url + '/search/', params={'q': rng.choice(self.scenario.search_terms)},
+            headers=_session_headers(rng.choice(self.sessions)),
+        )
+
+    async def recent(self, session, base_url, rng, options):
+        return await self._get(session, base_url + '/recent/', headers=_session_headers(rng.choice(self.sessions)))
+
+    async def upload(self, session, base_url, rng, options):
+        name, size = self.scenario.sample_file(rng)
+        password = self.scenario.password if rng.random() < self.scenario.protected_ratio else None
+        data = _upload_form(name, size, rng, password)
+        # Загружает новый посетитель: сессии пула не упираются в лимит одновременных загрузок сессии.
+        # Общий лимит адреса (UPLOAD_MAX_CONCURRENT_PER_IP) действует, для прогона его нужно поднять
+        headers = _session_headers(f'{rng.getrandbits(256):064x}')
+        async with session.post(base_url + '/api/upload/', data=data, headers=headers) as response:
+            return response.status, await _read(response)
+
+    async def protected_download(self, session, base_url, rng, options):
+        """Страница файла с формой пароля, отправка пароля, скачивание по токену"""
+        file = self.choose_file('protected_download', rng)
+        url = f'{base_url}/{file["code"]}/detail/'
+        received = 0
+        async with session.get(url, allow_redirects=False) as response:
+            html = await response.text()
+            csrf_cookie = response.cookies.get('csrftoken')
+        received += len(html)
+        csrf_input = CSRF_INPUT_RE.search(html)
+        if response.status != 200:
+            return response.status, received
+        if csrf_cookie is None or csrf_input is None:
+            raise ScenarioError('На странице нет формы пароля')
+
+        data = {'csrfmiddlewaretoken': csrf_input.group(1), 'password': file['password']}
+        headers = {'Cookie': f'csrftoken={csrf_cookie.value}', 'Referer': url}
+        async with session.post(url, data=data, headers=headers, allow_redirects=False) as response:
+            html = await response.text()
+        received += len(html)
+        if response.status != 200:
+            return response.status, received
+        token = DOWNLOAD_TOKEN_RE.search(html)
+        if token is None:
+            raise ScenarioError('Пароль не принят: нет ссылки с токеном')
+
+        status, size = await self._get(
+            session, f'{base_url}/{file["code"]}/download/', params={'token': unquote(token.group(1))}
+        )
+        return status, received + size
+
+
+@dataclass
+class LoadConfig:
+    base_url: str
+    action: str = 'home'  # Не используется, если задан scenario
+    rate: float = 10.0  # Запросов в секунду суммарно по всем процессам
+    duration: float = 30.0
+    arrival: str = 'poisson'
+    processes: int = 1
+    max_in_flight: int = 1000  # На процесс; сверх этого запросы считаются client_saturated
+    timeout: float = 30.0
+    seed: Optional[int] = None
+    options: Dict[str, Any] = field(default_factory=dict)
+    scenario: Optional[Scenario] = None
+
+    @property
+    def label(self) -> str:
+        return f'scenario:{self.scenario.name}' if self.scenario else self.action
+
+
+@dataclass
+class EndpointStats:
+    """Задержки, статусы и ошибки одного эндпоинта"""
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+    service_time: LatencyHistogram = field(default_factory=LatencyHistogram)
+    statuses: Counter = field(default_factory=Counter)
+    errors: Counter = field(default_factory=Counter)
+
+    def merge(self, other: 'EndpointStats'):
+        self.latency.merge(other.latency)
+        self.service_time.merge(other.service_time)
+        self.statuses.update(other.statuses)
+        self.errors.update(other.errors)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'latency': self.latency.to_dict(), 'service_time': self.service_time.to_dict(),
+            'statuses': dict(self.statuses), 'errors': dict(self.errors),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'EndpointStats':
+        return cls(
+            LatencyHistogram.from_dict(data['latency']), LatencyHistogram.from_dict(data['service_time']),
+            Counter(data['statuses']), Counter(data['errors']),
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'count': self.latency.count,
+            'errors': dict(self.errors),
+            'statuses': {str(status): n for status, n in self.statuses.items()},
+            'latency': self.latency.summary(),
+            'service_time': self.service_time.summary(),
+        }
+
+
+@dataclass
+class LoadResult:
+    config: LoadConfig
+    latency: LatencyHistogram  # От планового момента отправки (с учетом очереди)
+    service_time: LatencyHistogram  # От фактической отправки
+    scheduled: int = 0
+    completed: int = 0
+    statuses: Counter = field(default_factory=Counter)
+    errors: Counter = field(default_factory=Counter)
+    bytes_received: int = 0
+    elapsed: float = 0.0
+    max_send_lag: float = 0.0
+    endpoints: Dict[str, EndpointStats] = field(default_factory=dict)
+
+    @property
+    def achieved_rps(self) -> float:
+        """Завершенные запросы за фактическое время теста (включая ожидание последних ответов)"""
+        return self.completed / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def offered_rps(self) -> float:
+        return self.scheduled / self.config.duration if self.config.duration else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'action': self.config.label,
+            'scenario': self.config.scenario.to_dict() if self.config.scenario else None,
+            'arrival': self.config.arrival,
+            'processes': self.config.processes,
+            'target_rps': self.config.rate,
+            'offered_rps': self.offered_rps,
+            'achieved_rps': self.achieved_rps,
+            'scheduled': self.scheduled,
+            'completed': self.completed,
+            'errors': dict(self.errors),
+            'statuses': {str(status): n for status, n in self.statuses.items()},
+            'bytes_received': self.bytes_received,
+            'max_send_lag': self.max_send_lag,
+            'latency': self.latency.summary(),
+            'service_time': self.service_time.summary(),
+            'endpoints': {name: self.endpoints[name].summary() for name in sorted(self.endpoints)},
+        }
+
+
+async def _run_worker(config: LoadConfig, index: int, start_at: float) -> Dict[str, Any]:
+    seed = None if config.seed is None else config.seed + index
+    rng = random.Random(seed)
+    if config.scenario is not None:
+        runner = ScenarioRunner(config.scenario, config.options.get('files', []), rng)
+    else:
+        runner = None
+        action = ACTIONS[config.action]
+    rate = config.rate / config.processes
+
+    def schedule():
+        for offset in arrival_times(rate, config.duration, config.arrival, rng, phase=index / config.processes):
+            endpoint, call = runner.pick(rng) if runner is not None else (config.action, action)
+            yield offset, endpoint, call
+
+    return await _drive(config, schedule(), rng, start_at)
+
+
+async def _drive(config: LoadConfig, schedule, rng: random.Random, start_at: float) -> Dict[str, Any]:
+    """
+    Отправляет запросы по расписанию (offset от start_at, эндпоинт, действие)
+    не дожидаясь ответов и собирает статистику процесса
+    """
+    if aiohttp is None:
+        raise RuntimeError('Для нагрузочного теста нужен aiohttp (pip install aiohttp)')
+    latency = LatencyHistogram()
+    service_time = LatencyHistogram()
+    statuses = Counter()
+    errors = Counter()
+    endpoints = {}
+    state = {'in_flight': 0, 'scheduled': 0, 'completed': 0, 'bytes': 0, 'max_lag': 0.0, 'last_done': 0.0}
+    tasks = set()
+
+    loop = asyncio.get_running_loop()
+    connector = aiohttp.TCPConnector(limit=config.max_in_flight, ssl=False)
+    timeout = aiohttp.ClientTimeout(total=config.timeout)
+
+    async def fire(session, intended, endpoint, call):
+        sent = loop.time()
+        state['max_lag'] = max(state['max_lag'], sent - intended)
+        stats = endpoints.get(endpoint)
+        if stats is None:
+            stats = endpoints[endpoint] = EndpointStats()
+        try:
+            status, size = await call(session, config.base_url, rng, config.options)
+            statuses[status] += 1
+            stats.statuses[status] += 1
+            state['bytes'] += size
+            if status >= 400:
+                errors[f'HTTP {status}'] += 1
+                stats.errors[f'HTTP {status}'] += 1
+        except Exception as e:
+            errors[type(e).__name__] += 1
+            stats.errors[type(e).__name__] += 1
+        finally:
+            done = loop.time()
+            latency.record(done - intended)
+            service_time.record(done - sent)
+            stats.latency.record(done - intended)
+            stats.service_time.record(done - sent)
+            state['completed'] += 1
+            state['in_flight'] -= 1
+            state['last_done'] = done
+
+    # Без общего cookie jar: каждый запрос - независимый посетитель, cookie сессий задают действия
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=timeout, cookie_jar=aiohttp.DummyCookieJar()
+    ) as session:
+        # Все процессы начинают одновременно (по общему времени start_at)
+        await asyncio.sleep(max(0.0, start_at - time.time()))
+        start = loop.time()
+        for offset, endpoint, call in schedule:
+            intended = start + offset
+            delay = intended - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            state['scheduled'] += 1
+            if state['in_flight'] >= config.max_in_flight:
+                # Генератор не может держать больше соединений: запрос не отправлен
+                errors['client_saturated'] += 1
+                continue
+            state['in_flight'] += 1
+            task = asyncio.create_task(fire(session, intended, endpoint, call))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+
+    return {
+        'latency': latency.to_dict(),
+        'service_time': service_time.to_dict(),
+        'scheduled': state['scheduled'],
+        'completed': state['completed'],
+        'statuses': dict(statuses),
+        'errors': dict(errors),
+        'bytes': state['bytes'],
+        'max_lag': state['max_lag'],
+        'endpoints': {name: stats.to_dict() for name, stats in endpoints.items()},
+        'elapsed': max(state['last_done'] - start, config.duration) if state['completed'] else config.duration,
+    }
+
+
+def _worker_main(config: LoadConfig, index: int, start_at: float) -> Dict[str, Any]:
+    return asyncio.run(_run_worker(config, index, start_at))
+
+
+def run_load(config: LoadConfig) -> LoadResult:
+    """Запускает нагрузку в config.processes процессах и объединяет результаты"""
+    if config.scenario is None and config.action not in ACTIONS:
+        raise ValueError(f'Неизвестное действие: {config.action} (доступны: {", ".join(sorted(ACTIONS))})')
+    if config.scenario is not None and 'files' not in config.options:
+        if aiohttp is None:
+            raise RuntimeError('Для нагрузочного теста нужен aiohttp (pip install aiohttp)')
+        files = asyncio.run(seed_scenario_files(
+            config.base_url, config.scenario, random.Random(config.seed), timeout=config.timeout
+        ))
+        config = dataclasses.replace(config, options=dict(config.options, files=files))
+    # Время на запуск процессов, чтобы все начали одновременно
+    start_at = time.time() + (0.2 if config.processes == 1 else 1.0)
+    if config.processes == 1:
+        parts = [_worker_main(config, 0, start_at)]
+    else:
+        with ProcessPoolExecutor(max_workers=config.processes) as executor:
+            futures = [executor.submit(_worker_main, config, index, start_at) for index in range(config.processes)]
+            parts = [future.result() for future in futures]
+
+    return _merge_parts(config, parts)
+
+
+def _merge_parts(config: LoadConfig, parts: List[Dict[str, Any]]) -> LoadResult:
+    result = LoadResult(config, LatencyHistogram(), LatencyHistogram())
+    for part in parts:
+        result.latency.merge(LatencyHistogram.from_dict(part['latency']))
+        result.service_time.merge(LatencyHistogram.from_dict(part['service_time']))
+        result.scheduled += part['scheduled']
+        result.completed += part['completed']
+        result.statuses.update(part['statuses'])
+        result.errors.update(part['errors'])
+        result.bytes_received += part['bytes']
+        result.max_send_lag = max(result.max_send_lag, part['max_lag'])
+        result.elapsed = max(result.elapsed, part['elapsed'])
+        for name, data in part['endpoints'].items():
+            result.endpoints.setdefault(name, EndpointStats()).merge(EndpointStats.from_dict(data))
+    return result
+
+
+@dataclass
+class ReplayRequest:
+    """Запрос из записанного трафика (например, access лога)"""
+    offset: float  # Секунды от первого запроса записи
+    endpoint: str
+    method: str
+    path: str  # Уже закодированный путь с query string, как в логе
+    upload_size: int = 0  # Для POST загрузки: размер синтезируемого файла
+
+
+def _replay_action(request: ReplayRequest):
+    from yarl import URL
+
+    async def call(session, base_url, rng, options):
+        url = URL(base_url + request.path, encoded=True)
+        if request.upload_size:
+            data = _upload_form(f'replay_{rng.getrandbits(32):08x}.bin', request.upload_size, rng, None)
+            headers = _session_headers(f'{rng.getrandbits(256):064x}')
+            async with session.post(url, data=data, headers=headers, allow_redirects=False) as response:
+                return response.status, await _read(response)
+        async with session.request(request.method, url, allow_redirects=False) as response:
+            return response.status, await _read(response)
+
+    return call
+
+
+def run_replay(base_url: str, requests: List[ReplayRequest], speed: float = 1.0,
+               max_in_flight: int = 1000, timeout: float = 30.0, seed: Optional[int] = None) -> LoadResult:
+    """
+    Воспроизводит записанные запросы с исходными интервалами, ускоренными в
+    speed раз. Как и run_load - открытая модель: задержка считается от
+    планового момента отправки.
+    """
+    requests = sorted(requests, key=lambda request: request.offset)
+    span = requests[-1].offset / speed if requests else 0.0
+    config = LoadConfig(
+        base_url=base_url, action='replay', rate=len(requests) / span if span else float(len(requests)),
+        duration=max(span, 1e-3), arrival='replay', max_in_flight=max_in_flight, timeout=timeout, seed=seed,
+    )
+    schedule = ((request.offset / speed, request.endpoint, _replay_action(request)) for request in requests)
+    part = asyncio.run(_drive(config, schedule, random.Random(seed), time.time() + 0.2))
+    return _merge_parts(config, [part])
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """Текстовый отчет по LoadResult.summary()"""
+    latency = summary['latency']
+    service = summary['service_time']
+    lines = [
+        f"Действие: {summary['action']}, прибытие: {summary['arrival']}, процессов: {summary['processes']}",
+        f"Целевая нагрузка: {summary['target_rps']:.1f} rps, отправлено: {summary['offered_rps']:.1f} rps, "
+        f"достигнуто: {summary['achieved_rps']:.1f} rps",
+        f"Запланировано: {summary['scheduled']}, завершено: {summary['completed']}, "
+        f"ошибок: {sum(summary['errors'].values())}",
+        'Задержка (от плана)  ' + '  '.join(
+            f"{key}={latency[key] * 1000:.1f}мс" for key in ('p50', 'p95', 'p99', 'p99.9', 'max')
+        ),
+        'Время обслуживания   ' + '  '.join(
+            f"{key}={service[key] * 1000:.1f}мс" for key in ('p50', 'p95', 'p99', 'p99.9', 'max')
+        ),
+        f"Макс. отставание отправки: {summary['max_send_lag'] * 1000:.1f}мс",
+    ]
+    if summary['errors']:
+        lines.append('Ошибки: ' + ', '.join(f'{error}: {n}' for error, n in summary['errors'].items()))
+    endpoints = summary.get('endpoints') or {}
+    if len(endpoints) > 1:
+        lines.append(f"{'Эндпоинт':<20}{'запросов':>9}{'ошибок':>8}" + ''.join(
+            f'{key:>10}' for key in ('p50', 'p95', 'p99', 'max')
+        ))
+        for name, endpoint in endpoints.items():
+            lines.append(f"{name:<20}{endpoint['count']:>9}{sum(endpoint['errors'].values()):>8}" + ''.join(
+                f"{endpoint['latency'][key] * 1000:>8.1f}мс" for key in ('p50', 'p95', 'p99', 'max')
+            ))
+            if endpoint['errors']:
+                lines.append('    ' + ', '.join(f'{error}: {n}' for error, n in endpoint['errors'].items()))
+    return '\n'.join(lines)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Нагрузочный тест с открытой моделью нагрузки')
+    parser.add_argument('--url', default='http://localhost:8000', help='URL сервера')
+    parser.add_argument('--action', default='home', choices=sorted(ACTIONS), help='Тип запроса')
+    parser.add_argument('--path', default='/', help='Путь для действия get')
+    parser.add_argument('--size-kb', type=float, default=10, help='Размер файла для upload (KB)')
+    parser.add_argument(
+        '--scenario', help=f'Сценарий трафика вместо --action: {", ".join(sorted(SCENARIOS))} или путь к JSON'
+    )
+    parser.add_argument('--seed-files', type=int, help='Размер пула файлов сценария')
+    parser.add_argument('--rate', type=float, default=10, help='Запросов в секунду')
+    parser.add_argument('--duration', type=float, default=30, help='Длительность (сек)')
+    parser.add_argument('--arrival', default='poisson', choices=['poisson', 'constant'])
+    parser.add_argument('--processes', type=int, default=1, help='Число процессов-генераторов')
+    parser.add_argument('--max-in-flight', type=int, default=1000, help='Одновременных запросов на процесс')
+    parser.add_argument('--seed', type=int, help='Зерно генератора случайных чисел')
+    parser.add_argument('--output', help='Сохранить результат в JSON файл')
+    args = parser.parse_args()
+
+    scenario = None
+    if args.scenario:
+        try:
+            scenario = load_scenario(args.scenario)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.seed_files is not None:
+            scenario = dataclasses.replace(scenario, seed_files=args.seed_files)
+
+    config = LoadConfig(
+        base_url=args.url.rstrip('/'), action=args.action, rate=args.rate, duration=args.duration,
+        arrival=args.arrival, processes=args.processes, max_in_flight=args.max_in_flight, seed=args.seed,
+        options={'path': args.path, 'size_kb': args.size_kb}, scenario=scenario,
+    )
+    summary = run_load(config).summary()
+    print(format_summary(summary))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
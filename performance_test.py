@@ -5,8 +5,9 @@
 Этот скрипт тестирует:
 - Одновременные загрузки файлов
 - Скорость обработки запросов
-- Пропускную способность
+- Пропускную способность (открытая модель нагрузки, см. load_engine.py)
 - Стабильность под нагрузкой
+- Реалистичную смесь трафика (сценарии load_engine.SCENARIOS)
 """
 
 import asyncio
@@ -20,6 +21,8 @@ import statistics
 import json
 from typing import List, Dict, Any
 
+from load_engine import SCENARIOS, LatencyHistogram, LoadConfig, format_summary, load_scenario, make_payload, run_load
+
 class PerformanceTester:
     def __init__(self, base_url: str = "http://localhost:8000"):
         self.base_url = base_url
@@ -37,8 +40,8 @@ class PerformanceTester:
             await self.session.close()
             
     def generate_test_file(self, size_kb: int = 10) -> bytes:
-        """Генерирует тестовый файл указанного размера"""
-        return b'0' * (size_kb * 1024)
+        """Генерирует тестовый файл указанного размера (несжимаемые данные, как у реальных PDF и фото)"""
+        return make_payload('pdf', size_kb * 1024, random.Random())
         
     def generate_random_code(self, length: int = 6) -> str:
         """Генерирует случайный код файла"""
@@ -46,12 +49,12 @@ class PerformanceTester:
         
     async def upload_file(self, file_size_kb: int = 10) -> Dict[str, Any]:
         """Загружает один файл и возвращает результат"""
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         try:
             # Генерируем тестовый файл
             file_data = self.generate_test_file(file_size_kb)
-            filename = f"test_{file_size_kb}kb_{int(time.time())}.txt"
+            filename = f"test_{file_size_kb}kb_{int(time.time())}.pdf"
             
             # Создаем FormData
             data = aiohttp.FormData()
@@ -59,49 +62,57 @@ class PerformanceTester:
             data.add_field('custom_code', self.generate_random_code())
             
             # Отправляем запрос
-            async with self.session.post(f"{self.base_url}/", data=data, ssl=False) as response:
-                response_time = time.time() - start_time
-                response_data = await response.json()
+            async with self.session.post(f"{self.base_url}/api/upload/", data=data, ssl=False) as response:
+                response_data = await response.json(content_type=None)
+                finished_at = time.perf_counter()
                 
                 return {
                     'success': response.status == 200,
                     'status_code': response.status,
-                    'response_time': response_time,
+                    'response_time': finished_at - start_time,
+                    'started_at': start_time,
+                    'finished_at': finished_at,
                     'file_size_kb': file_size_kb,
                     'response_data': response_data
                 }
                 
         except Exception as e:
-            response_time = time.time() - start_time
+            finished_at = time.perf_counter()
             return {
                 'success': False,
                 'error': str(e),
-                'response_time': response_time,
+                'response_time': finished_at - start_time,
+                'started_at': start_time,
+                'finished_at': finished_at,
                 'file_size_kb': file_size_kb
             }
             
     async def download_file(self, file_url: str) -> Dict[str, Any]:
         """Скачивает файл и возвращает результат"""
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         try:
             async with self.session.get(file_url, ssl=False) as response:
-                response_time = time.time() - start_time
                 content_length = len(await response.read())
+                finished_at = time.perf_counter()
                 
                 return {
                     'success': response.status == 200,
                     'status_code': response.status,
-                    'response_time': response_time,
+                    'response_time': finished_at - start_time,
+                    'started_at': start_time,
+                    'finished_at': finished_at,
                     'content_length': content_length
                 }
                 
         except Exception as e:
-            response_time = time.time() - start_time
+            finished_at = time.perf_counter()
             return {
                 'success': False,
                 'error': str(e),
-                'response_time': response_time
+                'response_time': finished_at - start_time,
+                'started_at': start_time,
+                'finished_at': finished_at
             }
             
     async def test_concurrent_uploads(self, num_uploads: int = 10, file_size_kb: int = 10) -> List[Dict[str, Any]]:
@@ -125,27 +136,27 @@ class PerformanceTester:
                 
         return processed_results
         
-    async def test_upload_throughput(self, duration_seconds: int = 60, target_rps: int = 10) -> List[Dict[str, Any]]:
-        """Тестирует пропускную способность загрузок в течение указанного времени"""
+    async def test_upload_throughput(self, duration_seconds: int = 60, target_rps: int = 10,
+                                     arrival: str = 'poisson', processes: int = 1) -> Dict[str, Any]:
+        """
+        Тестирует пропускную способность загрузок в течение указанного времени.
+        Открытая модель: загрузки отправляются по расписанию независимо от ответов,
+        задержка считается от планового момента отправки (см. load_engine.py).
+        """
         print(f"Тестируем пропускную способность {target_rps} запросов/сек в течение {duration_seconds} секунд...")
         
-        results = []
-        start_time = time.time()
-        request_interval = 1.0 / target_rps
-        
-        while time.time() - start_time < duration_seconds:
-            request_start = time.time()
-            
-            # Загружаем файл
-            result = await self.upload_file(10)  # 10KB файлы
-            results.append(result)
-            
-            # Ждем до следующего запроса
-            elapsed = time.time() - request_start
-            if elapsed < request_interval:
-                await asyncio.sleep(request_interval - elapsed)
-                
-        return results
+        config = LoadConfig(
+            base_url=self.base_url.rstrip('/'),
+            action='upload',
+            rate=target_rps,
+            duration=duration_seconds,
+            arrival=arrival,
+            processes=processes,
+            options={'size_kb': 10},  # 10KB файлы
+        )
+        # Генератор нагрузки запускает свои циклы событий (и процессы) - не блокируем текущий
+        result = await asyncio.get_running_loop().run_in_executor(None, run_load, config)
+        return result.summary()
         
     async def test_mixed_load(self, num_requests: int = 100) -> List[Dict[str, Any]]:
         """Тестирует смешанную нагрузку (загрузки + скачивания)"""
@@ -157,11 +168,11 @@ class PerformanceTester:
         upload_results = await self.test_concurrent_uploads(5, 10)
         results.extend(upload_results)
         
-        # Получаем URL загруженных файлов
+        # Получаем ссылки на скачивание загруженных файлов
         file_urls = []
         for result in upload_results:
-            if result.get('success') and result.get('response_data', {}).get('url'):
-                file_urls.append(result['response_data']['url'])
+            if result.get('success') and result.get('response_data', {}).get('download_url'):
+                file_urls.append(result['response_data']['download_url'])
                 
         # Теперь тестируем скачивания
         if file_urls:
@@ -187,6 +198,27 @@ class PerformanceTester:
                     
         return results
         
+    async def test_scenario(self, scenario_name: str = 'production', duration_seconds: float = 60,
+                            target_rps: float = 10, arrival: str = 'poisson', processes: int = 1) -> Dict[str, Any]:
+        """
+        Прогоняет сценарий реального трафика (load_engine.SCENARIOS или JSON файл):
+        пул файлов с популярностью по Ципфу, смесь QR-сканов, скачиваний, просмотров PDF,
+        входов по паролю, поиска и загрузок. Задержки и ошибки - по каждому эндпоинту.
+        """
+        scenario = load_scenario(scenario_name)
+        print(f"Сценарий {scenario.name}: {target_rps} запросов/сек в течение {duration_seconds} секунд "
+              f"(пул {scenario.seed_files} файлов)...")
+        config = LoadConfig(
+            base_url=self.base_url.rstrip('/'),
+            rate=target_rps,
+            duration=duration_seconds,
+            arrival=arrival,
+            processes=processes,
+            scenario=scenario,
+        )
+        result = await asyncio.get_running_loop().run_in_executor(None, run_load, config)
+        return result.summary()
+        
     def analyze_results(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Анализирует результаты тестирования"""
         if not results:
@@ -196,6 +228,14 @@ class PerformanceTester:
         failed_requests = [r for r in results if not r.get('success')]
         
         response_times = [r.get('response_time', 0) for r in results if r.get('response_time')]
+        histogram = LatencyHistogram()
+        for response_time in response_times:
+            histogram.record(response_time)
+        
+        # Пропускная способность - запросы за фактическое время теста, а не за самый долгий ответ
+        started = [r['started_at'] for r in results if 'started_at' in r]
+        finished = [r['finished_at'] for r in results if 'finished_at' in r]
+        wall_time = max(finished) - min(started) if started and finished else 0
         
         analysis = {
             'total_requests': len(results),
@@ -206,7 +246,11 @@ class PerformanceTester:
             'min_response_time': min(response_times) if response_times else 0,
             'max_response_time': max(response_times) if response_times else 0,
             'median_response_time': statistics.median(response_times) if response_times else 0,
-            'requests_per_second': len(results) / max(response_times) if response_times else 0,
+            'p95_response_time': histogram.percentile(95),
+            'p99_response_time': histogram.percentile(99),
+            'p999_response_time': histogram.percentile(99.9),
+            'wall_time': wall_time,
+            'requests_per_second': len(results) / wall_time if wall_time else 0,
             'errors': [r.get('error') for r in failed_requests if r.get('error')]
         }
         
@@ -229,6 +273,8 @@ class PerformanceTester:
             print(f"Минимальное время: {analysis['min_response_time']:.3f}с")
             print(f"Максимальное время: {analysis['max_response_time']:.3f}с")
             print(f"Медианное время: {analysis['median_response_time']:.3f}с")
+            print(f"p95 / p99 / p99.9: {analysis['p95_response_time']:.3f}с / "
+                  f"{analysis['p99_response_time']:.3f}с / {analysis['p999_response_time']:.3f}с")
             print(f"Запросов в секунду: {analysis['requests_per_second']:.2f}")
             
             if analysis['errors']:
@@ -239,7 +285,8 @@ class PerformanceTester:
         else:
             print("Нет результатов для анализа")
             
-    async def run_all_tests(self):
+    async def run_all_tests(self, rate: float = 5, duration: float = 30, arrival: str = 'poisson', processes: int = 1,
+                            scenario: str = 'production'):
         """Запускает все тесты производительности"""
         print("🚀 ЗАПУСК ТЕСТИРОВАНИЯ ПРОИЗВОДИТЕЛЬНОСТИ 0123.ru")
         print(f"Тестируем сервер: {self.base_url}")
@@ -254,8 +301,11 @@ class PerformanceTester:
             
             # Тест 2: Пропускная способность
             print("\n2️⃣ ТЕСТ ПРОПУСКНОЙ СПОСОБНОСТИ")
-            throughput_results = await self.test_upload_throughput(30, 5)  # 30 сек, 5 запросов/сек
-            self.print_results("Пропускная способность (5 запросов/сек, 30 сек)", throughput_results)
+            throughput_summary = await self.test_upload_throughput(duration, rate, arrival, processes)
+            print(f"\n{'='*60}")
+            print(f"РЕЗУЛЬТАТЫ ТЕСТА: Пропускная способность ({rate} запросов/сек, {duration} сек)")
+            print(f"{'='*60}")
+            print(format_summary(throughput_summary))
             
             # Тест 3: Смешанная нагрузка
             print("\n3️⃣ ТЕСТ СМЕШАННОЙ НАГРУЗКИ")
@@ -267,8 +317,16 @@ class PerformanceTester:
             large_file_results = await self.test_concurrent_uploads(5, 1000)  # 5 файлов по 1MB
             self.print_results("Большие файлы (5 файлов по 1MB)", large_file_results)
             
+            # Тест 5: Реалистичная смесь трафика
+            print("\n5️⃣ ТЕСТ СЦЕНАРИЯ РЕАЛЬНОГО ТРАФИКА")
+            scenario_summary = await self.test_scenario(scenario, duration, rate, arrival, processes)
+            print(f"\n{'='*60}")
+            print(f"РЕЗУЛЬТАТЫ ТЕСТА: Сценарий {scenario} ({rate} запросов/сек, {duration} сек)")
+            print(f"{'='*60}")
+            print(format_summary(scenario_summary))
+            
             # Общий анализ
-            all_results = concurrent_results + throughput_results + mixed_results + large_file_results
+            all_results = concurrent_results + mixed_results + large_file_results
             print("\n📊 ОБЩИЙ АНАЛИЗ")
             self.print_results("Все тесты", all_results)
             
@@ -282,7 +340,8 @@ class PerformanceTester:
                     'base_url': self.base_url,
                     'tests': {
                         'concurrent_uploads': self.analyze_results(concurrent_results),
-                        'throughput': self.analyze_results(throughput_results),
+                        'throughput': throughput_summary,
+                        'scenario': scenario_summary,
                         'mixed_load': self.analyze_results(mixed_results),
                         'large_files': self.analyze_results(large_file_results),
                         'overall': self.analyze_results(all_results)
@@ -311,6 +370,18 @@ class PerformanceTester:
             print(f"   • Процент успеха: {overall['success_rate']:.1f}%")
             print(f"   • Среднее время ответа: {overall['avg_response_time']:.3f}с")
             print(f"   • Запросов в секунду: {overall['requests_per_second']:.1f}")
+            if 'p99_response_time' in overall:
+                print(f"   • p99 время ответа: {overall['p99_response_time']:.3f}с")
+            
+            throughput = data['tests'].get('throughput', {})
+            if 'achieved_rps' in throughput:
+                print(f"   • Открытая нагрузка: {throughput['achieved_rps']:.1f} из {throughput['target_rps']:.1f} rps, "
+                      f"p99 задержки {throughput['latency']['p99']:.3f}с")
+            
+            scenario = data['tests'].get('scenario') or {}
+            for name, endpoint in scenario.get('endpoints', {}).items():
+                print(f"   • {scenario['action']} {name}: p99 {endpoint['latency']['p99']:.3f}с, "
+                      f"ошибок {sum(endpoint['errors'].values())} из {endpoint['count']}")
             
             print(f"\n📈 РЕКОМЕНДАЦИИ:")
             
@@ -346,6 +417,16 @@ async def main():
     parser.add_argument('--url', default='http://localhost:8000', 
                        help='URL сервера для тестирования')
     parser.add_argument('--report', help='Файл с результатами для генерации отчета')
+    parser.add_argument('--rate', type=float, default=5,
+                       help='Загрузок в секунду в тесте пропускной способности')
+    parser.add_argument('--duration', type=float, default=30,
+                       help='Длительность теста пропускной способности (сек)')
+    parser.add_argument('--arrival', default='poisson', choices=['poisson', 'constant'],
+                       help='Модель прибытия запросов')
+    parser.add_argument('--processes', type=int, default=1,
+                       help='Число процессов генератора нагрузки')
+    parser.add_argument('--scenario', default='production',
+                       help=f'Сценарий трафика: {", ".join(sorted(SCENARIOS))} или путь к JSON')
     
     args = parser.parse_args()
     
@@ -356,7 +437,7 @@ async def main():
     else:
         # Запускаем тестирование
         tester = PerformanceTester(args.url)
-        await tester.run_all_tests()
+        await tester.run_all_tests(args.rate, args.duration, args.arrival, args.processes, args.scenario)
 
 if __name__ == "__main__":
     asyncio.run(main())